@@ -9,9 +9,10 @@
 
 import os
 import datetime
-import pandas as pd
+import numpy as np
 
 from xquant import SignalEvent, Strategy, CSVDataHandler, SimulatedExecutionHandler, BasicPortfolio, Backtest
+from xquant.engine.indicator import SMA, without_ties
 
 
 class MovingAverageCrossStrategy(Strategy):
@@ -33,41 +34,29 @@ class MovingAverageCrossStrategy(Strategy):
         self.long_window = long_window
         self.short_window = short_window
 
-        self.bought = self._calculate_initial_bought()  # 或 {s: False for s in self.symbol_list}
-
-    def _calculate_initial_bought(self):
-        """
-        添加symbol的持有情况到字典，初始化为未持有
-        """
-        bought = {}
-        for s in self.symbol_list:
-            bought[s] = False  # 或者'EXIT'
-        return bought
+        # 增量计算的均线，每个时刻对全部symbol更新一次
+        self.ma_l = SMA(len(self.symbol_list), long_window)
+        self.ma_s = SMA(len(self.symbol_list), short_window)
+        self.prev_diff = np.full(len(self.symbol_list), np.nan)
+        self.timeindex = None
+        self.bought = {s: False for s in self.symbol_list}
 
     def calculate_signals(self, event):
         """
         当短期均线（如5日线）上穿长期均线（如10日线），买入；反之，卖出
         """
-        if event.type == 'BAR':
-            for s in self.symbol_list:
-                bar = self.bars.get_latest_bar(s)
-                if bar is None or bar == []: continue
-
-                bars = self.bars.get_latest_bars(s, N=self.long_window)
-                if len(bars) >= self.long_window:
-                    df = pd.DataFrame(bars, columns=['symbol','datetime','open','high','low','close','volume'])
-                    df['MA_l'] = df['close'].rolling(self.long_window, min_periods=1).mean()
-                    df['MA_s'] = df['close'].rolling(self.short_window, min_periods=1).mean()
-                    if df['MA_l'].iloc[-1] < df['MA_s'].iloc[-1] and df['MA_l'].iloc[-2] > df['MA_s'].iloc[-2]:
-                        if not self.bought[s]:
-                            signal = SignalEvent(bar.symbol, bar.datetime, 'LONG')
-                            self.events.put(signal)
-                            self.bought[s] = True
-                    elif df['MA_l'].iloc[-1] < df['MA_s'].iloc[-1] and df['MA_l'].iloc[-2] < df['MA_s'].iloc[-2]:
-                        if self.bought[s]:
-                            signal = SignalEvent(bar.symbol, bar.datetime, 'EXIT')
-                            self.events.put(signal)
-                            self.bought[s] = False
+        if event.type == 'BAR' and event.bar[1] != self.timeindex:
+            self.timeindex = event.bar[1]
+            close = self.bars.get_latest_bar_values('close')
+            diff = without_ties(self.ma_s.update(close) - self.ma_l.update(close), close)
+            for i, s in enumerate(self.symbol_list):
+                if diff[i] > 0 and self.prev_diff[i] < 0 and not self.bought[s]:
+                    self.events.put(SignalEvent(s, self.timeindex, 'LONG'))
+                    self.bought[s] = True
+                elif diff[i] < 0 and self.prev_diff[i] > 0 and self.bought[s]:
+                    self.events.put(SignalEvent(s, self.timeindex, 'EXIT'))
+                    self.bought[s] = False
+            self.prev_diff = diff
 
 
 if __name__ == '__main__':
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""
+测试用的合成行情和回测工具
+ScriptedStrategy在指定的bar放入事先给定的事件（信号、订单、撤单等），用于检查成交、资金和头寸
+
+@author: Leon Zhang
+"""
+
+import datetime
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from xquant import Backtest, BasicPortfolio, CSVDataHandler, SimulatedExecutionHandler, Strategy
+
+START = datetime.datetime(2016, 1, 4)
+
+logging.getLogger('xquant.utils.logger').setLevel(logging.WARNING)
+
+
+def make_bars(close, volume=1e6, spread=0.01, open_=None, high=None, low=None, start=START):
+    """
+    由收盘价生成工作日的OHLCV，默认开盘价为收盘价，最高、最低价为收盘价上下spread
+    """
+    close = np.asarray(close, dtype=float)
+    index = pd.bdate_range(start, periods=len(close))
+    return pd.DataFrame({'open': close if open_ is None else open_,
+                         'high': close * (1 + spread) if high is None else high,
+                         'low': close * (1 - spread) if low is None else low,
+                         'close': close,
+                         'volume': np.broadcast_to(np.asarray(volume, dtype=float), close.shape)},
+                        index=index, columns=['open', 'high', 'low', 'close', 'volume'])
+
+
+def write_csv_dir(path, frames):
+    """
+    将{symbol: DataFrame}写成CSVDataHandler读取的CSV文件，返回目录
+    """
+    path = str(path)
+    for symbol, df in frames.items():
+        df.to_csv(os.path.join(path, '%s.csv' % symbol), index_label='date')
+    return path
+
+
+class ScriptedStrategy(Strategy):
+    """
+    按bar的序号（从0开始，以symbol_list中第一个symbol的bar计数）放入事件
+    script: {序号: 事件的list，或以当前bar为参数返回事件list的函数}
+    """
+    def __init__(self, bars, events, script=None):
+        self.bars = bars
+        self.events = events
+        self.script = script or {}
+        self.count = -1
+
+    def calculate_signals(self, event):
+        if event.bar[0] != self.bars.symbol_list[0]:
+            return
+        self.count += 1
+        entry = self.script.get(self.count, [])
+        for e in (entry(event.bar) if callable(entry) else entry):
+            self.events.put(e)
+
+
+def make_backtest(csv_dir, symbols, script=None, portfolio=BasicPortfolio,
+                  execution=SimulatedExecutionHandler, initial_capital=1.0e5,
+                  commission_type='zero', slippage_type='zero', strategy=ScriptedStrategy, **kwargs):
+    """
+    在csv_dir的全部数据上回测ScriptedStrategy（或strategy），默认无费用、无滑点
+    """
+    params = dict(kwargs)
+    if strategy is ScriptedStrategy:
+        params['script'] = script
+    return Backtest(str(csv_dir), symbols, initial_capital, 0, START, datetime.datetime(2030, 1, 1),
+                    CSVDataHandler, execution, portfolio, strategy,
+                    commission_type=commission_type, slippage_type=slippage_type, **params)
+
+
+def trades_before_close(backtest):
+    """
+    回测的交易记录，不含最后一个bar（强制平仓）的成交
+    """
+    trades = backtest.trade_record()
+    last = backtest.data_handler.datetime_index[-1]
+    return trades[trades.index < last]
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""
+pytalib中原逐元素循环实现的参考版本，用于检验矢量化实现的结果
+与原实现相比只做了两处修正：
+1. ATR：原循环的括号错误（max(high, prev_close - min(...))），改为与其他指标相同的真实波幅
+2. ADX：原循环中第i个bar的动向为第i到第i+1个bar的变化（使用了未来数据），改为同RSI，第一个bar为0
+其余保留原循环，.ilco/.ilic/get_value/.ix等笔误改为.iloc；结果均为默认索引，按位置比较
+
+@author: Leon Zhang
+"""
+
+import pandas as pd
+
+
+def _moves(df):
+    """
+    上升、下降动向，第一个bar为0（原RSI中的循环）
+    """
+    i = 0
+    UpI = [0]
+    DoI = [0]
+    while i + 1 <= len(df) - 1:
+        UpMove = df['high'].iloc[i + 1] - df['high'].iloc[i]
+        DoMove = df['low'].iloc[i] - df['low'].iloc[i + 1]
+        if UpMove > DoMove and UpMove > 0:
+            UpD = UpMove
+        else:
+            UpD = 0
+        UpI.append(UpD)
+        if DoMove > UpMove and DoMove > 0:
+            DoD = DoMove
+        else:
+            DoD = 0
+        DoI.append(DoD)
+        i = i + 1
+    return pd.Series(UpI), pd.Series(DoI)
+
+
+def _true_range(df):
+    i = 0
+    TR_l = [0]
+    while i < len(df) - 1:
+        TR = max(df['high'].iloc[i + 1], df['close'].iloc[i]) - min(df['low'].iloc[i + 1], df['close'].iloc[i])
+        TR_l.append(TR)
+        i = i + 1
+    return pd.Series(TR_l)
+
+
+def ATR(df, n):
+    return _true_range(df).ewm(span=n, min_periods=n).mean()
+
+
+def TRIX(df, n):
+    EX1 = df['close'].ewm(span=n, min_periods=n - 1).mean()
+    EX2 = EX1.ewm(span=n, min_periods=n - 1).mean()
+    EX3 = EX2.ewm(span=n, min_periods=n - 1).mean()
+    i = 0
+    ROC_l = [0]
+    while i + 1 <= len(df) - 1:
+        ROC = (EX3.iloc[i + 1] - EX3.iloc[i]) / EX3.iloc[i]
+        ROC_l.append(ROC)
+        i = i + 1
+    return pd.Series(ROC_l)
+
+
+def ADX(df, n, n_ADX):
+    UpI, DoI = _moves(df)
+    ATR = _true_range(df).ewm(span=n, min_periods=n).mean()
+    PosDI = UpI.ewm(span=n, min_periods=n - 1).mean() / ATR
+    NegDI = DoI.ewm(span=n, min_periods=n - 1).mean() / ATR
+    return (abs(PosDI - NegDI) / (PosDI + NegDI)).ewm(span=n_ADX, min_periods=n_ADX - 1).mean()
+
+
+def Vortex(df, n):
+    i = 0
+    VM = [0]
+    while i < len(df) - 1:
+        Range = abs(df['high'].iloc[i + 1] - df['low'].iloc[i]) - abs(df['low'].iloc[i + 1] - df['high'].iloc[i])
+        VM.append(Range)
+        i = i + 1
+    return pd.Series(VM).rolling(window=n).sum() / _true_range(df).rolling(window=n).sum()
+
+
+def RSI(df, n):
+    UpI, DoI = _moves(df)
+    PosDI = UpI.ewm(span=n, min_periods=n - 1).mean()
+    NegDI = DoI.ewm(span=n, min_periods=n - 1).mean()
+    return PosDI / (PosDI + NegDI)
+
+
+def MFI(df, n):
+    PP = (df['high'] + df['low'] + df['close']) / 3
+    i = 0
+    PosMF = [0]
+    while i < len(df) - 1:
+        if PP.iloc[i + 1] > PP.iloc[i]:
+            PosMF.append(PP.iloc[i + 1] * df['volume'].iloc[i + 1])
+        else:
+            PosMF.append(0)
+        i = i + 1
+    TotMF = (PP * df['volume']).reset_index(drop=True)
+    return (pd.Series(PosMF) / TotMF).rolling(window=n).mean()
+
+
+def OBV(df, n):
+    i = 0
+    OBV = [0]
+    while i < len(df) - 1:
+        if df['close'].iloc[i + 1] - df['close'].iloc[i] > 0:
+            OBV.append(df['volume'].iloc[i + 1])
+        if df['close'].iloc[i + 1] - df['close'].iloc[i] == 0:
+            OBV.append(0)
+        if df['close'].iloc[i + 1] - df['close'].iloc[i] < 0:
+            OBV.append(-df['volume'].iloc[i + 1])
+        i = i + 1
+    return pd.Series(OBV).rolling(window=n).mean()
+
+
+def ULTOSC(df):
+    i = 0
+    BP_l = [0]
+    while i < len(df) - 1:
+        BP = df['close'].iloc[i + 1] - min(df['low'].iloc[i + 1], df['close'].iloc[i])
+        BP_l.append(BP)
+        i = i + 1
+    BP, TR = pd.Series(BP_l), _true_range(df)
+    return (4 * BP.rolling(window=7).sum() / TR.rolling(window=7).sum()) + \
+           (2 * BP.rolling(window=14).sum() / TR.rolling(window=14).sum()) + \
+           (BP.rolling(window=28).sum() / TR.rolling(window=28).sum())
+
+
+def DONCH(df, n):
+    i = 0
+    DC_l = []
+    while i < n - 1:
+        DC_l.append(0)
+        i = i + 1
+    i = 0
+    while i + n - 1 < len(df) - 1:
+        DC = max(df['high'].iloc[i:i + n - 1]) - min(df['low'].iloc[i:i + n - 1])
+        DC_l.append(DC)
+        i = i + 1
+    return pd.Series(DC_l).shift(n - 1)
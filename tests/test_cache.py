@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""
+BacktestCache：键随数据、参数、partial绑定的参数和精度变化，命中时返回与重新回测相同的结果
+"""
+
+import datetime
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from xquant import BacktestCache, BasicPortfolio, SimulatedExecutionHandler, set_precision
+from xquant.engine.strategy import MovingAverageCrossStrategy
+from xquant.utils.precision import get_precision
+
+from backtest_helpers import make_bars, write_csv_dir, make_backtest
+
+
+@pytest.fixture
+def csv_dir(tmp_path):
+    path = tmp_path / 'data'
+    path.mkdir()
+    return write_csv_dir(path, {'600008': make_bars(10 + np.sin(np.arange(40) / 3.0))})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return BacktestCache(str(tmp_path / 'cache'))
+
+
+def make(csv_dir, **kwargs):
+    kwargs.setdefault('short_window', 3)
+    kwargs.setdefault('long_window', 5)
+    return make_backtest(csv_dir, ['600008'], strategy=MovingAverageCrossStrategy, **kwargs)
+
+
+def key(cache, csv_dir, **kwargs):
+    return cache.make_key(make(csv_dir, **kwargs))
+
+
+def test_hit_returns_same_results(csv_dir, cache):
+    first = make(csv_dir, cache=cache, commission_type='default')
+    positions, holdings = first.simulate_trading()
+    assert first.fills > 0
+    second = make(csv_dir, cache=cache, commission_type='default')
+    cached_positions, cached_holdings = second.simulate_trading()
+    assert second.fills == 0  # 没有重新回测
+    pd.testing.assert_frame_equal(holdings, cached_holdings, check_index_type=False)
+    pd.testing.assert_frame_equal(positions, cached_positions, check_index_type=False)
+    pd.testing.assert_frame_equal(first.trade_record(), second.trade_record(), check_index_type=False)
+
+
+def test_same_config_same_key(csv_dir, cache):
+    assert key(cache, csv_dir) == key(cache, csv_dir)
+
+
+def test_key_changes_with_costs_and_params(csv_dir, cache):
+    base = key(cache, csv_dir)
+    assert key(cache, csv_dir, commission_type='default') != base
+    assert key(cache, csv_dir, slippage_type='fixed') != base
+    assert key(cache, csv_dir, initial_capital=2.0e5) != base
+    assert key(cache, csv_dir, long_window=6) != base
+
+
+def test_key_changes_with_partial_arguments(csv_dir, cache):
+    delayed = functools.partial(SimulatedExecutionHandler, fill_delay=datetime.timedelta(0))
+    later = functools.partial(SimulatedExecutionHandler, fill_delay=datetime.timedelta(days=2))
+    keys = {key(cache, csv_dir),
+            key(cache, csv_dir, execution=delayed),
+            key(cache, csv_dir, execution=later),
+            key(cache, csv_dir, portfolio=functools.partial(BasicPortfolio, batch_orders=True))}
+    assert len(keys) == 4
+    assert key(cache, csv_dir, execution=delayed) == \
+        key(cache, csv_dir, execution=functools.partial(SimulatedExecutionHandler, fill_delay=datetime.timedelta(0)))
+
+
+def test_key_changes_with_precision(csv_dir, cache):
+    previous = get_precision()
+    base = key(cache, csv_dir)
+    try:
+        set_precision('compact')
+        compact = key(cache, csv_dir)
+    finally:
+        set_precision(previous)
+    assert compact != base
+
+
+def test_key_changes_with_data(csv_dir, cache):
+    base = key(cache, csv_dir)
+    path = os.path.join(csv_dir, '600008.csv')
+    make_bars(np.linspace(10.0, 12.0, 11)).to_csv(path, index_label='date')
+    assert key(cache, csv_dir) != base
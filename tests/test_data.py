@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+"""
+CSVDataHandler：对齐后的数组按cursor取最新bar，不使用未来数据
+"""
+
+import queue
+
+import numpy as np
+
+from xquant import CSVDataHandler
+
+from backtest_helpers import START, make_bars, write_csv_dir
+
+
+def test_latest_bar_values_before_first_bar(tmp_path):
+    csv_dir = write_csv_dir(tmp_path, {'600008': make_bars([10.0, 11.0, 12.0]),
+                                       '600018': make_bars([5.0, 6.0, 7.0])})
+    bars = CSVDataHandler(queue.Queue(), csv_dir, ['600008', '600018'], START, None)
+    assert np.isnan(bars.get_latest_bar_values('close')).all()
+    bars.update_bars()
+    assert bars.get_latest_bar_values('close').tolist() == [10.0, 5.0]
+    bars.update_bars()
+    assert bars.get_latest_bar_values('close').tolist() == [11.0, 6.0]
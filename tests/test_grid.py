@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+"""
+MovingAverageCrossGrid与事件驱动的Backtest（MovingAverageCrossStrategy）在无费用时的结果一致
+"""
+
+import datetime
+import os
+import queue
+
+import numpy as np
+import pytest
+
+from xquant import Backtest, BasicPortfolio, CSVDataHandler, SimulatedExecutionHandler
+from xquant.engine.grid import MovingAverageCrossGrid
+from xquant.engine.strategy import MovingAverageCrossStrategy
+
+import backtest_helpers  # 关闭回测日志
+
+CSV_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'demo', 'testdata')
+START = datetime.datetime(2015, 1, 1)
+END = datetime.datetime(2015, 12, 31, 23, 59)
+CAPITAL = 1.0e7  # 资金足够大，整手取整的影响可以忽略
+
+
+@pytest.fixture(scope='module')
+def grid_results():
+    bars = CSVDataHandler(queue.Queue(), CSV_DIR, ['600008', '600018'], START, END)
+    return MovingAverageCrossGrid(bars, [3, 5, 8], [10, 15, 20]).to_frame()
+
+
+@pytest.mark.parametrize('symbol', ['600008', '600018'])
+@pytest.mark.parametrize('short_window, long_window', [(5, 10), (3, 15), (8, 20), (3, 10)])
+def test_grid_matches_backtest(grid_results, symbol, short_window, long_window):
+    backtest = Backtest(CSV_DIR, [symbol], CAPITAL, 0, START, END, CSVDataHandler,
+                        SimulatedExecutionHandler, BasicPortfolio, MovingAverageCrossStrategy,
+                        short_window=short_window, long_window=long_window)
+    positions, holdings = backtest.simulate_trading()
+    trades = backtest.trade_record()
+    expected = grid_results.loc[(short_window, long_window, symbol)]
+    assert (trades['quantity'] > 0).sum() == expected['trades']
+    assert holdings['total'].iloc[-1] / CAPITAL - 1 == pytest.approx(expected['return'], abs=1e-4)
+
+
+def test_crossovers_ignore_float_noise():
+    close = np.full((4, 1), 10.0)
+    ma_short = np.array([[9.0], [10.0 + 1e-14], [10.0 - 1e-14], [11.0]])
+    ma_long = np.full((1, 4, 1), 10.0)
+    up, down = MovingAverageCrossGrid.crossovers(ma_short, ma_long, close)
+    # 差值依次为 -1, ~0, ~0, +1：中间视为相等，没有交叉
+    assert not up.any() and not down.any()
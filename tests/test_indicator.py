@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""
+增量指标与pandas的重新计算逐元素比较，超过_Window.RESUM_INTERVAL次更新后仍一致
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from xquant.engine import indicator as ind
+
+N_BARS = 2500  # 超过两次重新求和
+
+
+def make_prices(n=N_BARS, size=3, seed=0):
+    rng = np.random.RandomState(seed)
+    close = 1000 * np.exp(np.cumsum(rng.normal(0, 0.01, (n, size)), axis=0))
+    close[:40, 2] = np.nan  # 尚未上市的symbol
+    high = close * (1 + rng.uniform(0, 0.02, close.shape))
+    low = close * (1 - rng.uniform(0, 0.02, close.shape))
+    return pd.DataFrame(high), pd.DataFrame(low), pd.DataFrame(close)
+
+
+def run(indicator, *columns):
+    """
+    逐bar更新，返回每个bar的指标值，多个输出的指标返回list
+    """
+    values = [indicator.update(*[c.values[t] for c in columns]) for t in range(len(columns[0]))]
+    if isinstance(values[0], tuple):
+        return [pd.DataFrame(np.array([v[i] for v in values])) for i in range(len(values[0]))]
+    return pd.DataFrame(np.array(values))
+
+
+def by_symbol(df, func):
+    """
+    每个symbol去掉nan后计算，再对齐回原来的索引
+    """
+    return pd.concat([func(df[c].dropna()) for c in df.columns], axis=1).reindex(df.index)
+
+
+def true_range(high, low, close):
+    prev = close.shift(1).fillna(close)
+    return np.maximum(high, prev) - np.minimum(low, prev)
+
+
+def assert_close(result, expected):
+    np.testing.assert_allclose(result.values, expected.values, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize('period', [5, 20])
+def test_sma(period):
+    high, low, close = make_prices()
+    assert_close(run(ind.SMA(3, period), close), by_symbol(close, lambda s: s.rolling(period).mean()))
+
+
+def test_ema():
+    high, low, close = make_prices()
+    expected = by_symbol(close, lambda s: s.ewm(span=10).mean().where(np.arange(len(s)) >= 9))
+    assert_close(run(ind.EMA(3, 10), close), expected)
+
+
+def test_std():
+    high, low, close = make_prices()
+    assert_close(run(ind.STD(3, 20), close), by_symbol(close, lambda s: s.rolling(20).std()))
+
+
+def test_atr():
+    high, low, close = make_prices()
+    tr = true_range(high, low, close)
+    expected = by_symbol(tr, lambda s: s.ewm(alpha=1.0 / 14).mean().where(np.arange(len(s)) >= 13))
+    assert_close(run(ind.ATR(3, 14), high, low, close), expected)
+
+
+def test_rsi():
+    high, low, close = make_prices()
+
+    def rsi(s):
+        diff = s.diff().dropna()
+        gain = diff.clip(lower=0).ewm(alpha=1.0 / 14).mean()
+        loss = (-diff).clip(lower=0).ewm(alpha=1.0 / 14).mean()
+        return (100 * gain / (gain + loss)).where(np.arange(len(diff)) >= 13)
+    assert_close(run(ind.RSI(3, 14), close), by_symbol(close, rsi))
+
+
+def test_macd():
+    high, low, close = make_prices()
+    macd, signal, hist = run(ind.MACD(3, 12, 26, 9), close)
+
+    def ema(s, span):
+        return s.ewm(span=span).mean().where(np.arange(len(s)) >= span - 1)
+    expected = by_symbol(close, lambda s: ema(s, 12) - ema(s, 26))
+    assert_close(macd, expected)
+    assert_close(signal, by_symbol(expected, lambda s: ema(s, 9)))
+    assert_close(hist, macd - signal)
+
+
+def test_bollinger():
+    high, low, close = make_prices()
+    middle, upper, lower = run(ind.Bollinger(3, 20, k=2.0), close)
+    std = by_symbol(close, lambda s: s.rolling(20).std())
+    assert_close(middle, by_symbol(close, lambda s: s.rolling(20).mean()))
+    assert_close(upper, middle + 2 * std)
+    assert_close(lower, middle - 2 * std)
+
+
+def test_donchian():
+    high, low, close = make_prices()
+    upper, lower = run(ind.Donchian(3, 20), high, low)
+    assert_close(upper, by_symbol(high, lambda s: s.rolling(20).max()))
+    assert_close(lower, by_symbol(low, lambda s: s.rolling(20).min()))
+
+
+def test_resum_removes_drift():
+    # 量级相差很大的价格交替出现，累加的浮点误差在重新求和后消失
+    prices = np.tile([1e8, 1.0, 3.0], 700)[:, np.newaxis]
+    sma = ind.SMA(1, 3)
+    window = sma.window
+    for t in range(ind._Window.RESUM_INTERVAL):
+        sma.update(prices[t])
+    assert window.sum[0] == np.sum(window.buf[:, 0])
+
+
+def test_without_ties():
+    diff = np.array([1e-15, -1e-15, 1e-3, -1e-3, np.nan])
+    price = np.full(5, 10.0)
+    result = ind.without_ties(diff, price)
+    assert result[:4].tolist() == [0.0, 0.0, 1e-3, -1e-3]
+    assert np.isnan(result[4])
+
+
+def test_equal_moving_averages_are_a_tie():
+    # 常数价格下两条均线相等，增量计算的差值不应被当作交叉
+    prices = np.array([[10.1], [10.3], [10.7]] * 30)
+    short, long_ = ind.SMA(1, 3), ind.SMA(1, 6)
+    for p in prices:
+        diff = ind.without_ties(short.update(p) - long_.update(p), p)
+        if not np.isnan(diff[0]):
+            assert diff[0] == 0.0
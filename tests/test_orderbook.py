@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+限价单和止损单：挂单簿的撮合、成交价、到期、撤单、失效条目的重建和不能成交时的优先级
+"""
+
+import datetime
+import queue
+
+import numpy as np
+
+from xquant import CancelEvent, CSVDataHandler, OrderEvent, SimulatedExecutionHandler
+from xquant.engine import orderbook
+from xquant.engine.orderbook import OrderBook
+
+from backtest_helpers import START, make_bars, write_csv_dir, make_backtest, trades_before_close
+
+
+def dip_bars(n=10, dips=None):
+    """
+    收盘价均为10，dips为{序号: (开盘价, 最低价)}
+    """
+    close = np.full(n, 10.0)
+    open_, low = close.copy(), close * 0.99
+    for i, (o, l) in (dips or {}).items():
+        open_[i], low[i] = o, l
+    return make_bars(close, open_=open_, low=low)
+
+
+def run(tmp_path, script, bars=None, **kwargs):
+    csv_dir = write_csv_dir(tmp_path, {'600008': bars if bars is not None else dip_bars(dips={5: (9.6, 9.5)})})
+    backtest = make_backtest(csv_dir, ['600008'], script, **kwargs)
+    positions, holdings = backtest.simulate_trading()
+    return backtest, positions, holdings, trades_before_close(backtest)
+
+
+def test_buy_limit_fills_at_limit_when_crossed(tmp_path):
+    backtest, positions, holdings, trades = run(
+        tmp_path, {0: [OrderEvent('600008', 'LMT', 1000, 'BUY', price=9.8),
+                       OrderEvent('600008', 'LMT', 1000, 'BUY', price=9.0)]},
+        bars=dip_bars(dips={5: (10.0, 9.5)}))
+    dates = backtest.data_handler.datetime_index
+    assert trades.index.tolist() == [dates[5]]
+    assert trades['fill_price'].tolist() == [9.8]
+    assert positions.loc[dates[6], '600008'] == 1000
+    assert holdings.loc[dates[6], 'cash'] == 1.0e5 - 9800
+
+
+def test_limit_uses_better_open(tmp_path):
+    bars = dip_bars(dips={5: (9.5, 9.4)})
+    backtest, positions, holdings, trades = run(
+        tmp_path, {0: [OrderEvent('600008', 'LMT', 1000, 'BUY', price=9.8)]}, bars=bars)
+    assert trades['fill_price'].tolist() == [9.5]
+
+
+def test_sell_stop_triggers_at_worse_open(tmp_path):
+    script = {0: [OrderEvent('600008', 'MKT', 1000, 'BUY')],
+              1: [OrderEvent('600008', 'STP', 1000, 'SELL', price=9.7)]}
+    backtest, positions, holdings, trades = run(tmp_path, script)
+    dates = backtest.data_handler.datetime_index
+    assert trades['direction'].tolist() == ['BUY', 'SELL']
+    assert trades['fill_price'].tolist() == [10.0, 9.6]
+    assert positions.loc[dates[6], '600008'] == 0
+    assert holdings.loc[dates[6], 'cash'] == 1.0e5 - 400
+
+
+def test_expired_and_cancelled_orders_do_not_fill(tmp_path):
+    expiring = OrderEvent('600008', 'LMT', 1000, 'BUY', price=9.8, expiry=START + datetime.timedelta(days=2))
+    cancelled = OrderEvent('600008', 'LMT', 500, 'BUY', price=9.8)
+    kept = OrderEvent('600008', 'LMT', 300, 'BUY', price=9.8)
+    script = {0: [expiring, cancelled, kept], 3: [CancelEvent(cancelled.order_id)]}
+    backtest, positions, holdings, trades = run(tmp_path, script)
+    assert trades['quantity'].tolist() == [300.0]
+
+
+def test_untradable_order_keeps_priority(tmp_path):
+    # 第3个bar涨停（收盘11 = 10 * 1.1）：第2个bar之后挂的买入限价单被穿越但不能成交，留到第4个bar按原顺序成交
+    close = np.array([10.0, 10.0, 10.0, 11.0, 11.0, 11.0])
+    csv_dir = write_csv_dir(tmp_path, {'600008': make_bars(close)})
+    events = queue.Queue()
+    bars = CSVDataHandler(events, csv_dir, ['600008'], START, None)
+    handler = SimulatedExecutionHandler(bars, events, slippage_type='zero', commission_type='zero',
+                                        tradability=True)
+    expiry = START + datetime.timedelta(days=30)
+    first = OrderEvent('600008', 'LMT', 100, 'BUY', price=10.9, expiry=expiry)
+    second = OrderEvent('600008', 'LMT', 200, 'BUY', price=10.9, expiry=expiry)
+
+    fills = []
+    for t in range(5):
+        bars.update_bars()
+        while not events.empty():
+            event = events.get(False)
+            if event.type == 'BAR':
+                handler.update_bar(event)
+            elif event.type == 'FILL':
+                fills.append((t, event.quantity, event.fill_price))
+        if t == 2:
+            handler.execute_order(first)
+            handler.execute_order(second)
+        if t == 3:
+            assert fills == []
+            assert len(handler.order_book) == 2
+            assert len(handler.order_book.expiries) == 2  # 放回时不重复加入到期堆
+    assert fills == [(4, 100, 10.9), (4, 200, 10.9)]
+
+
+def test_compaction_bounds_heaps():
+    book = OrderBook()
+    expiry = START + datetime.timedelta(days=1)
+    for i in range(5000):
+        order = OrderEvent('600008', 'LMT', 100, 'BUY', price=10.0 - (i % 50) * 0.01, expiry=expiry)
+        book.add(order)
+        book.cancel(order.order_id)
+    symbol_book = book.books['600008']
+    assert len(book) == 0
+    assert len(symbol_book) <= 2 * orderbook.COMPACT_MIN
+    assert len(book.expiries) <= 2 * orderbook.COMPACT_MIN
+    # 成交的订单在到期堆中的条目同样会被清除
+    for i in range(5000):
+        book.add(OrderEvent('600008', 'LMT', 100, 'BUY', price=10.0, expiry=expiry))
+        assert len(book.match('600008', 10.5, 9.5)) == 1
+    assert len(book.expiries) <= 2 * orderbook.COMPACT_MIN + 1
+
+
+def test_restore_keeps_time_priority_and_expiry():
+    book = OrderBook()
+    expiry = START + datetime.timedelta(days=1)
+    first = OrderEvent('600008', 'LMT', 100, 'BUY', price=10.0, expiry=expiry)
+    second = OrderEvent('600008', 'LMT', 100, 'BUY', price=10.0, expiry=expiry)
+    book.add(first)
+    book.add(second)
+    crossed = book.match('600008', 10.5, 9.5)
+    assert crossed == [first, second]
+    for order in reversed(crossed):  # 放回的顺序不影响优先级
+        book.restore(order)
+    assert len(book.expiries) == 2
+    assert book.match('600008', 10.5, 9.5) == [first, second]
+    for order in (first, second):
+        book.restore(order)
+    assert book.expire(expiry + datetime.timedelta(days=1)) == [first, second]
+    assert len(book) == 0
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+pytalib的矢量化实现与原循环实现（pytalib_reference）逐元素比较，
+以及Panel上的计算与逐个symbol计算一致、指标不使用未来数据
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from xquant.utils import pytalib
+
+import pytalib_reference as reference
+
+
+# 指标 -> 参数
+ARGS = {
+    'MA': (10,), 'EMA': (10,), 'MOM': (5,), 'ROC': (5,), 'ATR': (14,), 'BBANDS': (20,), 'PPSR': (),
+    'STOK': (), 'STO': (5,), 'TRIX': (5,), 'ADX': (14, 6), 'MACD': (12, 26), 'MassI': (), 'Vortex': (14,),
+    'KST': (5, 10, 15, 20, 5, 5, 5, 10), 'RSI': (14,), 'TSI': (13, 25), 'ACCDIST': (5,), 'Chaikin': (),
+    'MFI': (14,), 'OBV': (10,), 'FORCE': (5,), 'EOM': (5,), 'CCI': (20,), 'COPP': (10,), 'KELCH': (10,),
+    'ULTOSC': (), 'DONCH': (20,), 'STDDEV': (20,),
+}
+
+LOOP_BASED = ['ATR', 'TRIX', 'ADX', 'Vortex', 'RSI', 'MFI', 'OBV', 'ULTOSC', 'DONCH']
+
+
+def make_bars(n=400, seed=0):
+    rng = np.random.RandomState(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    close[50:53] = close[49]  # 价格不变的bar
+    high = close * (1 + rng.uniform(0, 0.02, n))
+    low = close * (1 - rng.uniform(0, 0.02, n))
+    open_ = low + (high - low) * rng.uniform(0, 1, n)
+    volume = rng.randint(1000, 100000, n).astype(float)
+    index = pd.date_range('2015-01-05', periods=n, freq='B')
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume},
+                        index=index, columns=['open', 'high', 'low', 'close', 'volume'])
+
+
+def first_column(result):
+    if isinstance(result, dict):
+        result = list(result.values())[0]
+    if isinstance(result, pd.DataFrame):
+        result = result.iloc[:, 0]
+    return np.asarray(result, dtype=float)
+
+
+def test_indicator_list():
+    assert sorted(ARGS) == sorted(pytalib.indicators)
+
+
+@pytest.mark.parametrize('name', LOOP_BASED)
+def test_matches_loop(name):
+    df = make_bars()
+    expected = getattr(reference, name)(df, *ARGS[name])
+    result = getattr(pytalib, name)(df, *ARGS[name])
+    assert result.index.equals(df.index)
+    # 原DONCH的循环少一个bar，比较共同的部分
+    n = len(expected)
+    np.testing.assert_allclose(result.values[:n], expected.values, rtol=1e-10, atol=1e-12)
+
+
+@pytest.mark.parametrize('name', sorted(ARGS))
+def test_panel_matches_single(name):
+    frames = {'a': make_bars(seed=1), 'b': make_bars(seed=2)}
+    panel = pytalib.Panel.from_frames(frames)
+    result = getattr(pytalib, name)(panel, *ARGS[name])
+    for symbol, df in frames.items():
+        single = getattr(pytalib, name)(df, *ARGS[name])
+        if isinstance(result, dict):
+            for i, key in enumerate(result):
+                np.testing.assert_allclose(result[key][symbol].values, single.iloc[:, i].values,
+                                           rtol=1e-10, atol=1e-12)
+        else:
+            np.testing.assert_allclose(result[symbol].values, np.asarray(single, dtype=float),
+                                       rtol=1e-10, atol=1e-12)
+
+
+@pytest.mark.parametrize('name', sorted(ARGS))
+def test_no_lookahead(name):
+    df = make_bars()
+    full = first_column(getattr(pytalib, name)(df, *ARGS[name]))
+    for row in (120, 199, 300):
+        truncated = first_column(getattr(pytalib, name)(df.iloc[:row + 1], *ARGS[name]))
+        np.testing.assert_allclose(truncated, full[:row + 1], rtol=1e-10, atol=1e-12)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+BasicPortfolio按目标权重调仓：整手、卖单在前、手续费和预留现金计入可用资金
+"""
+
+import numpy as np
+
+from xquant import RebalanceEvent
+
+from backtest_helpers import make_bars, write_csv_dir, make_backtest, trades_before_close
+
+SYMBOLS = ['600008', '000001']
+
+
+def rebalance_backtest(tmp_path, script, **kwargs):
+    csv_dir = write_csv_dir(tmp_path, {'600008': make_bars(np.linspace(10.0, 12.0, 20)),
+                                       '000001': make_bars(np.linspace(8.0, 6.0, 20))})
+    backtest = make_backtest(csv_dir, SYMBOLS, script, commission_type='default', **kwargs)
+    positions, holdings = backtest.simulate_trading()
+    return backtest, positions, holdings
+
+
+def test_full_weight_keeps_cash_non_negative(tmp_path):
+    script = {0: lambda bar: [RebalanceEvent(bar[1], {'600008': 0.5, '000001': 0.5})],
+              5: lambda bar: [RebalanceEvent(bar[1], {'600008': 1.0})],
+              10: lambda bar: [RebalanceEvent(bar[1], np.array([0.3, 0.7]))]}
+    backtest, positions, holdings = rebalance_backtest(tmp_path, script, initial_capital=1.0e4)
+    assert (holdings['cash'] >= 0).all()
+    trades = trades_before_close(backtest)
+    assert (trades['quantity'] % 100 == 0).all()
+    # 第5个bar全部换成600008：先卖000001再买600008
+    day5 = trades.loc[backtest.data_handler.datetime_index[5]]
+    assert day5['direction'].tolist() == ['SELL', 'BUY']
+    assert day5['symbol'].tolist() == ['000001', '600008']
+    # 资金几乎全部投入，剩余现金不足一手（持仓快照在下一个bar记录）
+    assert holdings['cash'].loc[backtest.data_handler.datetime_index[6]] < 100 * 11.0
+
+
+def test_fees_are_reserved_when_weights_use_all_cash(tmp_path):
+    # 目标头寸恰好用完全部资金，不计手续费则现金为负
+    csv_dir = write_csv_dir(tmp_path, {'600008': make_bars(np.full(10, 10.0)),
+                                       '000001': make_bars(np.full(10, 5.0))})
+    script = {0: lambda bar: [RebalanceEvent(bar[1], {'600008': 0.5, '000001': 0.5})]}
+    backtest = make_backtest(csv_dir, SYMBOLS, script, commission_type='default', initial_capital=1.0e4)
+    positions, holdings = backtest.simulate_trading()
+    trades = trades_before_close(backtest)
+    assert trades['quantity'].sum() < 500 + 1000
+    assert (holdings['cash'] >= 0).all()
+    assert holdings['cash'].iloc[1] < 100 * 10.0 + 100 * 5.0  # 按比例缩减，每个symbol最多少买一手
+
+
+def test_cash_buffer_covers_slippage(tmp_path):
+    script = {0: lambda bar: [RebalanceEvent(bar[1], {'600008': 0.5, '000001': 0.5}, cash_buffer=0.005)]}
+    backtest, positions, holdings = rebalance_backtest(tmp_path, script, initial_capital=1.0e4,
+                                                       slippage_type='fixed')
+    assert (holdings['cash'] >= 0).all()
+    first = holdings.loc[backtest.data_handler.datetime_index[1]]
+    assert first['cash'] < 0.005 * 1.0e4 + 100 * 8.0
+
+
+def test_unpriced_symbols_are_left_unchanged(tmp_path):
+    csv_dir = write_csv_dir(tmp_path, {'600008': make_bars(np.full(10, 10.0)),
+                                       '000001': make_bars(np.full(5, 5.0), start='2016-01-11')})
+    script = {0: lambda bar: [RebalanceEvent(bar[1], {'600008': 0.5, '000001': 0.5})]}
+    backtest = make_backtest(csv_dir, SYMBOLS, script)
+    backtest.simulate_trading()
+    trades = trades_before_close(backtest)
+    assert trades['symbol'].tolist() == ['600008']
+    assert trades['quantity'].tolist() == [5000.0]
+
+
+def test_positions_follow_target_weights(tmp_path):
+    csv_dir = write_csv_dir(tmp_path, {'600008': make_bars(np.full(10, 10.0)),
+                                       '000001': make_bars(np.full(10, 5.0))})
+    script = {0: lambda bar: [RebalanceEvent(bar[1], {'600008': 0.25, '000001': 0.5})],
+              3: lambda bar: [RebalanceEvent(bar[1], np.array([0.5, 0.0]))],
+              6: lambda bar: [RebalanceEvent(bar[1], {'600008': 0.5})]}
+    backtest = make_backtest(csv_dir, SYMBOLS, script)
+    positions, holdings = backtest.simulate_trading()
+    dates = backtest.data_handler.datetime_index
+    assert positions.loc[dates[1], SYMBOLS].tolist() == [2500, 10000]
+    assert holdings.loc[dates[1], 'cash'] == 1.0e5 - 25000 - 50000
+    assert positions.loc[dates[4], SYMBOLS].tolist() == [5000, 0]
+    assert holdings.loc[dates[4], 'cash'] == 1.0e5 - 50000
+    # 第6个bar权重不变，不产生订单
+    assert len(trades_before_close(backtest)) == 4
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+"""
+RiskManager下单前的风险检查：头寸上限、集中度、敞口和现金，只缩减增加风险的订单
+"""
+
+import functools
+
+import numpy as np
+import pytest
+
+from xquant import BasicPortfolio, OrderEvent, SignalEvent
+from xquant.engine.risk import RiskManager
+
+from backtest_helpers import make_bars, write_csv_dir, make_backtest, trades_before_close
+
+SYMBOLS = ['600008', '000001']
+LOTS = np.array([100.0, 100.0])
+
+
+def test_position_and_weight_limits_round_to_lots():
+    positions = np.array([0.0, 0.0])
+    prices = np.array([10.0, 20.0])
+    clipped = RiskManager(max_position=2550).clip([5000, 5000], positions, prices, 1.0e6, LOTS)
+    assert clipped.tolist() == [2500.0, 2500.0]
+    # 1e5 * 0.3 / 20 = 1500股
+    clipped = RiskManager(max_weight=0.3).clip([5000, 5000], positions, prices, 1.0e5, LOTS)
+    assert clipped.tolist() == [3000.0, 1500.0]
+
+
+def test_closing_orders_are_not_limited():
+    positions = np.array([4000.0, -1000.0])
+    prices = np.array([10.0, 20.0])
+    risk = RiskManager(max_position=1000, max_gross=0.1)
+    assert risk.clip([-4000, 1000], positions, prices, 1.0e4, LOTS).tolist() == [-4000.0, 1000.0]
+    # 反手时只平仓部分不受限制，开仓部分受max_position限制
+    assert risk.clip([-6000, 0], positions, [10.0, 0.0], 1.0e6, LOTS).tolist() == [-5000.0, 0.0]
+
+
+def test_gross_and_cash_limits_scale_buys():
+    positions = np.array([0.0, 0.0])
+    prices = np.array([10.0, 10.0])
+    clipped = RiskManager(max_gross=0.5, check_cash=False).clip([4000, 4000], positions, prices,
+                                                                 1.0e5, LOTS)
+    assert clipped.tolist() == [2500.0, 2500.0]
+    clipped = RiskManager().clip([8000, 8000], positions, prices, 1.0e5, LOTS)
+    assert clipped.tolist() == [5000.0, 5000.0]
+    # 卖出所得计入可用现金
+    clipped = RiskManager().clip([8000, -2000], np.array([0.0, 2000.0]), prices, 6.0e4, LOTS)
+    assert clipped.tolist() == [8000.0, -2000.0]
+
+
+def test_check_keeps_limit_price_and_drops_market_order():
+    orders = [OrderEvent('600008', 'LMT', 1000, 'BUY', price=9.0),
+              OrderEvent('600008', 'MKT', 300, 'BUY')]
+    checked = RiskManager(max_position=500).check(orders, {'600008': 0, '000001': 1},
+                                                  np.zeros(2), [10.0, 10.0], 1.0e6, LOTS)
+    assert [(o.order_type, o.quantity, o.price) for o in checked] == [('LMT', 500, 9.0)]
+
+
+def test_check_merges_market_orders_and_leaves_others():
+    orders = [OrderEvent('600008', 'MKT', 600, 'BUY'),
+              OrderEvent('600008', 'MKT', 600, 'BUY'),
+              OrderEvent('000001', 'MKT', 700, 'BUY')]
+    checked = RiskManager(max_position=1000).check(orders, {'600008': 0, '000001': 1},
+                                                   np.zeros(2), [10.0, 10.0], 1.0e6, LOTS)
+    assert [(o.symbol, o.quantity, o.direction) for o in checked] == [('600008', 1000, 'BUY'),
+                                                                      ('000001', 700, 'BUY')]
+    assert checked[1] is orders[2]
+
+
+def risk_backtest(tmp_path, script, risk_manager):
+    csv_dir = write_csv_dir(tmp_path, {s: make_bars(np.full(10, 10.0)) for s in SYMBOLS})
+    portfolio = functools.partial(BasicPortfolio, risk_manager=risk_manager)
+    backtest = make_backtest(csv_dir, SYMBOLS, script, portfolio=portfolio)
+    positions, holdings = backtest.simulate_trading()
+    return backtest, positions, holdings
+
+
+def signals(signal_type, strength):
+    return lambda bar: [SignalEvent(s, bar[1], signal_type, strength=strength) for s in SYMBOLS]
+
+
+def test_backtest_fills_clipped_to_max_weight(tmp_path):
+    # 每个symbol目标5000股，max_weight限制为 1e5 * 0.3 / 10 = 3000股
+    backtest, positions, holdings = risk_backtest(tmp_path, {0: signals('LONG', 0.5)},
+                                                  RiskManager(max_weight=0.3))
+    trades = trades_before_close(backtest)
+    assert trades['quantity'].tolist() == [3000.0, 3000.0]
+    dates = backtest.data_handler.datetime_index
+    assert positions.loc[dates[1], SYMBOLS].tolist() == [3000, 3000]
+    assert holdings.loc[dates[1], 'cash'] == pytest.approx(4.0e4)
+
+
+def test_backtest_buys_scaled_to_cash(tmp_path):
+    backtest, positions, holdings = risk_backtest(tmp_path, {0: signals('LONG', 1.0)}, RiskManager())
+    trades = trades_before_close(backtest)
+    assert trades['quantity'].tolist() == [5000.0, 5000.0]
+    assert (holdings['cash'] >= 0).all()
+    dates = backtest.data_handler.datetime_index
+    assert positions.loc[dates[1], SYMBOLS].tolist() == [5000, 5000]
+    assert holdings.loc[dates[1], 'cash'] == pytest.approx(0.0)
+
+
+def test_backtest_exit_is_not_clipped(tmp_path):
+    script = {0: signals('LONG', 0.5), 3: signals('EXIT', 1.0)}
+    backtest, positions, holdings = risk_backtest(tmp_path, script, RiskManager(max_position=1000))
+    trades = trades_before_close(backtest)
+    assert trades['direction'].tolist() == ['BUY', 'BUY', 'SELL', 'SELL']
+    assert trades['quantity'].tolist() == [1000.0] * 4
+    dates = backtest.data_handler.datetime_index
+    assert positions.loc[dates[4], SYMBOLS].tolist() == [0, 0]
+    assert holdings.loc[dates[4], 'cash'] == pytest.approx(1.0e5)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+"""
+Screener：振荡指标按0到100计，阈值超出范围时报错
+"""
+
+import numpy as np
+import pytest
+
+from xquant import Screener
+
+from backtest_helpers import make_bars, write_csv_dir
+
+
+@pytest.fixture
+def csv_dir(tmp_path):
+    rng = np.random.RandomState(0)
+    noise = rng.normal(0, 0.002, 120)
+    return write_csv_dir(tmp_path, {'600008': make_bars(10 * np.exp(np.cumsum(0.01 + noise))),
+                                    '600018': make_bars(10 * np.exp(np.cumsum(-0.01 + noise))),
+                                    '000001': make_bars(10 + 0.1 * np.sin(np.arange(120)))})
+
+
+def test_rsi_on_percent_scale(csv_dir):
+    screener = Screener(csv_dir)
+    table = screener.evaluate('RSI_14 < 30')
+    rsi = table['RSI_14']
+    assert ((rsi >= 0) & (rsi <= 100)).all()
+    assert rsi['600008'] > 70 and rsi['600018'] < 30
+    assert screener.screen('RSI_14 < 30') == ['600018']
+    assert screener.screen('RSI_14 > 70 & MA_5 > MA_20') == ['600008']
+
+
+def test_threshold_outside_range_is_rejected(csv_dir):
+    screener = Screener(csv_dir)
+    with pytest.raises(ValueError):
+        screener.screen('RSI_14 > 130')
+    with pytest.raises(ValueError):
+        screener.screen('-5 < STO_5')
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""
+成交量滑点模型：按bar成交量限制成交数量，部分成交按手取整，未成交部分留到之后的bar
+"""
+
+import numpy as np
+import pytest
+
+from xquant import OrderEvent
+from xquant.engine.slippage import VolumeShareSlippage
+
+from backtest_helpers import make_bars, write_csv_dir, make_backtest, trades_before_close
+
+
+def test_fits_capacity_fills_odd_lot():
+    model = VolumeShareSlippage()
+    prices, filled = model.get_trade_prices([10.0], [150.0], [1e9], np.array(['SELL']), lots=[100])
+    assert filled.tolist() == [150.0]
+
+
+def test_partial_fill_rounds_down_to_lots():
+    model = VolumeShareSlippage(volume_limit=0.025)
+    # 可成交量 4800 * 0.025 = 120，部分成交取整到100
+    prices, filled = model.get_trade_prices([10.0], [150.0], [4800.0], np.array(['BUY']), lots=[100])
+    assert filled.tolist() == [100.0]
+    assert prices[0] > 10.0
+
+
+def test_same_symbol_orders_share_capacity():
+    model = VolumeShareSlippage(volume_limit=0.025)
+    prices, filled = model.get_trade_prices([10.0, 10.0], [300.0, 300.0], [16000.0, 16000.0],
+                                            np.array(['BUY', 'BUY']), groups=[0, 0], lots=[100, 100])
+    assert filled.tolist() == [300.0, 100.0]
+
+
+def test_backtest_carries_remainder_and_fills_odd_lot(tmp_path):
+    # 每个bar最多成交 4000 * 0.025 = 100股
+    volume = np.full(10, 4000.0)
+    volume[:2] = 1e9
+    csv_dir = write_csv_dir(tmp_path, {'600008': make_bars(np.full(10, 10.0), volume=volume)})
+    script = {0: [OrderEvent('600008', 'MKT', 1000, 'BUY')],
+              2: [OrderEvent('600008', 'MKT', 250, 'SELL')]}
+    backtest = make_backtest(csv_dir, ['600008'], script, slippage_type='volume')
+    backtest.simulate_trading()
+
+    trades = trades_before_close(backtest)
+    assert trades['direction'].tolist() == ['BUY', 'SELL', 'SELL', 'SELL']
+    # 250股卖单：100、100，最后50股零股一次成交，不再留在pending_orders中
+    assert trades['quantity'].tolist() == [1000.0, 100.0, 100.0, 50.0]
+    assert list(trades.index[1:]) == list(backtest.data_handler.datetime_index[2:5])
+    assert backtest.portfolio.current_positions['600008'] == 0
+
+
+def test_backtest_cash_reflects_price_impact(tmp_path):
+    volume = np.full(8, 8000.0)  # 每个bar最多成交200股
+    csv_dir = write_csv_dir(tmp_path, {'600008': make_bars(np.full(8, 10.0), volume=volume)})
+    script = {0: [OrderEvent('600008', 'MKT', 500, 'BUY')]}
+    backtest = make_backtest(csv_dir, ['600008'], script, slippage_type='volume')
+    positions, holdings = backtest.simulate_trading()
+
+    trades = trades_before_close(backtest)
+    assert trades['quantity'].tolist() == [200.0, 200.0, 100.0]
+    # 价格冲击 0.1 * (成交量占比)^2，买入向上
+    share = trades['quantity'].values / 8000.0
+    np.testing.assert_allclose(trades['fill_price'].values, 10.0 * (1 + 0.1 * share ** 2))
+    dates = backtest.data_handler.datetime_index
+    assert positions.loc[dates[3], '600008'] == 500
+    assert holdings.loc[dates[3], 'cash'] == pytest.approx(1.0e5 - np.dot(trades['quantity'], trades['fill_price']))
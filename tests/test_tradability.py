@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""
+A股交易限制：停牌、涨跌停（含科创板、创业板的板块规则，分钟线按日取前收盘价）和T+1
+"""
+
+import functools
+import queue
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from xquant import CSVDataHandler, OrderEvent, SimulatedExecutionHandler
+from xquant.engine.tradability import TradabilityMask
+
+from backtest_helpers import START, make_bars, write_csv_dir, make_backtest, trades_before_close
+
+
+def make_mask(tmp_path, frames, start=START):
+    csv_dir = write_csv_dir(tmp_path, frames)
+    bars = CSVDataHandler(queue.Queue(), csv_dir, list(frames), start, None)
+    return TradabilityMask(bars)
+
+
+def test_main_board_limits(tmp_path):
+    mask = make_mask(tmp_path, {'600008': make_bars([10.0, 11.0, 11.5, 10.35, 10.0])})
+    assert mask.limit_up[:, 0].tolist() == [False, True, False, False, False]
+    assert mask.limit_down[:, 0].tolist() == [False, False, False, True, False]
+    assert mask.can_buy[:, 0].tolist() == [True, False, True, True, True]
+    assert mask.can_sell[:, 0].tolist() == [True, True, True, False, True]
+
+
+def test_star_board_limit_is_twenty_percent(tmp_path):
+    mask = make_mask(tmp_path, {'688001': make_bars([10.0, 11.0, 13.2, 10.56])})
+    assert mask.limit_up[:, 0].tolist() == [False, False, True, False]
+    assert mask.limit_down[:, 0].tolist() == [False, False, False, True]
+
+
+def test_chinext_limit_changes_on_2020_08_24(tmp_path):
+    start = pd.Timestamp('2020-08-20')
+    # 08-21涨10%为涨停，08-24起涨跌幅为20%，涨10%不再涨停，08-25涨20%涨停
+    mask = make_mask(tmp_path, {'300001': make_bars([10.0, 11.0, 12.1, 14.52], start=start)}, start)
+    assert mask.limit_up[:, 0].tolist() == [False, True, False, True]
+
+
+def test_missing_bar_and_zero_volume_are_suspended(tmp_path):
+    full = make_bars(np.full(5, 10.0))
+    gap = make_bars(np.full(5, 10.0), volume=[1e6, 1e6, 0.0, 1e6, 1e6]).drop(full.index[3])
+    mask = make_mask(tmp_path, {'600008': full, '000001': gap})
+    assert mask.suspended[:, 0].tolist() == [False] * 5
+    assert mask.suspended[:, 1].tolist() == [False, False, True, True, False]
+    assert not mask.can_buy[3, 1] and not mask.can_sell[3, 1]
+
+
+def test_minute_bars_use_previous_day_close(tmp_path):
+    index = pd.DatetimeIndex(['2016-01-04 09:31', '2016-01-04 09:32', '2016-01-04 15:00',
+                              '2016-01-05 09:31', '2016-01-05 09:32', '2016-01-05 15:00'])
+    bars = make_bars([10.0, 12.0, 10.0, 10.5, 11.0, 10.8])
+    bars.index = index
+    mask = make_mask(tmp_path, {'600008': bars})
+    # 第一天没有前收盘价，不检查；第二天的涨停价为前一天最后一个bar的收盘价10 * 1.1
+    assert mask.limit_up[:, 0].tolist() == [False, False, False, False, True, False]
+
+
+def tradability_backtest(tmp_path, close, script):
+    csv_dir = write_csv_dir(tmp_path, {'600008': make_bars(close)})
+    execution = functools.partial(SimulatedExecutionHandler, tradability=True)
+    backtest = make_backtest(csv_dir, ['600008'], script, execution=execution)
+    positions, holdings = backtest.simulate_trading()
+    return backtest, positions, holdings
+
+
+def test_same_day_sell_is_rejected(tmp_path):
+    buy = OrderEvent('600008', 'MKT', 1000, 'BUY')
+    same_day = OrderEvent('600008', 'MKT', 1000, 'SELL')
+    next_day = OrderEvent('600008', 'MKT', 400, 'SELL')
+    script = {0: [buy, same_day], 1: [next_day]}
+    backtest, positions, holdings = tradability_backtest(tmp_path, np.full(5, 10.0), script)
+
+    assert backtest.execution_handler.rejected_orders == [same_day]
+    trades = trades_before_close(backtest)
+    assert list(zip(trades['direction'], trades['quantity'])) == [('BUY', 1000.0), ('SELL', 400.0)]
+    dates = backtest.data_handler.datetime_index
+    assert positions.loc[dates[1], '600008'] == 1000
+    assert positions.loc[dates[2], '600008'] == 600
+    assert holdings.loc[dates[2], 'cash'] == pytest.approx(1.0e5 - 600 * 10.0)
+
+
+def test_limit_up_buy_and_limit_down_sell_are_rejected(tmp_path):
+    close = np.array([10.0, 10.0, 11.0, 11.0, 9.9, 9.9, 9.9])
+    limit_up_buy = OrderEvent('600008', 'MKT', 500, 'BUY')
+    limit_down_sell = OrderEvent('600008', 'MKT', 300, 'SELL')
+    script = {0: [OrderEvent('600008', 'MKT', 300, 'BUY')],
+              2: [limit_up_buy],
+              4: [limit_down_sell],
+              5: [OrderEvent('600008', 'MKT', 300, 'SELL')]}
+    backtest, positions, holdings = tradability_backtest(tmp_path, close, script)
+
+    assert backtest.execution_handler.rejected_orders == [limit_up_buy, limit_down_sell]
+    trades = trades_before_close(backtest)
+    assert list(zip(trades['direction'], trades['quantity'], trades['fill_price'])) == \
+        [('BUY', 300.0, 10.0), ('SELL', 300.0, 9.9)]
+    dates = backtest.data_handler.datetime_index
+    assert positions.loc[dates[3], '600008'] == 300
+    assert holdings.loc[dates[3], 'cash'] == pytest.approx(1.0e5 - 3000.0)
+    assert positions.loc[dates[6], '600008'] == 0
+    assert holdings.loc[dates[6], 'cash'] == pytest.approx(1.0e5 - 3000.0 + 2970.0)
@@ -2,12 +2,17 @@
 
 from . import engine
 
-from .engine.event import SignalEvent
+from .engine.event import SignalEvent, RebalanceEvent, OrderEvent, CancelEvent
 from .engine.data import *
 from .engine.strategy import Strategy
 from .engine.portfolio import BasicPortfolio
+from .engine.risk import RiskManager
 from .engine.execution import SimulatedExecutionHandler
 from .engine.backtest import Backtest
+from .engine.sweep import ParameterSweep
+from .engine.cache import BacktestCache, IndicatorCache
+from .engine.screener import Screener
+from .utils.precision import set_precision
 
 
 __version__ = '0.5.1'
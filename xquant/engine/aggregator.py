@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+"""
+OrderAggregator 同一时刻订单的轧差
+同一账户中多个strategy_id或重复的信号对同一symbol产生的市价单合并为一个净订单，
+方向相反的订单互相抵消，完全抵消的不再发出，避免重复的最低佣金和成交记录
+
+@author: Leon Zhang
+"""
+
+from collections import OrderedDict
+
+from .event import OrderEvent
+
+
+class OrderAggregator(object):
+    """
+    收集一个时刻的订单，在该时刻结束时按symbol轧差
+    限价单和止损单有各自的价格，不参与轧差，原样发出
+    """
+    def __init__(self):
+        self.orders = []
+
+    def __len__(self):
+        return len(self.orders)
+
+    def add(self, order):
+        """
+        加入一个OrderEvent
+        """
+        self.orders.append(order)
+
+    def net(self):
+        """
+        返回轧差后的订单list并清空，卖单在前、买单在后，其后为限价单和止损单
+        只有一个订单的symbol原样返回（保留order_id），多个订单合并为新的OrderEvent
+        """
+        groups = OrderedDict()
+        others = []
+        for order in self.orders:
+            if order.order_type == 'MKT':
+                groups.setdefault(order.symbol, []).append(order)
+            else:
+                others.append(order)
+        self.orders = []
+
+        sells, buys = [], []
+        for symbol, orders in groups.items():
+            if len(orders) == 1:
+                order = orders[0]
+                if order.quantity == 0:
+                    continue
+            else:
+                quantity = sum(o.quantity if o.direction == 'BUY' else -o.quantity for o in orders)
+                if quantity == 0:
+                    continue
+                order = OrderEvent(symbol, 'MKT', abs(quantity), 'BUY' if quantity > 0 else 'SELL')
+            (buys if order.direction == 'BUY' else sells).append(order)
+        return sells + buys + others
@@ -8,17 +8,54 @@
 """
 
 import datetime
+import os
 import time
-import pandas as pd
+from collections import OrderedDict
 try:
     import queue
 except ImportError:
     import Queue as queue
 from ..utils.logger import setup_logger
 from .event import SignalEvent
+from .data import DataHandler
+from .sink import NpySink, to_frame
+from .scheduler import Scheduler
 
 logger = setup_logger()
 
+SHARED_ACCOUNT = 'shared'  # 共用账户时唯一的strategy_id
+
+
+class StrategyContext(object):
+    """
+    单个策略实例（或共用一个账户的一组策略）的运行环境
+    每个策略拥有独立的事件队列、组合（Portfolio）和模拟交易所，共享同一个DataHandler
+    """
+    def __init__(self, strategy_id, strategy, portfolio, execution_handler, events, scheduler=None):
+        """
+        参数：
+        strategy_id: 策略的独特id，与SignalEvent中的strategy_id含义一致
+        strategy: Strategy对象，共用账户时为Strategy对象的list，依次处理每个bar
+        portfolio: Portfolio对象
+        execution_handler: ExecutionHandler对象
+        events: 该策略独立的Event队列
+        scheduler: 该策略的Scheduler，默认新建，并设置为strategy、portfolio和execution_handler的scheduler属性
+        """
+        self.strategy_id = strategy_id
+        self.strategies = list(strategy) if isinstance(strategy, (list, tuple)) else [strategy]
+        self.strategy = self.strategies[0]
+        self.portfolio = portfolio
+        self.execution_handler = execution_handler
+        self.events = events
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        for component in self.strategies + [portfolio, execution_handler]:
+            component.scheduler = self.scheduler
+
+        self.signals = 0
+        self.orders = 0
+        self.fills = 0
+        self.timeindex = None
+
 
 class Backtest(object):
     """
@@ -28,7 +65,7 @@ class Backtest(object):
                  heartbeat, start_date, end_date, data_handler,
                  execution_handler, portfolio, strategy,
                  commission_type='zero', slippage_type='zero',
-                 **params):
+                 cache=None, result_dir=None, indicator_cache=None, shared_account=False, **params):
         """
         初始化回测
         csv_dir: CSV数据文件夹目录
@@ -38,13 +75,21 @@ class Backtest(object):
         start_date: 策略回测起始时间
         end_date: 策略回测结束时间
         end_date: 策略回测结束时间
-        data_handler: (Class) 处理市场数据的类
+        data_handler: (Class) 处理市场数据的类，或已加载数据的DataHandler对象（reset后复用，不重新读取数据）
         execution_handler: (Class) 处理order/fill的类
         portfolio: (Class) 虚拟账户，追踪组合头寸等信息的类
-        strategy: (Class) 根据市场数据生成信号的策略类
+        strategy: (Class) 根据市场数据生成信号的策略类，多策略时可以是：
+                  [Class或(Class, params)]的list，strategy_id依次为1, 2, ...
+                  或{strategy_id: Class或(Class, params)}的字典
         commission_type: 交易费率模型
         slippage_type: 滑点模型
-        params: 策略参数的字典
+        cache: BacktestCache对象，相同配置的回测直接读取缓存结果，默认不缓存
+        result_dir: 回测记录分批写入的目录（每个策略一个子目录），默认全部保存在内存中；
+                    设置后simulate_trading返回BacktestResult，记录在访问时才从磁盘读取，且不使用cache
+        indicator_cache: IndicatorCache对象，bars.indicator()声明的指标在多次回测间复用，默认不缓存
+        shared_account: True则所有策略共用一个组合和模拟交易所（同一账户），结果只有一个，strategy_id为SHARED_ACCOUNT；
+                        配合net_orders，不同策略同一时刻对同一symbol的订单在账户中轧差
+        params: 策略参数的字典，多策略时作为各策略的默认参数
         """
         self.csv_dir = csv_dir
         self.symbol_list = symbol_list
@@ -60,10 +105,16 @@ class Backtest(object):
 
         self.commission_type = commission_type
         self.slippage_type = slippage_type
+        self.cache = cache
+        self._cached_results = None
+        self.result_dir = result_dir
+        self.indicator_cache = indicator_cache
+        self.shared_account = shared_account
 
         self.events = queue.Queue()
 
         self.params = params
+        self.strategy_specs = self._parse_strategies(strategy, params)
 
         self.signals = 0
         self.orders = 0
@@ -71,18 +122,76 @@ class Backtest(object):
 
         self._generate_trading_instances()
 
+    @staticmethod
+    def _parse_strategies(strategy, params):
+        """
+        将strategy参数统一为{strategy_id: (Class, params)}的有序字典
+        """
+        if isinstance(strategy, dict):
+            items = list(strategy.items())
+        elif isinstance(strategy, (list, tuple)):
+            items = list(enumerate(strategy, 1))
+        else:
+            items = [(1, strategy)]
+
+        specs = OrderedDict()
+        for strategy_id, spec in items:
+            if isinstance(spec, tuple):
+                strategy_cls, strategy_params = spec
+            else:
+                strategy_cls, strategy_params = spec, {}
+            merged = dict(params)
+            merged.update(strategy_params)
+            specs[strategy_id] = (strategy_cls, merged)
+        return specs
+
     def _generate_trading_instances(self):
         """
-        实例化类，得到data_handler(bars),strategy,portfolio(port),execution_handler(broker)对象
+        实例化类，得到data_handler(bars)，以及每个策略的strategy,portfolio(port),execution_handler(broker)对象
+        所有策略共享同一个data_handler，数据的读取、对齐和事件生成只进行一次
+        """
+        if isinstance(self.data_handler_cls, DataHandler):
+            self.data_handler = self.data_handler_cls
+            self.data_handler.reset(self.events)
+        else:
+            self.data_handler = self.data_handler_cls(self.events, self.csv_dir, self.symbol_list,
+                                                      self.start_date, self.end_date)
+        if self.indicator_cache is not None:
+            self.data_handler.indicator_cache = self.indicator_cache
+        self.contexts = OrderedDict()
+        if self.shared_account:
+            # 所有策略的信号进入同一个队列，由同一个组合下单
+            events = queue.Queue()
+            strategies = [strategy_cls(self.data_handler, events, **params)
+                          for strategy_cls, params in self.strategy_specs.values()]
+            self.contexts[SHARED_ACCOUNT] = self._make_context(SHARED_ACCOUNT, strategies, events)
+        else:
+            for strategy_id, (strategy_cls, params) in self.strategy_specs.items():
+                events = queue.Queue()
+                strategy = strategy_cls(self.data_handler, events, **params)
+                self.contexts[strategy_id] = self._make_context(strategy_id, strategy, events)
+
+        # 单策略时的兼容接口，指向第一个策略
+        context = list(self.contexts.values())[0]
+        self.strategy = context.strategy
+        self.portfolio = context.portfolio
+        self.execution_handler = context.execution_handler
+
+    def _make_context(self, strategy_id, strategy, events):
+        """
+        为策略（或共用账户的一组策略）创建组合和模拟交易所
         """
-        self.data_handler = self.data_handler_cls(self.events, self.csv_dir, self.symbol_list,
-                                                  self.start_date, self.end_date)
-        self.strategy = self.strategy_cls(self.data_handler, self.events, **self.params)
-        self.portfolio = self.portfolio_cls(self.data_handler, self.events, self.start_date,
-                                            self.initial_capital)
-        self.execution_handler = self.execution_handler_cls(self.data_handler, self.events,
-                                                            slippage_type=self.slippage_type,
-                                                            commission_type=self.commission_type)
+        if self.result_dir is None:
+            portfolio = self.portfolio_cls(self.data_handler, events, self.start_date,
+                                           self.initial_capital)
+        else:
+            sink = NpySink(os.path.join(self.result_dir, str(strategy_id)))
+            portfolio = self.portfolio_cls(self.data_handler, events, self.start_date,
+                                           self.initial_capital, sink=sink)
+        execution_handler = self.execution_handler_cls(self.data_handler, events,
+                                                       slippage_type=self.slippage_type,
+                                                       commission_type=self.commission_type)
+        return StrategyContext(strategy_id, strategy, portfolio, execution_handler, events)
 
     def _run_backtest(self):
         """
@@ -96,7 +205,13 @@ class Backtest(object):
             else:
                 break
 
-            # 处理events
+            # 执行已到期的定时事件（延迟成交、定时器、收盘回调），其产生的事件先于新的bar处理
+            if bars.continue_backtest:
+                now = bars.get_latest_bar_datetime(self.symbol_list[0])
+                for context in self.contexts.values():
+                    context.scheduler.run_due(now)
+
+            # 将市场数据事件分发给各个策略
             while True:
                 try:
                     event = self.events.get(False)
@@ -107,39 +222,92 @@ class Backtest(object):
                         if event.type == 'BAR':  # or event.type == 'TICK'
                             logger.debug(' '.join([event.bar[0], event.bar[1].strftime("%Y-%m-%d %H:%M:%S"),
                                                    str(event.bar[5])]))
+                        for context in self.contexts.values():
+                            context.events.put(event)
 
-                            self.strategy.calculate_signals(event)
-                            self.portfolio.update_timeindex()
-
-                        elif event.type == 'SIGNAL':
-                            logger.info(' '.join(['Create Signal:', event.datetime.strftime("%Y-%m-%d %H:%M:%S"),
-                                                  event.symbol, event.signal_type]))
-                            self.signals += 1
-                            self.portfolio.update_signal(event)
-                        elif event.type == 'ORDER':
-                            self.orders += 1
-                            self.execution_handler.execute_order(event)
-                        elif event.type == 'FILL':
-                            self.fills += 1
-                            self.portfolio.update_fill(event)
+            for context in self.contexts.values():
+                self._process_events(context)
             # time.sleep(self.heartbeat)
 
+    def _process_events(self, context):
+        """
+        处理单个策略在当前时刻的events，然后发出并批量执行该时刻积累的订单
+        """
+        self._drain_events(context)
+        context.portfolio.flush_orders()
+        self._drain_events(context)
+        context.execution_handler.execute_pending()
+        self._drain_events(context)
+
+    def _drain_events(self, context):
+        """
+        处理单个策略的events，直到其队列为空
+        """
+        while True:
+            try:
+                event = context.events.get(False)
+            except queue.Empty:
+                break
+            else:
+                if event is not None:
+                    if event.type == 'BAR':  # or event.type == 'TICK'
+                        context.execution_handler.update_bar(event)
+                        for strategy in context.strategies:
+                            strategy.calculate_signals(event)
+                        # 同一时刻的各品种bar只需记录一次持仓快照
+                        if event.bar[1] != context.timeindex:
+                            context.timeindex = event.bar[1]
+                            context.portfolio.update_timeindex()
+
+                    elif event.type == 'SIGNAL':
+                        logger.info(' '.join(['Create Signal:', event.datetime.strftime("%Y-%m-%d %H:%M:%S"),
+                                              event.symbol, event.signal_type]))
+                        self.signals += 1
+                        context.signals += 1
+                        context.portfolio.update_signal(event)
+                    elif event.type == 'REBALANCE':
+                        logger.info(' '.join(['Rebalance:', event.datetime.strftime("%Y-%m-%d %H:%M:%S")]))
+                        self.signals += 1
+                        context.signals += 1
+                        context.portfolio.update_rebalance(event)
+                    elif event.type == 'ORDER':
+                        self.orders += 1
+                        context.orders += 1
+                        context.execution_handler.execute_order(event)
+                    elif event.type == 'ORDER_BATCH':
+                        self.orders += len(event)
+                        context.orders += len(event)
+                        context.execution_handler.execute_batch(event)
+                    elif event.type == 'FILL':
+                        self.fills += 1
+                        context.fills += 1
+                        context.portfolio.update_fill(event)
+                    elif event.type == 'FILL_BATCH':
+                        self.fills += len(event)
+                        context.fills += len(event)
+                        context.portfolio.update_fill_batch(event)
+                    elif event.type == 'CANCEL':
+                        context.execution_handler.cancel_order(event.order_id)
+
     def _force_clear(self):
         """
-        回测结束，确保强制平仓
-        """
-        for s in self.symbol_list:
-            self.portfolio.update_signal(SignalEvent(s, self.portfolio.current_datetime, 'EXIT'))
-            event = self.events.get()
-            if event is not None:
-                assert event.type == 'ORDER'
-                self.execution_handler.execute_order(event)
-                event = self.events.get()
-                assert event.type == 'FILL'
-                self.portfolio.update_fill(event)
-                self.portfolio.update_timeindex()
-                logger.info(' '.join(['Force Clear:', self.portfolio.current_datetime.strftime("%Y-%m-%d %H:%M:%S"),
+        回测结束，执行最后的收盘回调，撤销未成交订单和未到期的定时事件，确保每个策略强制平仓
+        """
+        for context in self.contexts.values():
+            portfolio = context.portfolio
+            context.scheduler.close()
+            self._drain_events(context)
+            context.execution_handler.cancel_all()
+            for s in self.symbol_list:
+                portfolio.update_signal(SignalEvent(s, portfolio.current_datetime, 'EXIT',
+                                                    strategy_id=context.strategy_id))
+                logger.info(' '.join(['Force Clear:', portfolio.current_datetime.strftime("%Y-%m-%d %H:%M:%S"),
                                       s, 'EXIT']))
+            portfolio.flush_orders()
+            self._drain_events(context)
+            context.execution_handler.execute_pending(final=True)
+            self._drain_events(context)
+            portfolio.update_timeindex()
 
     def _output_performance(self):
         """
@@ -147,18 +315,65 @@ class Backtest(object):
         """
         pass
 
-    def trade_record(self):
+    def trade_record(self, strategy_id=None):
         """
         交易记录
+        参数：
+        strategy_id: 多策略时指定策略，默认为第一个策略
         """
-        trades = pd.DataFrame(self.portfolio.all_trades, columns=['datetime', 'exchange', 'symbol', 'direction',
-                                                                  'fill_price', 'quantity', 'commission'])
+        if self._cached_results is not None:
+            results = self._cached_results
+            return results[list(results.keys())[0] if strategy_id is None else strategy_id][2]
+        columns = ['exchange', 'symbol', 'direction', 'fill_price', 'quantity', 'commission']
+        if self.result_dir is not None:
+            trades = self.result(strategy_id).trades
+            return trades[columns] if not trades.empty else trades
+        portfolio = self._get_context(strategy_id).portfolio
+        trades = to_frame(portfolio.all_trades, columns=['datetime'] + columns)
         return trades.set_index('datetime')
 
+    def _get_context(self, strategy_id=None):
+        """
+        获取strategy_id对应的StrategyContext，默认为第一个策略
+        """
+        if strategy_id is None:
+            return list(self.contexts.values())[0]
+        return self.contexts[strategy_id]
+
+    @staticmethod
+    def _portfolio_results(portfolio):
+        """
+        从组合的记录中得到头寸和持仓市值的DataFrame
+        """
+        positions = to_frame(portfolio.all_positions).drop_duplicates(subset='datetime', keep='last'
+                                                                      ).set_index('datetime')
+        holdings = to_frame(portfolio.all_holdings).drop_duplicates(subset='datetime', keep='last'
+                                                                    ).set_index('datetime')
+        return positions, holdings
+
+    def result(self, strategy_id=None):
+        """
+        回测结束后返回BacktestResult对象，positions/holdings/trades/signals在访问时才读取
+        参数：
+        strategy_id: 多策略时指定策略，默认为第一个策略
+        """
+        return self._get_context(strategy_id).portfolio.sink.result()
+
     def simulate_trading(self):
         """
         模拟回测并输出结果，返回资金曲线和头寸的DataFrame
+        多策略时返回以strategy_id为键的头寸和资金曲线字典
+        设置了result_dir时不读取记录，返回BacktestResult，多策略时为以strategy_id为键的字典
         """
+        key = None
+        if self.cache is not None and self.result_dir is None:
+            key = self.cache.make_key(self)
+            results = self.cache.load(key)
+            if results is not None:
+                logger.info('Load backtest results from cache: %s' % key)
+                self._cached_results = results
+                return self._format_results(results)
+
         start = time.time()
         logger.info('Start backtest...')
         self._run_backtest()
@@ -167,10 +382,36 @@ class Backtest(object):
         end = time.time()
         timing = round(end-start, 2)
         logger.info('Backtest took %s seconds!' % timing)
+        for context in self.contexts.values():
+            sink = getattr(context.portfolio, 'sink', None)
+            if sink is not None:
+                sink.close()
         self._output_performance()
-        positions = pd.DataFrame(self.portfolio.all_positions).drop_duplicates(subset='datetime', keep='last'
-                                                                               ).set_index('datetime')
-        holdings = pd.DataFrame(self.portfolio.all_holdings).drop_duplicates(subset='datetime', keep='last'
-                                                                             ).set_index('datetime')
 
+        if self.result_dir is not None:
+            # 记录已写入磁盘，避免在内存中重建全部历史
+            results = OrderedDict((strategy_id, self.result(strategy_id)) for strategy_id in self.contexts)
+            return list(results.values())[0] if len(results) == 1 else results
+
+        results = OrderedDict()
+        for strategy_id, context in self.contexts.items():
+            positions, holdings = self._portfolio_results(context.portfolio)
+            results[strategy_id] = (positions, holdings, self.trade_record(strategy_id))
+        if key is not None:
+            self.cache.save(key, results)
+        return self._format_results(results)
+
+    @staticmethod
+    def _format_results(results):
+        """
+        单策略时返回(positions, holdings)，多策略时返回以strategy_id为键的两个字典
+        """
+        if len(results) == 1:
+            positions, holdings, trades = list(results.values())[0]
+            return positions, holdings
+
+        positions = OrderedDict()
+        holdings = OrderedDict()
+        for strategy_id, (p, h, t) in results.items():
+            positions[strategy_id], holdings[strategy_id] = p, h
         return positions, holdings
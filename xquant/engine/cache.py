@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+
+"""
+BacktestCache 回测结果的磁盘缓存
+以数据文件、策略源码、参数、费率/滑点模型和回测区间的哈希为键，
+将头寸、持仓市值和交易记录按列存储为npz文件，缓存目录超过容量时按LRU淘汰
+
+适用于notebook和优化（如utils.bayesopt.BayesianOptimization）中反复评估相同配置的情形：
+cache = BacktestCache()
+backtest = Backtest(..., cache=cache, long_window=20, short_window=5)
+positions, holdings = backtest.simulate_trading()  # 相同配置第二次运行直接读取缓存
+
+注意：策略的源码只取策略类本身，修改策略所调用的外部函数不会使缓存失效，此时请调用clear()
+
+IndicatorCache 指标计算结果的缓存
+以输入数据的指纹（长度、首尾时间、校验和）、指标函数和参数为键，
+内存中按字节数限制的LRU缓存，可选再加一层磁盘缓存，用于参数扫描和优化中反复计算的相同指标：
+ind_cache = IndicatorCache(max_bytes=512 * 1024 ** 2, cache_dir='D:/cache/indicators')
+ma = ind_cache(pytalib.MA, df, 20)  # 相同数据和参数第二次调用直接返回缓存
+backtest = Backtest(..., indicator_cache=ind_cache)  # bars.indicator()声明的指标使用该缓存
+
+@author: Leon Zhang
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ..conf import OUT_PATH
+from ..utils.precision import get_precision
+
+
+class BacktestCache(object):
+    """
+    内容寻址的回测结果缓存
+    """
+    def __init__(self, cache_dir=None, max_bytes=1024 ** 3, content_digest=False):
+        """
+        参数：
+        cache_dir: 缓存目录，默认为OUT_PATH下的xquant_cache
+        max_bytes: 缓存目录的容量上限（字节），超过时删除最久未使用的结果
+        content_digest: True则对数据文件内容做摘要，否则只使用路径、修改时间和大小
+        """
+        self.cache_dir = cache_dir or os.path.join(OUT_PATH, 'xquant_cache')
+        self.max_bytes = max_bytes
+        self.content_digest = content_digest
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def _file_signature(self, path):
+        """
+        数据文件的签名：路径+修改时间+大小，或内容摘要
+        """
+        if not os.path.exists(path):
+            return path
+        if self.content_digest:
+            digest = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+            return '%s:%s' % (path, digest.hexdigest())
+        stat = os.stat(path)
+        return '%s:%s:%s' % (path, stat.st_mtime, stat.st_size)
+
+    @staticmethod
+    def _class_signature(cls):
+        """
+        类的签名：模块、名称和源码；functools.partial另加其绑定的参数
+        """
+        if isinstance(cls, functools.partial):
+            return '%s\npartial%s' % (BacktestCache._class_signature(cls.func),
+                                      BacktestCache._value_signature(
+                                          (cls.args, sorted((cls.keywords or {}).items()))))
+        if not isinstance(cls, type):
+            cls = type(cls)
+        try:
+            source = inspect.getsource(cls)
+        except (IOError, TypeError):
+            source = ''
+        return '%s.%s\n%s' % (cls.__module__, cls.__name__, source)
+
+    @staticmethod
+    def _value_signature(value):
+        """
+        partial参数的签名：类和partial取_class_signature，容器逐个元素，其余取repr
+        """
+        if isinstance(value, (type, functools.partial)):
+            return BacktestCache._class_signature(value)
+        if isinstance(value, (list, tuple)):
+            return '(%s)' % ', '.join(BacktestCache._value_signature(v) for v in value)
+        if isinstance(value, dict):
+            return '{%s}' % ', '.join('%r: %s' % (k, BacktestCache._value_signature(v))
+                                      for k, v in sorted(value.items()))
+        return repr(value)
+
+    def make_key(self, backtest):
+        """
+        计算Backtest对象对应的缓存键
+        """
+        parts = [repr(backtest.symbol_list), repr(backtest.initial_capital),
+                 repr(backtest.start_date), repr(backtest.end_date),
+                 repr(backtest.commission_type), repr(backtest.slippage_type),
+                 self._class_signature(backtest.data_handler_cls),
+                 self._class_signature(backtest.execution_handler_cls),
+                 self._class_signature(backtest.portfolio_cls),
+                 self._precision_signature()]
+        for s in backtest.symbol_list:
+            parts.append(self._file_signature(os.path.join(backtest.csv_dir, '%s.csv' % s)))
+        for strategy_id, (strategy_cls, params) in backtest.strategy_specs.items():
+            parts.append(repr(strategy_id))
+            parts.append(self._class_signature(strategy_cls))
+            parts.append(repr(sorted(params.items())))
+        if backtest.shared_account:
+            parts.append('shared_account')
+        return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _precision_signature():
+        """
+        当前的精度策略，精简精度下恰好相等的比较可能得到不同的交易
+        """
+        precision = get_precision()
+        return 'precision:%s,%s,%s' % (precision.price, precision.indicator, precision.compact_integers)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, '%s.npz' % key)
+
+    def load(self, key):
+        """
+        读取缓存的结果，未命中返回None
+        返回：
+        {strategy_id: (positions, holdings, trades)}的有序字典
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            arrays = dict(data.items())
+        os.utime(path, None)  # 更新修改时间，用于LRU
+
+        results = OrderedDict()
+        for strategy_id, i in json.loads(str(arrays['__meta__'])):
+            results[strategy_id] = tuple(_arrays_to_frame(arrays, '%s/%s' % (i, name))
+                                         for name in ('positions', 'holdings', 'trades'))
+        return results
+
+    def save(self, key, results):
+        """
+        保存结果，并在超过容量时淘汰旧的缓存
+        参数：
+        results: {strategy_id: (positions, holdings, trades)}的字典
+        """
+        arrays = {}
+        meta = []
+        for i, (strategy_id, frames) in enumerate(results.items()):
+            meta.append((strategy_id, i))
+            for name, df in zip(('positions', 'holdings', 'trades'), frames):
+                arrays.update(_frame_to_arrays(df, '%s/%s' % (i, name)))
+        arrays['__meta__'] = np.array(json.dumps(meta))
+
+        path = self._path(key)
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        _evict_lru(self.cache_dir, '.npz', self.max_bytes)
+
+    def clear(self):
+        """
+        清空缓存目录
+        """
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+class IndicatorCache(object):
+    """
+    指标结果的两级缓存：内存LRU和可选的磁盘目录
+    注意：返回的是缓存中的对象本身，请不要修改
+    """
+    def __init__(self, max_bytes=256 * 1024 ** 2, cache_dir=None, max_disk_bytes=1024 ** 3):
+        """
+        参数：
+        max_bytes: 内存缓存的容量上限（字节），超过时丢弃最久未使用的结果
+        cache_dir: 磁盘缓存目录，默认不使用磁盘缓存
+        max_disk_bytes: 磁盘缓存的容量上限（字节）
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        self._memory = OrderedDict()  # key -> (结果, 字节数)，按最近使用排序
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(data):
+        """
+        数据的廉价指纹：长度、首尾时间和数值的校验和
+        参数：
+        data: Series、DataFrame、pytalib.Panel、数组或它们的list/tuple
+        """
+        if isinstance(data, (list, tuple)):
+            return '[%s]' % ','.join(IndicatorCache.fingerprint(d) for d in data)
+        if hasattr(data, 'fields') and hasattr(data, 'columns'):  # pytalib.Panel
+            return '{%s}' % ','.join('%s:%s' % (f, IndicatorCache.fingerprint(v))
+                                     for f, v in data.fields.items())
+        if isinstance(data, (pd.Series, pd.DataFrame)):
+            index = data.index
+            head = '%d:%s:%s' % (len(index), index[0], index[-1]) if len(index) else '0'
+            if isinstance(data, pd.DataFrame):
+                head += ':' + repr(list(data.columns))
+            return '%s:%s' % (head, IndicatorCache.fingerprint(data.values))
+        values = np.ascontiguousarray(data)
+        if values.dtype == object:
+            values = np.frombuffer(repr(values.tolist()).encode('utf-8'), dtype=np.uint8)
+        return '%s:%s:%08x' % (values.dtype.str, values.shape, zlib.adler32(values.view(np.uint8)) & 0xffffffff)
+
+    @staticmethod
+    def _func_signature(func):
+        """
+        函数的签名：模块、名称和源码，表达式为其结构
+        """
+        if hasattr(func, 'key') and not callable(func):  # expression.Expr
+            return 'expr:%r' % (func.key,)
+        name = '%s.%s' % (getattr(func, '__module__', ''),
+                          getattr(func, '__qualname__', getattr(func, '__name__', repr(func))))
+        try:
+            source = inspect.getsource(func)
+        except (IOError, TypeError):
+            source = ''
+        code = getattr(func, '__code__', None)
+        if code is not None:  # 同一行中的多个lambda源码相同
+            source += '\n%s%r' % (code.co_code.hex(), code.co_consts)
+        return '%s\n%s' % (name, source)
+
+    def make_key(self, func, data, args=(), kwargs=None):
+        """
+        计算指标函数在数据上的缓存键
+        """
+        parts = [self._func_signature(func), self.fingerprint(data),
+                 repr(tuple(args)), repr(sorted((kwargs or {}).items()))]
+        return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        读取缓存的结果，先查内存再查磁盘，未命中返回None
+        """
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        if self.cache_dir is not None:
+            path = self._path(key)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    value = pickle.load(f)
+                os.utime(path, None)  # 更新修改时间，用于LRU
+                self.disk_hits += 1
+                self._remember(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """
+        保存结果到内存，使用磁盘缓存时同时写入磁盘
+        """
+        self._remember(key, value)
+        if self.cache_dir is not None:
+            path = self._path(key)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            _evict_lru(self.cache_dir, '.pkl', self.max_disk_bytes)
+
+    def __call__(self, func, data, *args, **kwargs):
+        """
+        带缓存地调用func(data, *args, **kwargs)
+        """
+        key = self.make_key(func, data, args, kwargs)
+        value = self.get(key)
+        if value is None:
+            value = func(data, *args, **kwargs)
+            self.put(key, value)
+        return value
+
+    def _remember(self, key, value):
+        """
+        放入内存缓存，超过容量时从最久未使用的结果开始丢弃；单个结果超过容量时不缓存
+        """
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        self._memory[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self.nbytes -= evicted
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, '%s.pkl' % key)
+
+    def __len__(self):
+        return len(self._memory)
+
+    def clear(self):
+        """
+        清空内存缓存和磁盘缓存
+        """
+        self._memory.clear()
+        self.nbytes = 0
+        if self.cache_dir is not None:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.pkl'):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+
+def _nbytes(value):
+    """
+    结果占用内存的估计：数组、Series、DataFrame及其dict/list/tuple
+    """
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value)
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=False))
+    return int(getattr(value, 'nbytes', 0))
+
+
+def _evict_lru(cache_dir, suffix, max_bytes):
+    """
+    按修改时间从旧到新删除缓存目录中以suffix结尾的文件，直到总大小不超过max_bytes
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(suffix) and not name.endswith('.tmp' + suffix):
+            stat = os.stat(os.path.join(cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(e[1] for e in entries)
+    for mtime, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(os.path.join(cache_dir, name))
+        total -= size
+
+
+def _frame_to_arrays(df, prefix):
+    """
+    将以datetime为index的DataFrame按列拆成数组，字符串列保存为定长unicode
+    """
+    arrays = {prefix + '/__index__': np.asarray(df.index, dtype='datetime64[ns]'),
+              prefix + '/__columns__': np.array([str(c) for c in df.columns], dtype='U')}
+    for j, col in enumerate(df.columns):
+        values = df[col].values
+        if values.dtype == object:
+            values = values.astype('U')
+        arrays['%s/%d' % (prefix, j)] = values
+    return arrays
+
+
+def _arrays_to_frame(arrays, prefix):
+    """
+    _frame_to_arrays的逆过程
+    """
+    columns = list(arrays[prefix + '/__columns__'])
+    data = OrderedDict((col, arrays['%s/%d' % (prefix, j)]) for j, col in enumerate(columns))
+    index = pd.Index(arrays[prefix + '/__index__'], name='datetime')
+    return pd.DataFrame(data, index=index, columns=columns)
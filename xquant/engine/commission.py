@@ -11,6 +11,11 @@ New in V0.3.4
 from abc import ABCMeta, abstractmethod
 import math
 
+import numpy as np
+import pandas as pd
+
+from ..utils.symbol import registry
+
 
 class Commission(object):
     """
@@ -76,3 +81,95 @@ class PerTradeCommission(Commission):
     基于交易次数计算手续费
     """
     pass
+
+
+# A股和期货的默认费率表，键为费率类别
+# stamp_duty: 卖出印花税（按成交金额）
+# transfer_rate/transfer_min: 过户费（按股数，向上取整）及其最低收费
+# broker_rate/broker_min: 佣金或期货手续费（按成交金额）及其最低收费
+DEFAULT_FEE_RATES = {
+    'SH_STOCK': {'stamp_duty': 1.0e-3, 'transfer_rate': 1.0e-4, 'transfer_min': 1.0,
+                 'broker_rate': 3.0e-4, 'broker_min': 5.0},
+    'SZ_STOCK': {'stamp_duty': 1.0e-3, 'transfer_rate': 0.0, 'transfer_min': 0.0,
+                 'broker_rate': 3.0e-4, 'broker_min': 5.0},
+    'INDEX_FUTURE': {'stamp_duty': 0.0, 'transfer_rate': 0.0, 'transfer_min': 0.0,
+                     'broker_rate': 3.0e-5, 'broker_min': 0.0},
+    'COMMODITY_FUTURE': {'stamp_duty': 0.0, 'transfer_rate': 0.0, 'transfer_min': 0.0,
+                         'broker_rate': 1.5e-4, 'broker_min': 0.0},
+    'NONE': {'stamp_duty': 0.0, 'transfer_rate': 0.0, 'transfer_min': 0.0,
+             'broker_rate': 0.0, 'broker_min': 0.0},
+}
+
+FEE_FIELDS = ('stamp_duty', 'transfer_rate', 'transfer_min', 'broker_rate', 'broker_min')
+
+
+def get_fee_class(symbol):
+    """
+    symbol对应的费率类别，由utils.symbol.registry解析
+    """
+    return registry.get(symbol).fee_class
+
+
+class FeeSchedule(Commission):
+    """
+    预编译的费率表：每个symbol的费率类别只解析一次并缓存，
+    可对一批成交（数量、价格、方向的数组）用numpy一次计算全部费用
+    单笔费用 = 卖出印花税 + max(ceil(股数*过户费率), 最低过户费) + max(成交金额*佣金率, 最低佣金)
+
+    在Backtest中使用自定义费率表：
+    execution_handler = functools.partial(SimulatedExecutionHandler, fee_rates=rates)
+    """
+    def __init__(self, rates=None, classifier=get_fee_class):
+        """
+        参数：
+        rates: 费率表，{费率类别: {字段: 值}}的字典或以费率类别为index的DataFrame，
+               字段见FEE_FIELDS，默认为DEFAULT_FEE_RATES
+        classifier: 由symbol得到费率类别的函数
+        """
+        if rates is None:
+            rates = DEFAULT_FEE_RATES
+        if isinstance(rates, pd.DataFrame):
+            rates = rates.to_dict('index')
+        self.fee_classes = list(rates.keys())
+        self.table = np.array([[float(rates[c].get(f, 0.0)) for f in FEE_FIELDS] for c in self.fee_classes])
+        self.classifier = classifier
+        self._class_index = {c: i for i, c in enumerate(self.fee_classes)}
+        self._symbol_rates = {}  # symbol -> 费率行号
+
+    def _rate_index(self, symbol):
+        """
+        symbol对应费率表的行号，带缓存
+        """
+        try:
+            return self._symbol_rates[symbol]
+        except KeyError:
+            i = self._symbol_rates[symbol] = self._class_index[self.classifier(symbol)]
+            return i
+
+    def get_commission(self, symbol, quantity, price, direction):
+        """
+        单笔成交的费用
+        """
+        stamp_duty, transfer_rate, transfer_min, broker_rate, broker_min = self.table[self._rate_index(symbol)]
+        full_cost = price * quantity
+        stamp = full_cost * stamp_duty if direction != 'BUY' else 0.0
+        transfer = max(math.ceil(quantity * transfer_rate), transfer_min)
+        return stamp + transfer + max(full_cost * broker_rate, broker_min)
+
+    def get_commissions(self, symbols, quantities, prices, directions):
+        """
+        一批成交的费用，返回numpy数组
+        参数：
+        symbols: symbol的序列
+        quantities, prices, directions: 与symbols等长的成交数量、成交价、方向（'BUY'或'SELL'）
+        """
+        rates = self.table[[self._rate_index(s) for s in symbols]]
+        quantities = np.asarray(quantities, dtype=float)
+        full_cost = np.asarray(prices, dtype=float) * quantities
+        stamp = np.where(np.asarray(directions) != 'BUY', full_cost * rates[:, 0], 0.0)
+        transfer = np.maximum(np.ceil(quantities * rates[:, 1]), rates[:, 2])
+        return stamp + transfer + np.maximum(full_cost * rates[:, 3], rates[:, 4])
+
+    def __repr__(self):
+        return "{class_name}(fee_classes={classes})".format(
+            class_name=self.__class__.__name__, classes=self.fee_classes)
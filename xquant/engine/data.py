@@ -10,12 +10,17 @@ DataHandler抽象基类
 import datetime
 import os
 import sys
+import numpy as np
 import pandas as pd
 import functools
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from abc import ABCMeta, abstractmethod
 
 from .event import BarEvent
+from .precompute import resolve_function, compute_column, IndicatorColumn
+from ..utils.expression import Expr, Evaluator
+from ..utils.pytalib import Panel
+from ..utils.precision import get_precision
 
 
 class DataHandler(object):
@@ -25,6 +30,8 @@ class DataHandler(object):
     这里不区分历史数据和实时交易数据
     """
     Bar = namedtuple('Bar', ('symbol', 'datetime', 'open', 'high', 'low', 'close', 'volume'))
+    fields = ('open', 'high', 'low', 'close', 'volume')
+    indicator_cache = None  # 跨回测共享的IndicatorCache，由Backtest设置
 
     __metaclass__ = ABCMeta
 
@@ -43,6 +50,28 @@ class DataHandler(object):
         """
         raise NotImplementedError("Should implement update_bars()！")
 
+    def get_latest_bar_values(self, field):
+        """
+        返回symbol_list中所有股票最新bar的某一字段，numpy数组，顺序同symbol_list
+        参数：
+        field: 'open', 'high', 'low', 'close'或'volume'
+        """
+        return np.array([getattr(self.get_latest_bar(s), field) for s in self.symbol_list])
+
+    def indicator(self, func, *args, **kwargs):
+        """
+        声明一个预先计算的指标列，见precompute模块，需要能一次取得全部历史数据的DataHandler
+        """
+        raise NotImplementedError("Should implement indicator() to precompute indicators!")
+
+    def reset(self, events=None):
+        """
+        回到数据起点，使已加载数据的DataHandler可以被多次回测复用（如参数扫描）
+        参数：
+        events: 新的Event队列，默认沿用原队列
+        """
+        raise NotImplementedError("Should implement reset() to reuse loaded data!")
+
 
 ######################
 # 对不同数据来源具体处理 #
@@ -57,8 +86,12 @@ class CSVDataHandler(DataHandler):
         self.end_date = end_date
 
         self.symbol_data = {}
+        self.aligned_data = {}
         self.latest_symbol_data = {}
         self.continue_backtest = True
+        self.cursor = -1  # 最新bar在对齐后数据中的行号
+        self._indicators = {}  # 预先计算的指标数组，reset()后仍可复用
+        self._evaluator = None  # 计算指标表达式的Evaluator，缓存共享的中间结果
 
         self._open_convert_csv_files()
 
@@ -77,11 +110,69 @@ class CSVDataHandler(DataHandler):
             if comb_index is None:
                 comb_index = self.symbol_data[s].index
             else:
-                comb_index.union(self.symbol_data[s].index)
+                comb_index = comb_index.union(self.symbol_data[s].index)
             self.latest_symbol_data[s] = []
 
+        precision = get_precision()
+        valid = []
+        for s in self.symbol_list:
+            valid.append(comb_index.isin(self.symbol_data[s].index))
+            self.aligned_data[s] = precision.frame(self.symbol_data[s].reindex(index=comb_index, method='pad'))
+            self.symbol_data[s] = self.aligned_data[s].iterrows()
+
+        # (时间, symbol, 字段)的数组，用于按bar对全部symbol做矢量化计算，dtype为价格的精度
+        self.datetime_index = comb_index
+        self.symbol_index = {s: i for i, s in enumerate(self.symbol_list)}
+        self.field_index = {f: i for i, f in enumerate(self.fields)}
+        # 成交量在价格精度下不能精确表示（如超过2 ** 24）时保留float64
+        self.data_array = precision.bars(np.stack([self.aligned_data[s][list(self.fields)].values
+                                                   for s in self.symbol_list], axis=1),
+                                         exact=(self.field_index['volume'],))
+        # (时间, symbol)的布尔数组，False表示该bar是向前填充的（如停牌）
+        self.valid_array = np.stack(valid, axis=1)
+
+    def reset(self, events=None):
+        """
+        回到数据起点，不重新读取CSV文件
+        参数：
+        events: 新的Event队列，默认沿用原队列
+        """
+        if events is not None:
+            self.events = events
         for s in self.symbol_list:
-            self.symbol_data[s] = self.symbol_data[s].reindex(index=comb_index, method='pad').iterrows()
+            self.symbol_data[s] = self.aligned_data[s].iterrows()
+            self.latest_symbol_data[s] = []
+        self.continue_backtest = True
+        self.cursor = -1
+
+    def indicator(self, func, *args, **kwargs):
+        """
+        对对齐后的全部历史数据一次性计算指标，返回按游标读取的IndicatorColumn
+        相同的函数和参数只计算一次，多策略和参数扫描中复用
+        参数：
+        func: 指标函数或pytalib中的函数名，以每个symbol的DataFrame为第一个参数；
+              或expression中的表达式，各表达式共享的中间结果只计算一次
+        args, kwargs: 传给func的其余参数
+        column: 关键字参数，func返回DataFrame时使用的列名或位置
+        """
+        column = kwargs.pop('column', None)
+        func = resolve_function(func)
+        key = func.key if isinstance(func, Expr) else (func, args, tuple(sorted(kwargs.items())), column)
+        values = self._indicators.get(key)
+        if values is None:
+            frames = [self.aligned_data[s] for s in self.symbol_list]
+            if self.indicator_cache is not None:
+                cache_key = self.indicator_cache.make_key(func, frames, args, dict(kwargs, column=column))
+                values = self.indicator_cache.get(cache_key)
+            if values is None:
+                if isinstance(func, Expr) and self._evaluator is None:
+                    self._evaluator = Evaluator(Panel.from_frames(OrderedDict(enumerate(frames))))
+                values = compute_column(frames, self.datetime_index, func, args, kwargs, column,
+                                        self._evaluator)
+                if self.indicator_cache is not None:
+                    self.indicator_cache.put(cache_key, values)
+            self._indicators[key] = values
+        return IndicatorColumn(self, values, func, args, kwargs, column)
 
     def _get_new_bar(self, symbol):
         """
@@ -89,7 +180,8 @@ class CSVDataHandler(DataHandler):
         生成器，每次调用生成一个新的bar，直到数据最后，在update_bars()中调用
         """
         for b in self.symbol_data[symbol]:
-            yield DataHandler.Bar(symbol, b[0], b[1][0], b[1][1], b[1][2], b[1][3], b[1][4])
+            v = b[1].values.astype(np.float64, copy=False)  # 精简精度下账户计算仍使用float64
+            yield DataHandler.Bar(symbol, b[0], v[0], v[1], v[2], v[3], v[4])
 
 
     def get_latest_bars(self, symbol, N=1):
@@ -126,6 +218,15 @@ class CSVDataHandler(DataHandler):
         else:
             return bars_list[-1][1]
 
+    def get_latest_bar_values(self, field):
+        """
+        返回symbol_list中所有股票最新bar的某一字段，取自对齐后的数组，转为float64供账户计算使用
+        第一个bar之前返回nan
+        """
+        if self.cursor < 0:
+            return np.full(len(self.symbol_list), np.nan)
+        return self.data_array[self.cursor, :, self.field_index[field]].astype(np.float64, copy=False)
+
     def update_bars(self):
         """
         对于symbol list中所有股票，将最新的bar更新到latest_symbol_data字典
@@ -139,6 +240,8 @@ class CSVDataHandler(DataHandler):
                 if bar is not None:
                     self.latest_symbol_data[s].append(bar)
                     self.events.put(BarEvent(bar))
+        if self.continue_backtest:
+            self.cursor += 1
 
 
 class HDF5DataHandler(DataHandler):
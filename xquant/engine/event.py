@@ -7,6 +7,8 @@ Event类，在数据、组合、交易所（或模拟交易所）间流动的事
 @version: 0.4
 """
 
+import itertools
+
 
 class Event(object):
     """
@@ -84,35 +86,76 @@ class SignalEvent(Event):
         self.strength = strength
 
 
+class RebalanceEvent(Event):
+    """
+    Rebalance事件类
+    处理：横截面策略一次给出全部股票的目标权重，由Portfolio统一计算调仓订单
+    """
+    def __init__(self, datetime, weights, strategy_id=1, cash_buffer=0.0):
+        """
+        参数：
+        datetime: 产生目标权重的时间戳
+        weights: 目标权重，{symbol: 权重}的字典、pandas Series或按symbol_list排列的数组，
+                 未给出的symbol权重为0，负权重表示空头
+        strategy_id: 策略的id
+        cash_buffer: 预留现金占组合总值的比例，用于支付滑点等，见BasicPortfolio.rebalance
+        """
+        self.type = 'REBALANCE'
+        self.datetime = datetime
+        self.weights = weights
+        self.strategy_id = strategy_id
+        self.cash_buffer = cash_buffer
+
+
 class OrderEvent(Event):
     """
     Order事件类
     处理：发送一个Order给执行（execution）系统，
-    其包含：symbol, type (Market or Limit, 即市价委托还是限价委托), quantity, direction
+    其包含：symbol, type (Market, Limit or Stop, 即市价、限价或止损委托), quantity, direction
     """
+    _ids = itertools.count(1)
 
-    def __init__(self, symbol, order_type, quantity, direction):
+    def __init__(self, symbol, order_type, quantity, direction, price=None, expiry=None):
         """
         初始化OrderEvent对象
-        设定市价委托('MKT')或者限价委托('LMT')，交易数量（整数），交易方向('BUY'或'SELL')
+        设定市价委托('MKT')、限价委托('LMT')或止损委托('STP')，交易数量（整数），交易方向('BUY'或'SELL')
         参数：
         symbol: 交易的股票
-        order_type: 'MKT' or 'LMT'
+        order_type: 'MKT', 'LMT' or 'STP'
         quantity: 非负整数
         direction: 'BUY' or 'SELL'
+        price: 限价或止损价，'MKT'委托不需要
+        expiry: 挂单的到期时间（datetime），此后的bar不再撮合，默认一直有效
         """
         self.type = 'ORDER'
+        self.order_id = next(OrderEvent._ids)
         self.symbol = symbol
         self.order_type = order_type
         self.quantity = quantity
         self.direction = direction
+        self.price = price
+        self.expiry = expiry
 
     def print_order(self):
         """
         输出Order中的值
         """
-        print("Order: Symbol=%s, Type=%s, Quantity=%s, Direction=%s" %
-              (self.symbol, self.order_type, self.quantity, self.direction))
+        print("Order: Id=%s, Symbol=%s, Type=%s, Quantity=%s, Direction=%s, Price=%s" %
+              (self.order_id, self.symbol, self.order_type, self.quantity, self.direction, self.price))
+
+
+class CancelEvent(Event):
+    """
+    Cancel事件类
+    处理：撤销模拟交易所中尚未成交的限价或止损挂单
+    """
+    def __init__(self, order_id):
+        """
+        参数：
+        order_id: 需要撤销的OrderEvent.order_id
+        """
+        self.type = 'CANCEL'
+        self.order_id = order_id
 
 
 class FillEvent(Event):
@@ -142,4 +185,54 @@ class FillEvent(Event):
         self.quantity = quantity
         self.direction = direction
         self.fill_price = fill_price
-        self.commission = commission
\ No newline at end of file
+        self.commission = commission
+
+
+class OrderBatch(Event):
+    """
+    OrderBatch事件类
+    处理：Portfolio将同一时刻的全部Order合并成一个事件发送给执行系统，由其统一定价
+    """
+    def __init__(self, orders):
+        """
+        参数：
+        orders: OrderEvent的list
+        """
+        self.type = 'ORDER_BATCH'
+        self.orders = orders
+
+    def __len__(self):
+        return len(self.orders)
+
+
+class FillBatch(Event):
+    """
+    FillBatch事件类
+    同一时刻一批成交的列式存储，除timeindex和exchange外各字段为等长的数组
+    """
+    def __init__(self, timeindex, symbols, exchange, quantities, directions,
+                 fill_prices, commissions):
+        """
+        参数含义同FillEvent
+        symbols: 成交代码的list
+        quantities, directions, fill_prices, commissions: numpy数组
+        """
+        self.type = 'FILL_BATCH'
+        self.timeindex = timeindex
+        self.symbols = symbols
+        self.exchange = exchange
+        self.quantities = quantities
+        self.directions = directions
+        self.fill_prices = fill_prices
+        self.commissions = commissions
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def fills(self):
+        """
+        逐个生成FillEvent
+        """
+        for i, symbol in enumerate(self.symbols):
+            yield FillEvent(self.timeindex, symbol, self.exchange, self.quantities[i],
+                            self.directions[i], self.fill_prices[i], self.commissions[i])
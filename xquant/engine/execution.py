@@ -13,11 +13,15 @@ orders的执行，这里模拟交易所行为
 
 from abc import ABCMeta, abstractmethod
 
-from .event import FillEvent
+import numpy as np
+
+from .event import FillEvent, FillBatch
 # from .event import OrderEvent
-from .commission import ZeroCommission, PerShareCommission, PerMoneyCommission
-from ..utils.symbol import get_exchange
-from .slippage import ZeroSlippage, FixedPercentSlippage
+from .commission import ZeroCommission, FeeSchedule
+from .slippage import ZeroSlippage, FixedPercentSlippage, VolumeShareSlippage
+from .orderbook import OrderBook
+from .tradability import TradabilityMask
+from ..utils.symbol import registry
 
 
 class ExecutionHandler(object):
@@ -27,6 +31,7 @@ class ExecutionHandler(object):
     继承的子类既可以是模拟的交易所，也可以是真正的实时交易API接口
     """
     __metaclass__ = ABCMeta
+    scheduler = None  # Backtest设置的Scheduler对象，见scheduler模块
 
     @abstractmethod
     def execute_order(self, event):
@@ -37,72 +42,162 @@ class ExecutionHandler(object):
         """
         raise NotImplementedError("Should implement execute_order()!")
 
+    def execute_batch(self, event):
+        """
+        执行一个OrderBatch，默认逐个调用execute_order
+        参数：
+        event: OrderBatch事件
+        """
+        for order in event.orders:
+            self.execute_order(order)
+
+    def update_bar(self, event):
+        """
+        每根新的bar到来时调用，用于撮合挂单等，默认什么也不做
+        参数：
+        event: BarEvent
+        """
+        pass
+
+    def cancel_order(self, order_id):
+        """
+        撤销尚未成交的挂单，默认什么也不做
+        """
+        pass
+
+    def execute_pending(self, final=False):
+        """
+        每个时刻的事件处理完后调用，批量执行该时刻积累的订单，默认什么也不做
+        参数：
+        final: 回测结束强制平仓时为True，应全部成交
+        """
+        pass
+
+    def cancel_all(self):
+        """
+        撤销全部未成交的订单，回测结束强制平仓前调用，默认什么也不做
+        """
+        pass
+
 
 class SimulatedExecutionHandler(ExecutionHandler):
     """
     简单的模拟交易所
-    未考虑等待时间、滑点、部分成交等
+    市价单以最新收盘价（考虑滑点）立即成交；限价单和止损单挂在OrderBook中，
+    由之后bar的最高价、最低价撮合
+    成交量滑点模型（slippage_type='volume'）下，同一时刻的市价单批量成交，
+    受bar成交量限制的未成交部分留到下一根bar继续成交
+    tradability打开时，停牌、涨停买入、跌停卖出的订单不能成交，当天买入的股票当天不能卖出（T+1）：
+    立即成交的市价单被拒绝（记录在rejected_orders中），挂单和成交量滑点模型下的市价单留待之后的bar
+    设置fill_delay时，市价单通过scheduler延迟到之后的bar以开盘价成交
     """
-    def __init__(self, bars, events, slippage_type='fixed', commission_type='default'):
+    def __init__(self, bars, events, slippage_type='fixed', commission_type='default', fee_rates=None,
+                 tradability=False, fill_delay=None):
         """
         初始化
         参数：
         bars: DataHandler结果bars，为了对回测时成交价做模拟处理
         events: Event队列
         commission_type: 费率模型
-        slippage_type: 滑点模型
+        slippage_type: 滑点模型，'zero', 'fixed'或'volume'
+        fee_rates: commission_type为'default'时使用的费率表，见commission.FeeSchedule
+        tradability: True则检查A股的停牌、涨跌停和T+1限制，也可以是TradabilityMask对象
+        fill_delay: 市价单的成交延迟（datetime.timedelta），在下单后、且不早于下单时间+fill_delay的
+                    第一根bar以开盘价成交，timedelta(0)即下一根bar；None则以当前bar的收盘价立即成交
         """
         self.bars = bars
         self.events = events
         self.commission_type = commission_type
         self.slippage_type = slippage_type
         self.commission = 0.0
+        self.order_book = OrderBook()
+        self.fee_schedule = FeeSchedule(fee_rates)
+
+        self.slippage_models = {'zero': ZeroSlippage(),
+                                'fixed': FixedPercentSlippage(percent=0.1),
+                                'volume': VolumeShareSlippage()}
+        self.symbol_index = {s: i for i, s in enumerate(self.bars.symbol_list)}
+        self.symbol_ids = registry.symbol_ids(self.bars.symbol_list)
+        self.pending_orders = []  # 成交量滑点模型下等待批量成交的市价单
 
-    def _trade_with_slippage(self, event):
+        if tradability is True:
+            tradability = TradabilityMask(self.bars)
+        self.tradability = tradability or None
+        self.rejected_orders = []
+        self.fill_delay = fill_delay
+        n = len(self.bars.symbol_list)
+        self.positions = np.zeros(n)     # 本执行系统成交的净头寸，用于T+1
+        self.bought_today = np.zeros(n)  # 当天买入的数量
+        self.trade_date = None
+
+    def _record_fills(self, index, quantities, directions, timeindex):
+        """
+        记录成交，跟踪T+1所需的头寸和当天买入数量
+        """
+        if self.tradability is None:
+            return
+        if timeindex.date() != self.trade_date:
+            self.trade_date = timeindex.date()
+            self.bought_today[:] = 0
+        buys = np.asarray(directions) == 'BUY'
+        np.add.at(self.positions, index, np.where(buys, quantities, -np.asarray(quantities)))
+        np.add.at(self.bought_today, index, np.where(buys, quantities, 0))
+
+    def _tradable_quantities(self, index, quantities, directions):
+        """
+        考虑停牌、涨跌停和T+1后最多可以成交的数量，index、quantities、directions为等长的数组
+        """
+        quantities = np.asarray(quantities, dtype=float)
+        if self.tradability is None:
+            return quantities
+        allowed = np.where(self.tradability.tradable_array(index, directions), quantities, 0.0)
+        date = self.bars.get_latest_bar_datetime(self.bars.symbol_list[0]).date()
+        bought = self.bought_today if date == self.trade_date else np.zeros(len(self.positions))
+        sellable = np.where(self.tradability.t_plus_one,
+                            np.maximum(self.positions - bought, 0.0), np.inf)
+        sells = np.asarray(directions) != 'BUY'
+        # 同一symbol的多个卖单依次占用可卖数量
+        for i in np.flatnonzero(sells):
+            allowed[i] = min(allowed[i], sellable[index[i]])
+            sellable[index[i]] -= allowed[i]
+        return allowed
+
+    def _trade_with_slippage(self, event, order_price=None):
         """
         考虑滑点后的成交价
+        参数：
+        order_price: 滑点前的价格，默认为最新收盘价
         """
-        order_price = self.bars.get_latest_bars(event.symbol)[0][5]
+        if order_price is None:
+            order_price = self.bars.get_latest_bars(event.symbol)[0][5]
         if self.slippage_type == 'zero':
-            return ZeroSlippage().get_trade_price(order_price)
+            return self.slippage_models['zero'].get_trade_price(order_price)
 
         elif self.slippage_type == 'fixed':
-            fixed_slippage = FixedPercentSlippage(percent=0.1)
-            return fixed_slippage.get_trade_price(order_price, event.direction)
+            return self.slippage_models['fixed'].get_trade_price(order_price, event.direction)
+
+        elif self.slippage_type == 'volume':
+            volume = self.bars.get_latest_bars(event.symbol)[0][6]
+            return self.slippage_models['volume'].get_trade_price(order_price, event.direction,
+                                                                  event.quantity, volume)
         else:
             return order_price
 
-    def _get_commission_commission(self, event):
+    def _get_commission_commission(self, event, fill_price=None, quantity=None):
         """
         计算股票或期货的手续费
+        参数：
+        fill_price: 成交价，默认为最新收盘价考虑滑点后的价格
+        quantity: 成交数量，默认为订单数量，部分成交时为实际成交数量
         """
-        self.fill_price = self._trade_with_slippage(event)
-        full_cost = self.fill_price * event.quantity
+        self.fill_price = self._trade_with_slippage(event) if fill_price is None else fill_price
+        quantity = event.quantity if quantity is None else quantity
 
         if self.commission_type == 'zero':
             commission = ZeroCommission().get_commission()
 
         elif self.commission_type == 'default':
-            if event.symbol.startswith('6'):  # 上海交易所
-                if event.direction == 'BUY':  # 买入：过户费1000股1元+佣金单向万3
-                    commission = PerShareCommission(rate=0.0001, min_comm=1.0).get_commission(event.quantity) + \
-                                 PerMoneyCommission(rate=3.0e-4, min_comm=5.0).get_commission(full_cost)
-                else:  # 卖出：印花税+过户费+佣金
-                    commission = PerMoneyCommission(rate=1.0e-3).get_commission(full_cost) + \
-                                 PerShareCommission(rate=0.0001, min_comm=1.0).get_commission(event.quantity) + \
-                                 PerMoneyCommission(rate=3.0e-4, min_comm=5.0).get_commission(full_cost)
-            elif event.symbol.startswith(('0', '3')):  # 深圳交易所
-                if event.direction == 'BUY':  # 买入：佣金
-                    commission = PerMoneyCommission(rate=3.0e-4, min_comm=5.0).get_commission(full_cost)
-                else:  # 卖出：印花税+佣金
-                    commission = PerMoneyCommission(rate=1.0e-3).get_commission(full_cost) + \
-                                 PerMoneyCommission(rate=3.0e-4, min_comm=5.0).get_commission(full_cost)
-            elif event.symbol.startswith('I'):  # 股指期货，按照点数计算
-                commission = PerMoneyCommission(rate=3.0e-5).get_commission(full_cost)
-            elif get_exchange(event.symbol) in ('SQ.EX', 'DS.EX', 'ZS.EX'):  # 商品期货，按照点数计算
-                commission = PerMoneyCommission(rate=1.5e-4).get_commission(full_cost)
-            else:
-                commission = 0.0
+            commission = self.fee_schedule.get_commission(event.symbol, quantity, self.fill_price, event.direction)
         else:
             commission = 0.0
 
@@ -110,15 +205,186 @@ class SimulatedExecutionHandler(ExecutionHandler):
 
     def execute_order(self, event):
         """
-        简单地将Order对象转变成Fill对象
+        市价单直接转变成Fill对象，限价单和止损单加入挂单簿
         参数：
         event: 含有order信息的Event对象
         """
         if event.type == 'ORDER':
-            self.commission = self._get_commission_commission(event)
+            if event.order_type in ('LMT', 'STP'):
+                self.order_book.add(event)
+                return
+            if self._delay([event]):
+                return
+            if self.slippage_type == 'volume':
+                self.pending_orders.append(event)
+                return
+            quantity = event.quantity
+            if self.tradability is not None:
+                index = self.symbol_index[event.symbol]
+                quantity = self._tradable_quantities([index], [quantity], [event.direction])[0]
+                if quantity < event.quantity:
+                    self.rejected_orders.append(event)
+                    if quantity == 0:
+                        return
+            self.commission = self._get_commission_commission(event, quantity=quantity)
             # assert type(self.commission) is float, 'Commission should be float'
             timeindex = self.bars.get_latest_bars(event.symbol)[0][1]  # 成交实际上发生在下一根K bar
             fill_event = FillEvent(timeindex, event.symbol, 'SimulatedExchange',
-                                   event.quantity, event.direction, self.fill_price,
+                                   quantity, event.direction, self.fill_price,
+                                   self.commission)
+            if self.tradability is not None:
+                self._record_fills([index], [quantity], [event.direction], timeindex)
+            self.events.put(fill_event)
+
+    def execute_batch(self, event):
+        """
+        同一时刻的全部订单一起定价：市价单用向量化的滑点和费率计算，产生一个FillBatch
+        限价单和止损单加入挂单簿；成交量滑点模型下市价单交给execute_pending
+        参数：
+        event: OrderBatch事件
+        """
+        if event.type == 'ORDER_BATCH':
+            orders = []
+            for order in event.orders:
+                if order.order_type in ('LMT', 'STP'):
+                    self.order_book.add(order)
+                else:
+                    orders.append(order)
+            if not orders or self._delay(orders):
+                return
+            if self.slippage_type == 'volume':
+                self.pending_orders.extend(orders)
+                return
+            self._fill_market_orders(orders, 'close')
+
+    def _delay(self, orders):
+        """
+        设置了fill_delay时把市价单交给scheduler，返回是否已延迟
+        回测结束（scheduler关闭）后不再延迟
+        """
+        if self.fill_delay is None or self.scheduler is None:
+            return False
+        due = self.bars.get_latest_bar_datetime(orders[0].symbol) + self.fill_delay
+        return self.scheduler.schedule(due, self._execute_delayed, orders)
+
+    def _execute_delayed(self, orders):
+        """
+        延迟的市价单到期：以当前bar的开盘价成交，成交量滑点模型下加入该时刻的批量成交
+        """
+        if self.slippage_type == 'volume':
+            self.pending_orders.extend(orders)
+        else:
+            self._fill_market_orders(orders, 'open')
+
+    def _fill_market_orders(self, orders, field):
+        """
+        以最新bar的field（'close'或'open'）价格考虑滑点成交一批市价单，产生一个FillBatch
+        """
+        index = np.array([self.symbol_index[o.symbol] for o in orders])
+        directions = np.array([o.direction for o in orders])
+        quantities = np.array([o.quantity for o in orders], dtype=float)
+        prices = self.bars.get_latest_bar_values(field)[index]
+        if self.slippage_type == 'fixed':
+            prices = self.slippage_models['fixed'].get_trade_prices(prices, directions)
+        if self.tradability is not None:
+            allowed = self._tradable_quantities(index, quantities, directions)
+            self.rejected_orders.extend(o for o, a, q in zip(orders, allowed, quantities) if a < q)
+            keep = (allowed > 0) | (quantities == 0)
+            if not keep.any():
+                return
+            orders = [o for o, k in zip(orders, keep) if k]
+            quantities, prices = allowed[keep], prices[keep]
+        self._put_fill_batch(orders, quantities, prices)
+
+    def _put_fill_batch(self, orders, quantities, fill_prices):
+        """
+        计算一批成交的手续费，放入一个FillBatch事件
+        """
+        symbols = [o.symbol for o in orders]
+        directions = np.array([o.direction for o in orders])
+        if self.commission_type == 'default':
+            commissions = self.fee_schedule.get_commissions(symbols, quantities, fill_prices, directions)
+        else:
+            commissions = np.zeros(len(orders))
+        timeindex = self.bars.get_latest_bar_datetime(symbols[0])
+        if self.tradability is not None:
+            self._record_fills([self.symbol_index[s] for s in symbols], quantities, directions, timeindex)
+        self.events.put(FillBatch(timeindex, symbols, 'SimulatedExchange', quantities,
+                                  directions, fill_prices, commissions))
+
+    def update_bar(self, event):
+        """
+        撤销到期的挂单，并用新bar的最高价、最低价撮合该symbol的挂单
+        限价单以限价或更优的开盘价成交；止损单触发后以止损价或更差的开盘价按市价考虑滑点成交
+        """
+        bar = event.bar
+        self.order_book.expire(bar[1])
+        for order in self.order_book.match(bar[0], bar[3], bar[4]):
+            if self.tradability is not None:
+                index = self.symbol_index[order.symbol]
+                if self._tradable_quantities([index], [order.quantity], [order.direction])[0] < order.quantity:
+                    self.order_book.restore(order)  # 不能成交，按原有的优先级继续挂单
+                    continue
+            buy = order.direction == 'BUY'
+            if order.order_type == 'LMT':
+                fill_price = min(bar[2], order.price) if buy else max(bar[2], order.price)
+            else:
+                fill_price = max(bar[2], order.price) if buy else min(bar[2], order.price)
+                fill_price = self._trade_with_slippage(order, fill_price)
+            self.commission = self._get_commission_commission(order, fill_price)
+            fill_event = FillEvent(bar[1], order.symbol, 'SimulatedExchange',
+                                   order.quantity, order.direction, self.fill_price,
                                    self.commission)
+            if self.tradability is not None:
+                self._record_fills([index], [order.quantity], [order.direction], bar[1])
             self.events.put(fill_event)
+
+    def cancel_order(self, order_id):
+        """
+        撤销挂单或部分成交的剩余订单，返回被撤销的OrderEvent，已成交或不存在时返回None
+        """
+        for i, order in enumerate(self.pending_orders):
+            if order.order_id == order_id:
+                return self.pending_orders.pop(i)
+        return self.order_book.cancel(order_id)
+
+    def cancel_all(self):
+        """
+        撤销全部挂单和部分成交的剩余订单
+        """
+        self.order_book = OrderBook()
+        self.pending_orders = []
+
+    def execute_pending(self, final=False):
+        """
+        成交量滑点模型下，对该时刻的全部市价单（含之前未成交的剩余部分）一次性计算成交价和成交数量，
+        成交结果放入一个FillBatch，未成交的部分保留到下一根bar
+        参数：
+        final: 为True时（强制平仓）忽略成交量限制，以收盘价全部成交（仍受tradability限制）
+        """
+        if not self.pending_orders:
+            return
+        orders = self.pending_orders
+        index = np.array([self.symbol_index[o.symbol] for o in orders])
+        prices = self.bars.get_latest_bar_values('close')[index]
+        quantities = np.array([o.quantity for o in orders], dtype=float)
+        directions = np.array([o.direction for o in orders])
+        tradable = self._tradable_quantities(index, quantities, directions)
+
+        if final:
+            fill_prices, filled = prices, tradable
+        else:
+            volumes = self.bars.get_latest_bar_values('volume')[index]
+            lots = registry.array('lot_size')[self.symbol_ids[index]]
+            fill_prices, filled = self.slippage_models['volume'].get_trade_prices(
+                prices, tradable, volumes, directions, groups=index, lots=lots)
+
+        self.pending_orders = []
+        done = (filled > 0) | (quantities == 0)
+        if done.any():
+            self._put_fill_batch([o for o, d in zip(orders, done) if d],
+                                 filled[done], fill_prices[done])
+        for order, quantity in zip(orders, filled):
+            if quantity < order.quantity:
+                order.quantity -= quantity
+                self.pending_orders.append(order)
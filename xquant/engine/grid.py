@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+"""
+MovingAverageCrossGrid 双均线策略参数网格的矢量化评估
+对收盘价只做一次累加和，由其差分得到全部窗口长度的均线，对全部(short_window, long_window)组合
+一次产生金叉/死叉信号的布尔数组，并以矢量化的收益近似得到资金曲线和夏普率、最大回撤，
+用于快速画出参数热力图，再用Backtest/ParameterSweep精确回测感兴趣的参数
+
+示例：
+grid = MovingAverageCrossGrid(bars, range(2, 52), range(5, 105, 2),
+                              slippage_type='fixed', commission_type='default')
+grid.evaluate()
+sharpe = grid.heatmap('sharpe')  # index为short_window，columns为long_window
+
+与MovingAverageCrossStrategy + BasicPortfolio + SimulatedExecutionHandler的差别（近似）：
+1. 每个symbol单独以全部资金交易，不取整手
+2. 在信号bar的收盘价考虑固定比例滑点成交；手续费只计FeeSchedule中按金额和股数的比例部分，忽略最低收费
+3. 均线由累加和的差分得到，与逐bar的增量计算一样，差值在indicator.TIE_TOLERANCE倍价格以内时视为相等
+
+@author: Leon Zhang
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from .commission import FeeSchedule
+from .indicator import without_ties
+from .slippage import FixedPercentSlippage
+
+
+METRICS = ('return', 'sharpe', 'max_dd', 'trades')
+
+
+class MovingAverageCrossGrid(object):
+    """
+    双均线策略在(short_window, long_window)网格上的矢量化评估
+    """
+    def __init__(self, close, short_windows, long_windows, slippage_type='zero',
+                 commission_type='zero', fee_rates=None, periods=252, chunk_size=256):
+        """
+        参数：
+        close: 收盘价，(时间 × symbol)的DataFrame，或已加载数据的DataHandler
+        short_windows, long_windows: 短期、长期均线长度的序列
+        slippage_type: 'zero'或'fixed'，同Backtest
+        commission_type: 'zero'或'default'，同Backtest
+        fee_rates: commission_type为'default'时的费率表，见commission.FeeSchedule
+        periods: 计算年化夏普率的周期数，见finance.perform.perform_metrics
+        chunk_size: 每次同时计算的symbol数，限制内存占用
+        """
+        if hasattr(close, 'data_array'):
+            close = pd.DataFrame(close.data_array[:, :, close.field_index['close']],
+                                 index=close.datetime_index, columns=close.symbol_list)
+        if slippage_type not in ('zero', 'fixed'):
+            raise ValueError('Unsupported slippage type for grid evaluation: %s' % slippage_type)
+
+        self.index = close.index
+        self.symbols = list(close.columns)
+        self.close = close.values.astype(np.float64)
+        self.short_windows = np.asarray(short_windows, dtype=int)
+        self.long_windows = np.asarray(long_windows, dtype=int)
+        self.periods = periods
+        self.chunk_size = chunk_size
+
+        self.slippage = FixedPercentSlippage().rate if slippage_type == 'fixed' else 0.0
+        # 每个symbol的费率：(印花税, 过户费率（按股数）, 佣金率)
+        if commission_type == 'default':
+            schedule = FeeSchedule(fee_rates)
+            table = schedule.table[[schedule._rate_index(s) for s in self.symbols]]
+            self.fee_rates = table[:, [0, 1, 3]]
+        else:
+            self.fee_rates = np.zeros((len(self.symbols), 3))
+
+        self.metrics = None
+
+    @staticmethod
+    def moving_averages(close, windows):
+        """
+        由一次累加和得到全部窗口长度的简单移动平均
+        参数：
+        close: (时间, symbol)的数组，nan表示尚无数据
+        windows: 窗口长度的数组
+        返回：
+        (窗口数, 时间, symbol)的数组，窗口内有nan时为nan
+        """
+        valid = ~np.isnan(close)
+        # 减去每列的首个有效值以减小累加和的量级，提高差分的精度
+        first = close[valid.argmax(axis=0), np.arange(close.shape[1])]
+        base = np.where(valid.any(axis=0), first, 0.0)
+        csum = np.vstack([np.zeros((1, close.shape[1])), np.cumsum(np.where(valid, close - base, 0.0), axis=0)])
+        count = np.vstack([np.zeros((1, close.shape[1]), dtype=int), np.cumsum(valid, axis=0)])
+
+        T = close.shape[0]
+        result = np.full((len(windows),) + close.shape, np.nan)
+        for i, w in enumerate(windows):
+            if w > T:
+                continue
+            full = (count[w:] - count[:-w]) == w
+            result[i, w - 1:] = np.where(full, (csum[w:] - csum[:-w]) / w + base, np.nan)
+        return result
+
+    @staticmethod
+    def crossovers(ma_short, ma_long, close):
+        """
+        金叉、死叉信号，规则同MovingAverageCrossStrategy：差值由负变正为金叉，由正变负为死叉，
+        差值在容差以内时视为0，见indicator.without_ties
+        参数：
+        ma_short: (时间, symbol)的短期均线
+        ma_long: (长期窗口数, 时间, symbol)的长期均线
+        close: (时间, symbol)的收盘价
+        返回：
+        (up, down)，与ma_long形状相同的布尔数组
+        """
+        diff = without_ties(ma_short[np.newaxis] - ma_long, close[np.newaxis])
+        prev = np.concatenate([np.full(diff[:, :1].shape, np.nan), diff[:, :-1]], axis=1)
+        with np.errstate(invalid='ignore'):
+            up = (diff > 0) & (prev < 0)
+            down = (diff < 0) & (prev > 0)
+        return up, down
+
+    @staticmethod
+    def positions(up, down):
+        """
+        持仓状态：最近一次信号为金叉时持有，为死叉或尚无信号时空仓
+        """
+        T = up.shape[1]
+        t = np.arange(T, dtype=np.int32).reshape((1, T) + (1,) * (up.ndim - 2))
+        last_up = np.maximum.accumulate(np.where(up, t, -1), axis=1)
+        last_down = np.maximum.accumulate(np.where(down, t, -1), axis=1)
+        return last_up > last_down
+
+    def signals(self, short_window):
+        """
+        某一短期均线长度与全部长期均线长度组合的买入、卖出信号
+        返回：
+        (entries, exits)，(长期窗口数, 时间, symbol)的布尔数组
+        """
+        ma_short = self.moving_averages(self.close, [short_window])[0]
+        ma_long = self.moving_averages(self.close, self.long_windows)
+        held = self.positions(*self.crossovers(ma_short, ma_long, self.close))
+        prev = np.concatenate([np.zeros_like(held[:, :1]), held[:, :-1]], axis=1)
+        return held & ~prev, ~held & prev
+
+    def _score(self, close, ma_short, ma_long, fee_rates):
+        """
+        一组symbol上一个短期窗口与全部长期窗口的指标，返回{指标: (长期窗口数, symbol数)}
+        """
+        held = self.positions(*self.crossovers(ma_short, ma_long, close))
+        prev = np.concatenate([np.zeros_like(held[:, :1]), held[:, :-1]], axis=1)
+        entries = held & ~prev
+        exits = ~held & prev
+        exits[:, -1] |= held[:, -1]  # 回测结束时平仓
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            log_ret = np.log(close[1:] / close[:-1])
+            buy_cost = fee_rates[:, 2] + fee_rates[:, 1] / close
+            sell_cost = fee_rates[:, 0] + fee_rates[:, 2] + fee_rates[:, 1] / close
+        log_ret = np.vstack([np.zeros((1, close.shape[1])), np.where(np.isnan(log_ret), 0.0, log_ret)])
+        entry_growth = np.nan_to_num(-np.log1p(self.slippage) + np.log1p(-buy_cost))
+        exit_growth = np.nan_to_num(np.log1p(-self.slippage) + np.log1p(-sell_cost))
+
+        growth = np.where(prev, log_ret, 0.0)
+        growth[entries] += np.broadcast_to(entry_growth, growth.shape)[entries]
+        growth[exits] += np.broadcast_to(exit_growth, growth.shape)[exits]
+        log_equity = np.cumsum(growth, axis=1)
+
+        # 每个bar的收益率，夏普率同finance.perform.perform_metrics（总体标准差）
+        returns = np.expm1(growth[:, 1:])
+        n = returns.shape[1]
+        mean = returns.sum(axis=1) / n
+        std = np.sqrt(np.maximum(np.einsum('ltn,ltn->ln', returns, returns) / n - mean * mean, 0.0))
+        max_dd = np.expm1((log_equity - np.maximum.accumulate(log_equity, axis=1)).min(axis=1))
+        return {'return': np.expm1(log_equity[:, -1]),
+                'sharpe': np.sqrt(self.periods) * mean / std,
+                'max_dd': max_dd,
+                'trades': entries.sum(axis=1) + exits.sum(axis=1)}
+
+    def evaluate(self):
+        """
+        评估全部参数组合，结果保存在metrics中
+        返回：
+        {指标: (短期窗口数, 长期窗口数, symbol数)的数组}，指标见METRICS
+        """
+        S, L, N = len(self.short_windows), len(self.long_windows), len(self.symbols)
+        metrics = {m: np.full((S, L, N), np.nan) for m in METRICS}
+        windows = np.union1d(self.short_windows, self.long_windows)
+        for start in range(0, N, self.chunk_size):
+            cols = slice(start, start + self.chunk_size)
+            close = self.close[:, cols]
+            ma = self.moving_averages(close, windows)
+            ma_long = ma[np.searchsorted(windows, self.long_windows)]
+            for i, w in enumerate(self.short_windows):
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    scores = self._score(close, ma[np.searchsorted(windows, w)], ma_long,
+                                         self.fee_rates[cols])
+                for m in METRICS:
+                    metrics[m][i, :, cols] = scores[m]
+        self.metrics = metrics
+        return metrics
+
+    def heatmap(self, metric='sharpe', symbol=None):
+        """
+        某一指标的热力图数据，index为short_window，columns为long_window
+        参数：
+        symbol: 只看某个symbol，默认为全部symbol的平均
+        """
+        if self.metrics is None:
+            self.evaluate()
+        values = self.metrics[metric]
+        if symbol is None:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)  # 全部symbol均无数据的组合为nan
+                values = np.nanmean(values, axis=2)
+        else:
+            values = values[:, :, self.symbols.index(symbol)]
+        return pd.DataFrame(values, index=pd.Index(self.short_windows, name='short_window'),
+                            columns=pd.Index(self.long_windows, name='long_window'))
+
+    def to_frame(self):
+        """
+        全部结果的长表，index为(short_window, long_window, symbol)，列为METRICS
+        """
+        if self.metrics is None:
+            self.evaluate()
+        index = pd.MultiIndex.from_product([self.short_windows, self.long_windows, self.symbols],
+                                           names=['short_window', 'long_window', 'symbol'])
+        return pd.DataFrame({m: self.metrics[m].ravel() for m in METRICS}, index=index,
+                            columns=list(METRICS))
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+"""
+增量计算的技术指标，用于事件驱动的策略
+每个指标以numpy数组保存全部symbol的状态，每个时刻调用一次update()，
+传入按symbol_list排列的最新价格数组，即更新整个股票池，代价与窗口长度无关
+
+示例：
+ma = SMA(len(symbol_list), 10)
+close = bars.get_latest_bar_values('close')  # 每个时刻一次
+value = ma.update(close)                      # 数据不足窗口长度的symbol为nan
+
+输入中为nan的symbol（如尚未上市）不更新状态
+Donchian通道需要窗口内的最大、最小值，每次为对窗口数组的一次numpy归约
+增量维护的和有约1e-15量级的浮点误差，比较两个指标（如均线交叉）时用without_ties把误差范围内的差值视为0
+
+@author: Leon Zhang
+"""
+
+import numpy as np
+
+TIE_TOLERANCE = 1e-9  # 相对于价格的容差，差值的绝对值不超过price * TIE_TOLERANCE时视为相等
+
+
+def without_ties(diff, price, eps=TIE_TOLERANCE):
+    """
+    两个指标的差值，绝对值不超过eps * |price|时置为0，nan保持不变
+    增量计算与重新计算（或累加和的差分）得到的均线在恰好相等时符号可能不同，比较前先去掉这一误差
+    参数：
+    diff: 指标之差的数组
+    price: 与diff形状相同（或可广播）的价格数组，决定容差的量级
+    """
+    diff = np.asarray(diff, dtype=float)
+    with np.errstate(invalid='ignore'):
+        return np.where(np.abs(diff) <= eps * np.abs(price), 0.0, diff)
+
+
+class _Window(object):
+    """
+    每个symbol一个长度为period的环形缓冲区，同时维护窗口内的和与平方和
+    """
+    # 每隔若干次更新从缓冲区重新求和，消除累加的浮点误差
+    RESUM_INTERVAL = 1000
+
+    def __init__(self, size, period):
+        self.period = period
+        self.buf = np.full((period, size), np.nan)
+        self.pos = np.zeros(size, dtype=np.intp)
+        self.count = np.zeros(size, dtype=np.intp)
+        self.sum = np.zeros(size)
+        self.sumsq = np.zeros(size)
+        self.cols = np.arange(size)
+        self._pushes = 0
+
+    def push(self, x):
+        x = np.asarray(x, dtype=float)
+        valid = ~np.isnan(x)
+        if valid.all():
+            cols, pos, count = self.cols, self.pos, self.count
+        else:
+            cols, pos, count, x = self.cols[valid], self.pos[valid], self.count[valid], x[valid]
+        old = np.where(count >= self.period, self.buf[pos, cols], 0.0)
+        self.sum[cols] += x - old
+        self.sumsq[cols] += x * x - old * old
+        self.buf[pos, cols] = x
+        self.pos[cols] = (pos + 1) % self.period
+        self.count[cols] = count + 1
+
+        self._pushes += 1
+        if self._pushes % self.RESUM_INTERVAL == 0:
+            self.sum = np.nansum(self.buf, axis=0)
+            self.sumsq = np.nansum(self.buf * self.buf, axis=0)
+
+    @property
+    def ready(self):
+        return self.count >= self.period
+
+    def mean(self):
+        return np.where(self.ready, self.sum / self.period, np.nan)
+
+    def std(self, ddof=1):
+        n = self.period
+        var = (self.sumsq - self.sum * self.sum / n) / (n - ddof)
+        return np.where(self.ready, np.sqrt(np.maximum(var, 0.0)), np.nan)
+
+    def max(self):
+        return np.where(self.ready, np.fmax.reduce(self.buf, axis=0), np.nan)
+
+    def min(self):
+        return np.where(self.ready, np.fmin.reduce(self.buf, axis=0), np.nan)
+
+
+class _EWM(object):
+    """
+    指数加权平均，与pandas的ewm(alpha=alpha, adjust=True).mean()相同
+    """
+    def __init__(self, size, alpha):
+        self.decay = 1.0 - alpha
+        self.num = np.zeros(size)
+        self.den = np.zeros(size)
+        self.count = np.zeros(size, dtype=np.intp)
+
+    def push(self, x):
+        x = np.asarray(x, dtype=float)
+        valid = ~np.isnan(x)
+        self.num = np.where(valid, x + self.decay * self.num, self.num)
+        self.den = np.where(valid, 1.0 + self.decay * self.den, self.den)
+        self.count += valid
+
+    def mean(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.num / self.den
+
+
+class Indicator(object):
+    """
+    增量指标的基类
+    """
+    def __init__(self, size, period):
+        """
+        参数：
+        size: symbol的个数
+        period: 窗口长度
+        """
+        self.size = size
+        self.period = period
+        self.value = np.full(size, np.nan)
+
+    def update(self, *args):
+        """
+        用每个symbol最新bar的数据更新指标，返回更新后的指标值
+        """
+        raise NotImplementedError("Should implement update()!")
+
+
+class SMA(Indicator):
+    """
+    简单移动平均
+    """
+    def __init__(self, size, period):
+        super(SMA, self).__init__(size, period)
+        self.window = _Window(size, period)
+
+    def update(self, price):
+        self.window.push(price)
+        self.value = self.window.mean()
+        return self.value
+
+
+class EMA(Indicator):
+    """
+    指数移动平均，alpha = 2 / (period + 1)，同pandas的ewm(span=period)，前period个bar为nan
+    """
+    def __init__(self, size, period):
+        super(EMA, self).__init__(size, period)
+        self.ewm = _EWM(size, 2.0 / (period + 1))
+
+    def update(self, price):
+        self.ewm.push(price)
+        self.value = np.where(self.ewm.count >= self.period, self.ewm.mean(), np.nan)
+        return self.value
+
+
+class STD(Indicator):
+    """
+    滚动标准差，ddof默认为1，同pandas的rolling(period).std()
+    """
+    def __init__(self, size, period, ddof=1):
+        super(STD, self).__init__(size, period)
+        self.ddof = ddof
+        self.window = _Window(size, period)
+
+    def update(self, price):
+        self.window.push(price)
+        self.value = self.window.std(self.ddof)
+        return self.value
+
+
+class ATR(Indicator):
+    """
+    平均真实波幅（Wilder），真实波幅为max(high, 前收盘) - min(low, 前收盘)，以alpha = 1 / period平滑
+    """
+    def __init__(self, size, period=14):
+        super(ATR, self).__init__(size, period)
+        self.ewm = _EWM(size, 1.0 / period)
+        self.prev_close = np.full(size, np.nan)
+
+    def update(self, high, low, close):
+        prev = np.where(np.isnan(self.prev_close), close, self.prev_close)
+        tr = np.maximum(high, prev) - np.minimum(low, prev)
+        self.ewm.push(tr)
+        self.prev_close = np.where(np.isnan(close), self.prev_close, close)
+        self.value = np.where(self.ewm.count >= self.period, self.ewm.mean(), np.nan)
+        return self.value
+
+
+class RSI(Indicator):
+    """
+    相对强弱指数（Wilder），0~100，涨幅和跌幅以alpha = 1 / period平滑
+    """
+    def __init__(self, size, period=14):
+        super(RSI, self).__init__(size, period)
+        self.gain = _EWM(size, 1.0 / period)
+        self.loss = _EWM(size, 1.0 / period)
+        self.prev_close = np.full(size, np.nan)
+
+    def update(self, price):
+        diff = price - self.prev_close
+        self.gain.push(np.where(np.isnan(diff), np.nan, np.maximum(diff, 0.0)))
+        self.loss.push(np.where(np.isnan(diff), np.nan, np.maximum(-diff, 0.0)))
+        self.prev_close = np.where(np.isnan(price), self.prev_close, price)
+
+        gain, loss = self.gain.mean(), self.loss.mean()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rsi = np.where(gain + loss > 0, 100.0 * gain / (gain + loss), 50.0)
+        self.value = np.where(self.gain.count >= self.period, rsi, np.nan)
+        return self.value
+
+
+class MACD(Indicator):
+    """
+    MACD：快、慢EMA之差，信号线为其EMA，柱为两者之差
+    update()返回(macd, signal, hist)
+    """
+    def __init__(self, size, fast=12, slow=26, signal=9):
+        super(MACD, self).__init__(size, slow)
+        self.fast = EMA(size, fast)
+        self.slow = EMA(size, slow)
+        self.signal = EMA(size, signal)
+        self.value = (self.value, self.value, self.value)
+
+    def update(self, price):
+        macd = self.fast.update(price) - self.slow.update(price)
+        signal = self.signal.update(macd)
+        self.value = (macd, signal, macd - signal)
+        return self.value
+
+
+class Bollinger(Indicator):
+    """
+    布林带：中轨为SMA，上下轨为中轨加减k倍滚动标准差
+    update()返回(middle, upper, lower)
+    """
+    def __init__(self, size, period=20, k=2.0, ddof=1):
+        super(Bollinger, self).__init__(size, period)
+        self.k = k
+        self.ddof = ddof
+        self.window = _Window(size, period)
+        self.value = (self.value, self.value, self.value)
+
+    def update(self, price):
+        self.window.push(price)
+        middle = self.window.mean()
+        width = self.k * self.window.std(self.ddof)
+        self.value = (middle, middle + width, middle - width)
+        return self.value
+
+
+class Donchian(Indicator):
+    """
+    唐奇安通道：窗口内最高价的最大值和最低价的最小值
+    update()返回(upper, lower)
+    """
+    def __init__(self, size, period=20):
+        super(Donchian, self).__init__(size, period)
+        self.highs = _Window(size, period)
+        self.lows = _Window(size, period)
+        self.value = (self.value, self.value)
+
+    def update(self, high, low):
+        self.highs.push(high)
+        self.lows.push(low)
+        self.value = (self.highs.max(), self.lows.min())
+        return self.value
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+"""
+OrderBook 模拟交易所中的挂单簿
+限价单（'LMT'）和止损单（'STP'）按symbol分别存放在以价格排序的堆中，
+每根新的bar只弹出被穿越的挂单，撮合成本与成交数量相关，而与挂单总数无关
+
+撮合规则（用bar的最高价、最低价判断是否穿越）：
+买入限价：low <= price      卖出限价：high >= price
+买入止损：high >= price     卖出止损：low <= price
+
+撤销和到期的订单在堆中惰性删除，失效的条目超过堆大小的一定比例时重建堆，避免长时间运行后堆不断增长
+
+@author: Leon Zhang
+"""
+
+import heapq
+import itertools
+
+COMPACT_RATIO = 0.5  # 失效条目超过该比例时重建堆
+COMPACT_MIN = 64     # 失效条目少于该数量时不重建
+
+
+class SymbolBook(object):
+    """
+    单个symbol的挂单，四个堆的堆顶都是最先被穿越的挂单
+    """
+    def __init__(self):
+        self.buy_limit = []   # (-price, seq, order)，最高的买价先成交
+        self.sell_limit = []  # (price, seq, order)，最低的卖价先成交
+        self.buy_stop = []    # (price, seq, order)，最低的止损价先触发
+        self.sell_stop = []   # (-price, seq, order)，最高的止损价先触发
+        self.stale = 0        # 四个堆中已撤销或到期的条目数
+
+    def __len__(self):
+        return len(self.buy_limit) + len(self.sell_limit) + len(self.buy_stop) + len(self.sell_stop)
+
+    def heap_for(self, order):
+        """
+        返回order所在的堆以及堆中使用的排序键
+        """
+        if order.order_type == 'LMT':
+            if order.direction == 'BUY':
+                return self.buy_limit, -order.price
+            return self.sell_limit, order.price
+        if order.direction == 'BUY':
+            return self.buy_stop, order.price
+        return self.sell_stop, -order.price
+
+    def compact(self, live):
+        """
+        重建四个堆，只保留live（order_id -> 有效挂单）中的订单
+        """
+        for heap in (self.buy_limit, self.sell_limit, self.buy_stop, self.sell_stop):
+            heap[:] = [entry for entry in heap if live.get(entry[2].order_id) is entry[2]]
+            heapq.heapify(heap)
+        self.stale = 0
+
+
+class OrderBook(object):
+    """
+    全部symbol的挂单簿，撤单采用惰性删除：撤销的订单只做标记，在到达堆顶时丢弃，
+    失效的条目过多时重建所在的堆
+    """
+    def __init__(self):
+        self.books = {}
+        self.orders = {}    # order_id -> 有效的挂单
+        self.expiries = []  # (expiry, seq, order)
+        self.crossed = {}   # order_id -> (堆, 条目)，最近一次match弹出的订单，用于restore
+        self._stale_expiries = 0
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.orders)
+
+    def add(self, order):
+        """
+        加入一个限价或止损挂单
+        """
+        if order.price is None:
+            raise ValueError('%s order needs a price: %s' % (order.order_type, order.order_id))
+        book = self.books.get(order.symbol)
+        if book is None:
+            book = self.books[order.symbol] = SymbolBook()
+        heap, key = book.heap_for(order)
+        seq = next(self._seq)
+        heapq.heappush(heap, (key, seq, order))
+        if order.expiry is not None:
+            heapq.heappush(self.expiries, (order.expiry, seq, order))
+        self.orders[order.order_id] = order
+
+    def cancel(self, order_id):
+        """
+        撤单，返回被撤销的订单，订单不存在（已成交或已撤销）时返回None
+        """
+        order = self.orders.pop(order_id, None)
+        if order is not None:
+            self._mark_stale(order)
+            if order.expiry is not None:
+                self._stale_expiry(1)
+        return order
+
+    def expire(self, dt):
+        """
+        撤销所有到期时间早于dt的挂单，返回被撤销的订单list
+        """
+        expired = []
+        while self.expiries and self.expiries[0][0] < dt:
+            order = heapq.heappop(self.expiries)[2]
+            if self.orders.get(order.order_id) is order:
+                del self.orders[order.order_id]
+                self._mark_stale(order)
+                expired.append(order)
+            else:
+                self._stale_expiries -= 1
+        return expired
+
+    def restore(self, order):
+        """
+        放回最近一次match弹出的订单（如不能成交），保留原有的时间优先级和到期时间
+        """
+        heap, entry = self.crossed.pop(order.order_id)
+        heapq.heappush(heap, entry)
+        self.orders[order.order_id] = order
+        if order.expiry is not None:
+            self._stale_expiries -= 1  # 到期堆中原有的条目重新有效
+
+    def _mark_stale(self, order):
+        """
+        order已从挂单中移除但仍在价格堆中，失效条目过多时重建该symbol的堆
+        """
+        book = self.books[order.symbol]
+        book.stale += 1
+        if book.stale > COMPACT_MIN and book.stale > COMPACT_RATIO * len(book):
+            book.compact(self.orders)
+
+    def _stale_expiry(self, count):
+        """
+        到期堆中增加了count个失效条目，过多时重建到期堆
+        match弹出、尚未确定是否restore的订单保留在到期堆中，在restore前仍计为失效
+        """
+        self._stale_expiries += count
+        if self._stale_expiries > COMPACT_MIN and self._stale_expiries > COMPACT_RATIO * len(self.expiries):
+            self.expiries = [entry for entry in self.expiries
+                             if self.orders.get(entry[2].order_id) is entry[2] or entry[2].order_id in self.crossed]
+            heapq.heapify(self.expiries)
+            self._stale_expiries = sum(1 for entry in self.expiries if entry[2].order_id in self.crossed)
+
+    def _pop_crossed(self, book, heap, crossed):
+        """
+        弹出堆中所有满足crossed(键)的有效挂单
+        """
+        filled = []
+        while heap and crossed(heap[0][0]):
+            entry = heapq.heappop(heap)
+            order = entry[2]
+            if self.orders.get(order.order_id) is order:
+                del self.orders[order.order_id]
+                self.crossed[order.order_id] = (heap, entry)
+                filled.append(order)
+            else:
+                book.stale -= 1
+        return filled
+
+    def match(self, symbol, high, low):
+        """
+        用bar的最高价、最低价撮合symbol的挂单，返回被穿越的订单list（已从挂单簿中移除，可用restore放回）
+        """
+        self.crossed = {}
+        book = self.books.get(symbol)
+        if book is None:
+            return []
+        filled = (self._pop_crossed(book, book.buy_limit, lambda key: low <= -key) +
+                  self._pop_crossed(book, book.sell_limit, lambda key: high >= key) +
+                  self._pop_crossed(book, book.buy_stop, lambda key: high >= key) +
+                  self._pop_crossed(book, book.sell_stop, lambda key: low <= -key))
+        # 成交的订单在到期堆中的条目失效
+        expiring = sum(1 for order in filled if order.expiry is not None)
+        if expiring:
+            self._stale_expiry(expiring)
+        return filled
@@ -8,7 +8,14 @@ Portfolio抽象基类/类
 """
 
 from abc import ABCMeta, abstractmethod
-from .event import OrderEvent
+
+import numpy as np
+
+from .event import OrderEvent, OrderBatch
+from .aggregator import OrderAggregator
+from .commission import FeeSchedule
+from .sink import MemorySink
+from ..utils.symbol import registry
 
 
 class Portfolio(object):
@@ -18,6 +25,7 @@ class Portfolio(object):
     考虑支持Tick?
     """
     __metaclass__ = ABCMeta
+    scheduler = None  # Backtest设置的Scheduler对象，见scheduler模块
 
     @abstractmethod
     def update_signal(self, event):
@@ -33,13 +41,33 @@ class Portfolio(object):
         """
         raise NotImplementedError("Should implement update_fill()!")
 
+    def update_fill_batch(self, event):
+        """
+        从FillBatch中更新组合，默认逐个调用update_fill
+        """
+        for fill in event.fills():
+            self.update_fill(fill)
+
+    def update_rebalance(self, event):
+        """
+        从RebalanceEvent的目标权重产生调仓订单
+        """
+        raise NotImplementedError("Should implement update_rebalance()!")
+
+    def flush_orders(self):
+        """
+        每个时刻的事件处理完后调用，发出该时刻积累的订单，默认什么也不做
+        """
+        pass
+
 
 class BasicPortfolio(Portfolio):
     """
     BasicPortfolio发送orders给brokerage对象，这里简单地使用固定的数量，
     不进行任何风险管理或仓位管理（这是不现实的！），仅供测试使用
     """
-    def __init__(self, bars, events, start_date, initial_capital=1.0e5):
+    def __init__(self, bars, events, start_date, initial_capital=1.0e5, sink=None, batch_orders=False,
+                 net_orders=False, risk_manager=None, fee_rates=None):
         """
         使用bars和event队列初始化portfolio，同时包含起始时间和初始资本
         参数：
@@ -47,6 +75,12 @@ class BasicPortfolio(Portfolio):
         events: Event queue对象
         start_date: 组合起始的时间
         initial_capital: 起始的资本
+        sink: ResultSink对象，存储头寸、持仓市值、交易和信号记录，默认为内存中的MemorySink
+        batch_orders: True则同一时刻的订单合并为一个OrderBatch，在该时刻结束时发出，
+                      可用functools.partial(BasicPortfolio, batch_orders=True)传给Backtest
+        net_orders: True则同一时刻同一symbol的市价单在该时刻结束时轧差成一个订单，见OrderAggregator
+        risk_manager: RiskManager对象，该时刻结束时对全部订单做风险检查，None则不检查
+        fee_rates: 调仓时估算手续费的费率表，应与模拟交易所的一致，见commission.FeeSchedule
         """
         self.bars = bars
         self.events = events
@@ -54,15 +88,25 @@ class BasicPortfolio(Portfolio):
         self.start_date = start_date
         self.current_datetime = start_date
         self.initial_capital = initial_capital
+        self.sink = sink if sink is not None else MemorySink()
 
-        self.all_positions = self.construct_all_positions()
+        self.all_positions = self.sink.table('positions', self.construct_all_positions())
         self.current_positions = {s:0 for s in self.symbol_list}
 
-        self.all_holdings = self.construct_all_holdings()
+        self.all_holdings = self.sink.table('holdings', self.construct_all_holdings())
         self.current_holdings = self.construct_current_holdings()
 
-        self.all_signals = []
-        self.all_trades = []
+        self.all_signals = self.sink.table('signals')
+        self.all_trades = self.sink.table('trades')
+
+        self.batch_orders = batch_orders
+        self.pending_orders = OrderAggregator() if net_orders else []  # 该时刻积累的订单
+        self.risk_manager = risk_manager
+        self.defer_orders = batch_orders or net_orders or risk_manager is not None
+        self.symbol_index = {s: i for i, s in enumerate(self.symbol_list)}
+        symbol_ids = registry.symbol_ids(self.symbol_list)
+        self.lot_sizes = registry.array('lot_size')[symbol_ids]
+        self.fee_schedule = FeeSchedule(fee_rates)
 
     def construct_all_positions(self):
         """
@@ -191,6 +235,34 @@ class BasicPortfolio(Portfolio):
             self.update_holdings_from_fill(event)
             self.record_trades_from_fill(event)
 
+    def update_fill_batch(self, event):
+        """
+        从FillBatch中更新组合：同一symbol的多笔成交先合并，头寸、市值和现金各做一次更新
+        """
+        if event.type == 'FILL_BATCH':
+            signed = np.where(event.directions == 'BUY', 1.0, -1.0) * event.quantities
+            costs = signed * event.fill_prices
+            symbols, index = np.unique(event.symbols, return_inverse=True)
+            quantities = np.bincount(index, weights=signed, minlength=len(symbols))
+            values = np.bincount(index, weights=costs, minlength=len(symbols))
+            for symbol, quantity, value in zip(symbols, quantities, values):
+                self.current_positions[symbol] += quantity
+                self.current_holdings[symbol] += value
+
+            commission = event.commissions.sum()
+            self.current_holdings['commission'] += commission
+            self.current_holdings['cash'] -= (costs.sum() + commission)
+            self.current_holdings['total'] -= commission
+
+            self.all_trades.extend({'datetime': event.timeindex,
+                                    'symbol': event.symbols[i],
+                                    'exchange': event.exchange,
+                                    'quantity': event.quantities[i],
+                                    'direction': event.directions[i],
+                                    'fill_price': event.fill_prices[i],
+                                    'commission': event.commissions[i]}
+                                   for i in range(len(event)))
+
     def generate_naive_order(self, signal):
         """
         此函数未采取风险管理和仓位控制，实际流程应该是信号->风险控制->下单指令
@@ -207,10 +279,8 @@ class BasicPortfolio(Portfolio):
         delta_holdings = target_holdings - cur_holdings
         price = self.bars.get_latest_bar(symbol).close
         
-        if symbol.startswith(('0', '3', '6')):
-            mkt_quantity = ((delta_holdings / price) // 100) * 100
-        else:
-            mkt_quantity = delta_holdings // price
+        lot_size = registry.get(symbol).lot_size  # 如A股100股为一手
+        mkt_quantity = ((delta_holdings / price) // lot_size) * lot_size
 
         if direction == 'LONG':
             order = OrderEvent(symbol, order_type, abs(mkt_quantity), 'BUY' if mkt_quantity>0 else 'SELL')
@@ -223,6 +293,93 @@ class BasicPortfolio(Portfolio):
 
         return order
 
+    def position_array(self):
+        """
+        当前头寸，按symbol_list排列的numpy数组
+        """
+        return np.array([self.current_positions[s] for s in self.symbol_list], dtype=float)
+
+    def _weight_array(self, weights):
+        """
+        将字典、Series或数组形式的目标权重转换成按symbol_list排列的数组
+        """
+        if hasattr(weights, 'get'):
+            return np.array([weights.get(s, 0.0) for s in self.symbol_list], dtype=float)
+        weights = np.asarray(weights, dtype=float)
+        if weights.shape != (len(self.symbol_list),):
+            raise ValueError('Weights should have %d elements, got shape %s' %
+                             (len(self.symbol_list), weights.shape))
+        return weights
+
+    def rebalance(self, weights, cash_buffer=0.0):
+        """
+        按目标权重一次性调仓
+        以最新收盘价重新计算组合总值，向量化地得到各symbol的目标头寸（向零取整到整手），
+        买入金额和估算的手续费超过可用资金（现金+卖出所得-卖出手续费-预留）时按比例缩减买单，
+        先发出卖单再发出买单，权重不变的symbol不产生订单
+        手续费按fee_schedule以最新收盘价估算，滑点不在估算之内，需要时用cash_buffer预留
+        参数：
+        weights: 目标权重，见RebalanceEvent
+        cash_buffer: 预留现金占组合总值的比例，用于支付滑点等
+        返回：
+        发出的OrderEvent的list
+        """
+        weights = self._weight_array(weights)
+        prices = self.bars.get_latest_bar_values('close')
+        positions = self.position_array()
+        priced = ~np.isnan(prices)  # 尚无价格的symbol不计入总值，保持不变
+        total = self.current_holdings['cash'] + np.dot(positions[priced], prices[priced])
+
+        lots = self.lot_sizes
+        delta = np.zeros(len(prices))
+        delta[priced] = (np.trunc(weights[priced] * total / prices[priced] / lots[priced]) * lots[priced] -
+                         positions[priced])
+
+        buys = delta > 0
+        sells = delta < 0
+        available = (self.current_holdings['cash'] - total * cash_buffer -
+                     np.dot(delta[sells], prices[sells]) - self._estimate_fees(delta, prices, sells).sum())
+        cost = self._buy_cost(delta, prices, buys)
+        if cost > available:
+            scale = max(available, 0.0) / cost
+            delta[buys] = np.floor(delta[buys] * scale / lots[buys]) * lots[buys]
+            # 最低佣金使缩减后的费用比例偏高，逐手减少最大的买单直到资金足够
+            cost = self._buy_cost(delta, prices, buys)
+            while cost > available and (delta > 0).any():
+                i = np.argmax(np.where(delta > 0, delta * prices, -np.inf))
+                delta[i] -= lots[i]
+                cost = self._buy_cost(delta, prices, buys)
+
+        orders = []
+        for i in np.concatenate([np.flatnonzero(delta < 0), np.flatnonzero(delta > 0)]):
+            orders.append(OrderEvent(self.symbol_list[i], 'MKT', abs(delta[i]),
+                                     'BUY' if delta[i] > 0 else 'SELL'))
+        for order in orders:
+            self.put_order(order)
+        return orders
+
+    def _estimate_fees(self, delta, prices, mask):
+        """
+        以prices成交delta[mask]的估算手续费
+        """
+        index = np.flatnonzero(mask & (delta != 0))
+        return self.fee_schedule.get_commissions([self.symbol_list[i] for i in index], np.abs(delta[index]),
+                                                 prices[index], np.where(delta[index] > 0, 'BUY', 'SELL'))
+
+    def _buy_cost(self, delta, prices, buys):
+        """
+        买单的金额加估算的手续费
+        """
+        buys = buys & (delta > 0)
+        return np.dot(delta[buys], prices[buys]) + self._estimate_fees(delta, prices, buys).sum()
+
+    def update_rebalance(self, event):
+        """
+        通过RebalanceEvent对象调仓
+        """
+        if event.type == 'REBALANCE':
+            self.rebalance(event.weights, event.cash_buffer)
+
     def record_current_signal(self, signal):
         """
         从SignalEvent对象中读取全部数据作为信号记录
@@ -243,5 +400,38 @@ class BasicPortfolio(Portfolio):
         if event.type == 'SIGNAL':
             self.record_current_signal(event)
             order_event = self.generate_naive_order(event)
-            self.events.put(order_event)
+            self.put_order(order_event)
+
+    def put_order(self, order):
+        """
+        发出订单：batch_orders、net_orders或有risk_manager时暂存到该时刻结束，否则直接放入events队列
+        """
+        if not self.defer_orders:
+            self.events.put(order)
+        elif isinstance(self.pending_orders, OrderAggregator):
+            self.pending_orders.add(order)
+        else:
+            self.pending_orders.append(order)
+
+    def flush_orders(self):
+        """
+        发出该时刻积累的订单（net_orders模式下先轧差，再做风险检查），batch_orders模式下合并为一个OrderBatch
+        """
+        if not self.pending_orders:
+            return
+        if isinstance(self.pending_orders, OrderAggregator):
+            orders = self.pending_orders.net()
+        else:
+            orders, self.pending_orders = self.pending_orders, []
+        if self.risk_manager is not None:
+            orders = self.risk_manager.check(orders, self.symbol_index, self.position_array(),
+                                             self.bars.get_latest_bar_values('close'),
+                                             self.current_holdings['cash'], self.lot_sizes)
+        if not orders:
+            return
+        if self.batch_orders:
+            self.events.put(OrderBatch(orders))
+        else:
+            for order in orders:
+                self.events.put(order)
             
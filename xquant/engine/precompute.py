@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+"""
+预先计算的指标列
+回测开始前对对齐后的全部历史数据调用一次矢量化的指标函数（如utils.pytalib中的函数），
+得到(bar数, symbol数)的数组；回测中只能按DataHandler的游标读取当前及之前的行，不会看到未来数据
+
+示例（在策略的__init__中声明）：
+self.ma_l = bars.indicator('MA', self.long_window)             # pytalib.MA(df, 10)
+self.macd = bars.indicator(pytalib.MACD, 12, 26, column=0)     # 返回DataFrame的函数需指定列
+self.bias = bars.indicator(close / close.rolling_mean(20) - 1)  # expression中的表达式，close = col('close')
+...
+ma = self.ma_l.value          # 当前bar上全部symbol的值，按symbol_list排列
+ma_prev = self.ma_l.history(2)[0]
+
+注意：数组只能防止读取未来的行，指标函数本身若使用未来数据（如居中的滚动窗口）无法察觉，
+可用IndicatorColumn.check_lookahead()在截断的数据上重新计算以检查
+
+@author: Leon Zhang
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ..utils import pytalib
+from ..utils.expression import Expr, Evaluator
+from ..utils.precision import get_precision
+
+
+def resolve_function(func):
+    """
+    指标函数，可以是函数本身、pytalib中的函数名或expression中的表达式
+    """
+    if callable(func) or isinstance(func, Expr):
+        return func
+    try:
+        return getattr(pytalib, func)
+    except AttributeError:
+        raise ValueError('Unknown indicator: %s' % func)
+
+
+def _select(result, func, column):
+    """
+    多列的结果（单个symbol的DataFrame或Panel的dict）中取出一列
+    """
+    if isinstance(result, dict):
+        names = list(result)
+    elif isinstance(result, pd.DataFrame):
+        names = list(result.columns)
+    else:
+        return result
+    if column is None:
+        if len(names) != 1:
+            raise ValueError('%s returns %d columns, please specify column' %
+                             (getattr(func, '__name__', func), len(names)))
+        column = 0
+    if isinstance(column, int):
+        column = names[column]
+    return result[column]
+
+
+def compute_column(frames, index, func, args=(), kwargs=None, column=None, evaluator=None):
+    """
+    对每个symbol的DataFrame调用func(df, *args, **kwargs)，结果按行对齐后堆叠
+    pytalib中的函数和expression中的表达式在全部symbol组成的Panel上一次计算
+    参数：
+    frames: 按symbol_list排列的DataFrame的list（列为open, high, low, close, volume）
+    index: 对齐后的时间索引
+    func: 指标函数，返回Series、DataFrame或数组；或表达式
+    column: func返回多列时使用的列名或位置
+    evaluator: 计算表达式所用的Evaluator，用于在多次计算间共享中间结果，默认新建
+    返回：
+    (bar数, symbol数)的数组，dtype为指标的精度
+    """
+    kwargs = kwargs or {}
+    if isinstance(func, Expr) or getattr(func, '__module__', None) == pytalib.__name__:
+        if isinstance(func, Expr):
+            if evaluator is None:
+                evaluator = Evaluator(pytalib.Panel.from_frames(OrderedDict(enumerate(frames))))
+            result = evaluator.evaluate(func)
+        else:
+            result = func(pytalib.Panel.from_frames(OrderedDict(enumerate(frames))), *args, **kwargs)
+        if isinstance(result, dict):
+            result = _select(result, func, column)
+        values = np.asarray(result, dtype=float)
+        if values.shape != (len(index), len(frames)):
+            raise ValueError('%s returns %s values for %d bars' %
+                             (getattr(func, '__name__', func), values.shape, len(index)))
+        return get_precision().indicators(values)
+
+    columns = []
+    for df in frames:
+        values = np.asarray(_select(func(df, *args, **kwargs), func, column), dtype=float)
+        if values.shape != (len(index),):
+            raise ValueError('%s returns %s values for %d bars' %
+                             (getattr(func, '__name__', func), values.shape, len(index)))
+        columns.append(values)
+    return get_precision().indicators(np.stack(columns, axis=1))
+
+
+class IndicatorColumn(object):
+    """
+    预先计算的指标，只能读取DataHandler游标及之前的行
+    """
+    def __init__(self, bars, values, func=None, args=(), kwargs=None, column=None):
+        """
+        参数：
+        bars: 提供cursor（最新bar的行号）的DataHandler
+        values: (bar数, symbol数)的数组
+        func, args, kwargs, column: 计算values所用的函数和参数，用于check_lookahead()
+        """
+        self.bars = bars
+        self._values = values
+        self._values.flags.writeable = False
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.column = column
+
+    @property
+    def value(self):
+        """
+        当前bar上全部symbol的指标值，尚无bar时为nan
+        """
+        cursor = self.bars.cursor
+        if cursor < 0:
+            return np.full(self._values.shape[1], np.nan)
+        return self._values[cursor]
+
+    def __getitem__(self, symbol):
+        """
+        当前bar上某个symbol的指标值
+        """
+        return self.value[self.bars.symbol_index[symbol]]
+
+    def history(self, n=1):
+        """
+        最近n个bar（含当前bar）的指标值，(不超过n, symbol数)的数组
+        """
+        cursor = self.bars.cursor
+        return self._values[max(cursor - n + 1, 0):cursor + 1]
+
+    def check_lookahead(self, points=3, rtol=1e-9):
+        """
+        在截断到若干行的数据上重新计算，检查最后一行是否与全量计算的结果一致
+        返回：
+        不一致的行号list，为空说明指标没有使用未来数据
+        """
+        frames = [self.bars.aligned_data[s] for s in self.bars.symbol_list]
+        n = len(self.bars.datetime_index)
+        rows = np.unique(np.linspace(n // 4, n - 2, points).astype(int))
+        bad = []
+        for row in rows:
+            truncated = [df.iloc[:row + 1] for df in frames]
+            values = compute_column(truncated, self.bars.datetime_index[:row + 1],
+                                    self.func, self.args, self.kwargs, self.column)
+            if not np.allclose(values[-1], self._values[row], rtol=rtol, equal_nan=True):
+                bad.append(int(row))
+        return bad
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+"""
+RiskManager 下单前的风险控制
+在信号 -> 风险控制 -> 下单的流程中，对一个时刻的全部订单一起检查，
+以当前头寸和价格向量计算下单后的头寸，按以下规则缩减增加风险的订单：
+max_position: 单个symbol的最大头寸（股数/手数的绝对值）
+max_weight: 单个symbol市值占组合总值的最大比例（集中度）
+max_gross: 多空市值绝对值之和占组合总值的最大比例（总敞口）
+max_net: 多空市值之差的绝对值占组合总值的最大比例（净敞口）
+check_cash: 买入金额不超过现金加卖出所得
+减少风险的订单（如平仓）不受限制，缩减后的数量向零取整到整手
+
+使用：BasicPortfolio(..., risk_manager=RiskManager(max_weight=0.2, max_gross=1.0))
+
+@author: Leon Zhang
+"""
+
+import numpy as np
+
+from .event import OrderEvent
+
+
+class RiskManager(object):
+    """
+    向量化的下单前风险检查
+    """
+    def __init__(self, max_position=None, max_weight=None, max_gross=None, max_net=None,
+                 check_cash=True):
+        """
+        参数：
+        max_position: 单个symbol头寸的上限，标量或按symbol_list排列的数组，None不限制
+        max_weight: 单个symbol市值占组合总值比例的上限，None不限制
+        max_gross: 总敞口占组合总值比例的上限，None不限制
+        max_net: 净敞口占组合总值比例的上限，None不限制
+        check_cash: 是否检查现金是否足够
+        """
+        self.max_position = max_position
+        self.max_weight = max_weight
+        self.max_gross = max_gross
+        self.max_net = max_net
+        self.check_cash = check_cash
+
+    @staticmethod
+    def _scale(opening, increase, excess):
+        """
+        按比例缩减开仓部分：increase为各symbol开仓增加的风险（市值），excess为需要减少的总量
+        """
+        total = increase.sum()
+        if excess <= 0 or total <= 0:
+            return opening
+        return np.where(increase > 0, opening * max(0.0, 1.0 - excess / total), opening)
+
+    def clip(self, delta, positions, prices, cash, lots=None):
+        """
+        对各symbol的头寸变化做风险检查
+        参数：
+        delta: 各symbol订单的净头寸变化（买为正、卖为负）
+        positions: 当前头寸
+        prices: 最新价格
+        cash: 当前现金
+        lots: 每手数量，默认为1
+        返回：
+        缩减后的头寸变化数组
+        """
+        desired = np.asarray(delta, dtype=float)
+        positions = np.asarray(positions, dtype=float)
+        values = np.nan_to_num(np.asarray(prices, dtype=float))
+        equity = cash + np.dot(positions, values)
+
+        # 头寸变化分为平仓部分和开仓部分，只缩减开仓部分
+        closing = np.where(positions * desired < 0, np.clip(desired, -np.abs(positions), np.abs(positions)), 0.0)
+        base = positions + closing
+        opening = desired - closing
+
+        limit = np.full(len(desired), np.inf)
+        if self.max_position is not None:
+            limit = np.minimum(limit, self.max_position)
+        if self.max_weight is not None:
+            with np.errstate(divide='ignore'):
+                limit = np.minimum(limit, np.where(values > 0, self.max_weight * equity / values, np.inf))
+        room = np.maximum(limit - np.abs(base), 0.0)
+        opening = np.clip(opening, -room, room)
+
+        if self.max_gross is not None:
+            increase = np.abs(opening) * values
+            gross = np.dot(np.abs(base), values) + increase.sum()
+            opening = self._scale(opening, increase, gross - self.max_gross * equity)
+
+        if self.max_net is not None:
+            net = np.dot(base + opening, values)
+            increase = np.maximum(np.sign(net) * opening * values, 0.0)
+            opening = self._scale(opening, increase, abs(net) - self.max_net * equity)
+
+        delta = closing + opening
+        if self.check_cash:
+            buys = delta > 0
+            cost = np.dot(delta[buys], values[buys])
+            available = cash - np.dot(delta[~buys], values[~buys])
+            if cost > available:
+                delta = np.where(buys, delta * max(available, 0.0) / cost, delta)
+
+        lots = 1.0 if lots is None else lots
+        return np.where(delta == desired, desired, np.trunc(delta / lots) * lots)
+
+    @staticmethod
+    def _resolve(orders, allowed):
+        """
+        同一symbol的多个订单缩减到净头寸变化allowed：
+        市价单合并为一个新的市价单，限价单、止损单保留价格，不足时从最后的订单起原地缩减数量
+        返回：
+        {order_id: 新的数量或替换的订单（None为剔除）}
+        """
+        market, resting = [], []
+        net = rest = 0.0
+        for o in orders:
+            q = o.quantity if o.direction == 'BUY' else -o.quantity
+            if o.order_type == 'MKT':
+                market.append(o)
+                net += q
+            else:
+                resting.append((o, q))
+                rest += q
+        # 市价部分只在原方向上缩减，不反向下单来抵消限价单
+        target = min(max(allowed - rest, min(net, 0.0)), max(net, 0.0))
+        excess = allowed - rest - target
+
+        resolution = {o.order_id: None for o in market}
+        if market and target != 0:
+            resolution[market[0].order_id] = OrderEvent(market[0].symbol, 'MKT', abs(target),
+                                                        'BUY' if target > 0 else 'SELL')
+        for order, q in reversed(resting):
+            if excess * q < 0:
+                cut = min(abs(excess), abs(q))
+                excess += cut if excess < 0 else -cut
+                resolution[order.order_id] = abs(q) - cut
+        return resolution
+
+    def check(self, orders, symbol_index, positions, prices, cash, lots=None):
+        """
+        检查一批订单，返回缩减后的订单list
+        未被缩减的订单原样返回；被缩减的symbol只有一个订单时修改其数量，
+        有多个订单时其中的市价单合并为一个新的市价单，限价单和止损单保留价格、原地缩减数量；
+        数量为零的订单被剔除
+        参数：
+        orders: OrderEvent的list
+        symbol_index: {symbol: positions/prices中的下标}
+        其余参数见clip()
+        """
+        if not orders:
+            return orders
+        index = np.array([symbol_index[o.symbol] for o in orders])
+        signed = np.array([o.quantity if o.direction == 'BUY' else -o.quantity for o in orders],
+                          dtype=float)
+        desired = np.bincount(index, weights=signed, minlength=len(positions))
+        allowed = self.clip(desired, positions, prices, cash, lots)
+        changed = allowed != desired
+        if not changed.any():
+            return [o for o in orders if o.quantity != 0]
+        counts = np.bincount(index, minlength=len(positions))
+
+        # 被缩减且有多个订单的symbol
+        merge = (changed & (counts > 1)).tolist()
+        groups = {}
+        for order, i in zip(orders, index.tolist()):
+            if merge[i]:
+                groups.setdefault(i, []).append(order)
+        resolution = {}
+        for i, group in groups.items():
+            resolution.update(self._resolve(group, allowed[i]))
+
+        result = []
+        changed = changed.tolist()
+        for order, i in zip(orders, index.tolist()):
+            if not changed[i]:
+                if order.quantity != 0:
+                    result.append(order)
+            elif not merge[i]:
+                if allowed[i] != 0:
+                    order.quantity = abs(allowed[i])
+                    result.append(order)
+            else:
+                new = resolution.get(order.order_id, order.quantity)
+                if isinstance(new, OrderEvent):
+                    result.append(new)
+                elif new:
+                    order.quantity = new
+                    result.append(order)
+        return result
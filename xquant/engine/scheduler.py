@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+Scheduler 以模拟时间为键的定时事件
+延迟成交、定时调仓、收盘回调等未来才发生的动作放在一个堆中，
+每个时刻只弹出已到期的项目，代价为O(log n)，不必在每根bar上对每个symbol检查时间条件
+
+Backtest为每个策略创建一个Scheduler，并设置为strategy、portfolio和execution_handler的scheduler属性：
+self.scheduler.schedule(dt, callback, *args)             # dt时刻（或之后的第一根bar）调用callback(*args)
+self.scheduler.schedule_daily(datetime.time(14, 50), f)  # 每天14:50（或之后的第一根bar）调用f(dt)
+self.scheduler.on_day_end(f)                             # 每个交易日的最后一根bar处理完后调用f(date)
+
+挂单的到期撤销由OrderBook自己的堆处理，见orderbook模块
+
+@author: Leon Zhang
+"""
+
+import datetime
+import heapq
+import itertools
+
+
+class Scheduler(object):
+    """
+    定时事件的优先队列
+    """
+    def __init__(self):
+        self.heap = []       # (时间, seq, callback, args)
+        self.day_end = []    # 收盘回调
+        self.current_date = None
+        self.closed = False  # 回测结束后不再接受新的定时事件
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, dt, callback, *args):
+        """
+        在模拟时间dt调用callback(*args)，dt之后的第一个时刻执行
+        返回：
+        是否成功加入，回测结束后返回False
+        """
+        if self.closed:
+            return False
+        heapq.heappush(self.heap, (dt, next(self._seq), callback, args))
+        return True
+
+    def schedule_daily(self, time, callback, start=None):
+        """
+        每天的time（datetime.time）调用callback(dt)，dt为实际执行的时刻
+        错过的多次（如数据中断）只执行一次
+        参数：
+        start: 第一次执行的日期，默认为下一个到达的时刻所在的日期
+        """
+        if start is not None:
+            due = datetime.datetime.combine(start, time)
+            self.schedule(due, self._daily, due, callback)
+        else:
+            self.schedule(datetime.datetime.min, self._first_daily, time, callback)
+
+    def _first_daily(self, now, time, callback):
+        due = datetime.datetime.combine(now.date(), time)
+        if due < now:
+            due += datetime.timedelta(days=1)
+        self.schedule(due, self._daily, due, callback)
+
+    def _daily(self, now, due, callback):
+        callback(now)
+        while due <= now:
+            due += datetime.timedelta(days=1)
+        self.schedule(due, self._daily, due, callback)
+
+    def on_day_end(self, callback):
+        """
+        每个交易日结束时调用callback(date)
+        """
+        self.day_end.append(callback)
+
+    def _call(self, now, callback, args):
+        if callback in (self._first_daily, self._daily):
+            callback(now, *args)
+        else:
+            callback(*args)
+
+    def run_due(self, now):
+        """
+        新的时刻now到来：先对上一交易日执行收盘回调（若日期改变），再按时间顺序执行已到期的项目
+        回调中新加入的已到期项目也会在本次执行
+        返回：
+        执行的项目数
+        """
+        if self.current_date is not None and now.date() != self.current_date:
+            self.end_day()
+        self.current_date = now.date()
+
+        count = 0
+        while self.heap and self.heap[0][0] <= now:
+            _, _, callback, args = heapq.heappop(self.heap)
+            self._call(now, callback, args)
+            count += 1
+        return count
+
+    def end_day(self):
+        """
+        执行当前交易日的收盘回调
+        """
+        if self.current_date is not None:
+            date, self.current_date = self.current_date, None
+            for callback in self.day_end:
+                callback(date)
+
+    def close(self):
+        """
+        回测结束：执行最后一个交易日的收盘回调，丢弃未到期的项目
+        """
+        self.end_day()
+        self.heap = []
+        self.closed = True
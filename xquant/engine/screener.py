@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+
+"""
+Screener 全市场选股
+在每个symbol的最新bar上计算由指标组成的条件表达式，返回满足条件的symbol list，可作为回测或策略的股票池
+
+条件的写法：
+'MA_5 > MA_20 & RSI_14 < 30'
+1. 指标写作“名称_参数1_参数2”（如MA_5、MACD_12_26），或函数调用的形式（如MA(5)），
+   名称为pytalib.indicators中的指标，expression中有同名指标时使用表达式，共享中间结果（如各窗口的滚动均值）
+2. 多列的指标用下标取列，如MACD_12_26[1]为信号线，默认取第0列
+3. open, high, low, close, volume为最新bar的行情；支持+ - * /、比较运算和&、|、~，
+   同DataFrame.query()，比较运算先于&、|计算
+4. RSI、MFI、ADX、STOK、STO和ULTOSC按常用的0到100计（pytalib中为0到1，ULTOSC为0到7），
+   与0到100以外的常数比较时报错
+
+数据只取每个symbol最近的lookback个bar（按各指标需要的窗口自动确定，也可以指定），
+各symbol按自身的bar对齐，上市时间不足的在前面补nan（相应指标为nan，条件不成立）
+
+示例：
+screener = Screener('D:/data', processes=4)   # CSV文件夹（文件按日期升序），默认为其中全部symbol
+universe = screener.screen('MA_5 > MA_20 & RSI_14 < 30')
+table = screener.evaluate('MA_5 > MA_20 & RSI_14 < 30')  # 各symbol的指标值、最新bar的时间和是否入选
+backtest = Backtest(csv_dir, universe, ...)
+
+screener = Screener(bars)  # 已加载的DataHandler，在当前游标的bar上选股，可在策略中调整股票池
+
+@author: Leon Zhang
+"""
+
+import ast
+import math
+import operator
+import os
+from collections import OrderedDict
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+from ..utils import expression, pytalib
+from ..utils.parallel import WorkerPool
+
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+# 指数加权平均截断历史后的相对误差上限，用于确定需要的bar数
+EWM_TOLERANCE = 1e-6
+
+_COMPARE = {ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Lt: operator.lt, ast.LtE: operator.le,
+            ast.Eq: operator.eq, ast.NotEq: operator.ne}
+_ARITHMETIC = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+               ast.Div: operator.truediv}
+
+
+def _ewm_bars(span):
+    """
+    指数加权平均的权重衰减到EWM_TOLERANCE以下所需的bar数
+    """
+    alpha = 2.0 / (span + 1)
+    return int(math.ceil(math.log(EWM_TOLERANCE) / math.log(1 - alpha))) if alpha < 1 else 1
+
+
+# expression中没有的pytalib指标 -> 由参数计算最新值所需的bar数（含真实波幅等需要的前一个bar）
+PYTALIB_LOOKBACK = {
+    'ATR': lambda n: _ewm_bars(n) + 1,
+    'PPSR': lambda: 1,
+    'ADX': lambda n, n_adx: _ewm_bars(n) + _ewm_bars(n_adx) + 2,
+    'Vortex': lambda n: n + 1,
+    'RSI': lambda n: _ewm_bars(n) + 1,
+    'MFI': lambda n: n + 1,
+    'OBV': lambda n: n + 1,
+    'ULTOSC': lambda: 29,
+    'DONCH': lambda n: 2 * n,
+}
+
+
+# 振荡指标在选股条件中换算到0到100的系数
+PERCENT_SCALE = {'RSI': 100.0, 'MFI': 100.0, 'ADX': 100.0, 'STOK': 100.0, 'STO': 100.0, 'ULTOSC': 100.0 / 7}
+
+
+def expr_lookback(expr):
+    """
+    计算表达式最后一个bar的值所需的bar数
+    """
+    if isinstance(expr, (tuple, list)):
+        return max(expr_lookback(e) for e in expr)
+    base = max([expr_lookback(e) for e in expr.inputs] or [1])
+    if expr.op.startswith('rolling_'):
+        return base + expr.params[0] - 1
+    if expr.op == 'shift':
+        return base + expr.params[0]
+    if expr.op == 'ewm_mean':
+        return base + _ewm_bars(expr.params[0])
+    if expr.op == 'min_periods':
+        return max(base, expr.params[0])
+    return base
+
+
+class Term(object):
+    """
+    条件中的一个指标，如MA_5、MACD_12_26[1]
+    """
+    def __init__(self, name, args=(), column=0):
+        self.name = name
+        self.args = tuple(args)
+        self.column = column
+        if name in FIELDS:
+            self.func = expression.col(name)
+        elif name in pytalib.indicators and hasattr(expression, name):
+            self.func = getattr(expression, name)(*self.args)
+        elif name in pytalib.indicators:
+            self.func = getattr(pytalib, name)
+        else:
+            raise ValueError('Unknown indicator in screen condition: %s' % name)
+        self.label = '_'.join([name] + [str(a) for a in self.args]) + ('[%d]' % column if column else '')
+
+    @property
+    def lookback(self):
+        """
+        计算最新值所需的bar数，pytalib中的函数见PYTALIB_LOOKBACK
+        """
+        if not callable(self.func):
+            return expr_lookback(self.func)
+        try:
+            return PYTALIB_LOOKBACK[self.name](*self.args)
+        except (KeyError, TypeError):
+            raise ValueError('Cannot derive the lookback of %s, please specify lookback' % self.label)
+
+    def compute(self, panel, evaluator):
+        """
+        在Panel上计算，返回最新bar上每个symbol的值
+        """
+        if callable(self.func):
+            result = self.func(panel, *self.args)
+        else:
+            result = evaluator.compute(self.func)
+        if isinstance(result, dict):
+            result = list(result.values())
+        if isinstance(result, (tuple, list)):
+            result = result[self.column]
+        elif self.column:
+            raise ValueError('%s has only one column' % self.name)
+        return np.asarray(result, dtype=np.float64)[-1] * PERCENT_SCALE.get(self.name, 1.0)
+
+
+def _number(node):
+    """
+    数字常量节点的值，不是数字时为None
+    """
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = _number(node.operand)
+        return None if value is None else -value
+    value = getattr(node, 'value', getattr(node, 'n', None))
+    if type(node).__name__ in ('Constant', 'Num') and isinstance(value, (int, float)) \
+            and not isinstance(value, bool):
+        return value
+    return None
+
+
+def _parse_args(parts):
+    args = []
+    for p in parts:
+        try:
+            args.append(int(p))
+        except ValueError:
+            args.append(float(p))
+    return args
+
+
+class Condition(object):
+    """
+    解析后的选股条件
+    """
+    def __init__(self, text):
+        self.text = text
+        source = text.replace('&', ' and ').replace('|', ' or ').replace('~', ' not ')
+        try:
+            tree = ast.parse(source.strip(), mode='eval').body
+        except SyntaxError:
+            raise ValueError('Invalid screen condition: %s' % text)
+        self.terms = OrderedDict()
+        self.tree = self._compile(tree)
+
+    @property
+    def lookback(self):
+        return max(t.lookback for t in self.terms.values())
+
+    def _term(self, node, column=0):
+        """
+        指标节点（名称或函数调用）对应的('term', 名称)，不是指标时为None
+        """
+        if isinstance(node, ast.Name):
+            parts = node.id.split('_')
+            name, args = parts[0], _parse_args(parts[1:])
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            name, args = node.func.id, [_number(a) for a in node.args]
+            if None in args:
+                return None
+        else:
+            return None
+        term = Term(name, args, column)
+        self.terms.setdefault(term.label, term)
+        return ('term', term.label)
+
+    def _compile(self, node):
+        """
+        ast节点转为嵌套的tuple：('term', 名称)、('const', 值)、(运算, 子节点...)
+        """
+        value = _number(node)
+        if value is not None:
+            return ('const', value)
+        term = self._term(node)
+        if term is not None:
+            return term
+        if isinstance(node, ast.Subscript):
+            index = node.slice
+            if type(index).__name__ == 'Index':
+                index = index.value
+            column = _number(index)
+            term = self._term(node.value, column) if isinstance(column, int) else None
+            if term is not None:
+                return term
+        if isinstance(node, ast.BoolOp):
+            op = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            return (op,) + tuple(self._compile(v) for v in node.values)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Not, ast.USub)):
+            op = np.logical_not if isinstance(node.op, ast.Not) else operator.neg
+            return (op, self._compile(node.operand))
+        if isinstance(node, ast.BinOp) and type(node.op) in _ARITHMETIC:
+            return (_ARITHMETIC[type(node.op)], self._compile(node.left), self._compile(node.right))
+        if isinstance(node, ast.Compare) and all(type(op) in _COMPARE for op in node.ops):
+            operands = [self._compile(node.left)] + [self._compile(c) for c in node.comparators]
+            self._check_range(operands)
+            return ('compare', tuple(_COMPARE[type(op)] for op in node.ops)) + tuple(operands)
+        raise ValueError('Unsupported syntax in screen condition: %s' % self.text)
+
+    def _check_range(self, operands):
+        """
+        0到100的振荡指标与范围以外的常数比较时报错（如RSI_14 > 130），这样的条件总是成立或总不成立
+        """
+        for a, b in zip(operands[:-1], operands[1:]):
+            for term, const in ((a, b), (b, a)):
+                if term[0] == 'term' and const[0] == 'const' and \
+                        self.terms[term[1]].name in PERCENT_SCALE and not 0 <= const[1] <= 100:
+                    raise ValueError('%s ranges from 0 to 100, cannot compare with %s in: %s' %
+                                     (term[1], const[1], self.text))
+
+    def evaluate(self, values, node=None):
+        """
+        在各指标的值上计算条件
+        参数：
+        values: {指标名: 每个symbol的值的数组}
+        返回：
+        布尔数组，nan参与的比较为False
+        """
+        node = self.tree if node is None else node
+        kind = node[0]
+        if kind == 'term':
+            return values[node[1]]
+        if kind == 'const':
+            return node[1]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if kind == 'compare':
+                operands = [self.evaluate(values, n) for n in node[2:]]
+                return reduce(np.logical_and, [op(a, b) for op, a, b in
+                                               zip(node[1], operands[:-1], operands[1:])])
+            args = [self.evaluate(values, n) for n in node[1:]]
+            if kind in (np.logical_and, np.logical_or):
+                return reduce(kind, args)
+            return kind(*args)
+
+    def compute(self, panel):
+        """
+        在Panel上计算全部指标，返回{指标名: 最新bar上每个symbol的值}
+        """
+        evaluator = expression.Evaluator(panel)
+        return OrderedDict((label, term.compute(panel, evaluator)) for label, term in self.terms.items())
+
+
+def _read_block(f, start, size):
+    f.seek(start)
+    return f.read(size).splitlines()
+
+
+def read_tail(path, n, block=1 << 14):
+    """
+    读取CSV文件（有表头，按日期升序或降序）中最新的n行，不解析整个文件
+    返回：
+    (最新bar的时间, 按时间升序的(行数, 5)的数组)，文件没有数据时为(None, 空数组)
+    """
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        size = min(block, end)
+        while True:
+            head = _read_block(f, 0, size)
+            tail = _read_block(f, end - size, size)
+            # 表头之外至少需要一个完整的数据行以判断顺序
+            if size >= end or len(head) > 2:
+                break
+            size = min(size * 2, end)
+        head = [l for l in head[1:] if l.strip()]
+        last = [l for l in tail if l.strip()][-1:]
+        if not head or not last:
+            return None, np.empty((0, len(FIELDS)))
+        ascending = pd.Timestamp(head[0].split(b',')[0].decode()) <= \
+            pd.Timestamp(last[0].split(b',')[0].decode())
+
+        # 升序时从文件末尾、降序时从表头之后读取n行，首末的行可能不完整，多读一行
+        while True:
+            lines = _read_block(f, end - size, size) if ascending else _read_block(f, 0, size)
+            if size >= end or len(lines) > n + 1:
+                break
+            size = min(size * 2, end)
+    if ascending:
+        lines = [l for l in lines[1:] if l.strip()][-n:]
+    else:
+        lines = [l for l in lines[1:] if l.strip()]
+        lines = (lines[:-1] if size < end else lines)[:n][::-1]
+    rows = [l.split(b',') for l in lines]
+    values = np.array([r[1:len(FIELDS) + 1] for r in rows], dtype=np.float64)
+    return pd.Timestamp(rows[-1][0].decode()), values
+
+
+def _load(csv_dir, symbols, lookback):
+    """
+    读取一组symbol最近lookback个bar，返回(最新bar的时间list, Panel)
+    """
+    values = np.full((lookback, len(symbols), len(FIELDS)), np.nan)
+    dates = []
+    for i, s in enumerate(symbols):
+        date, tail = read_tail(os.path.join(csv_dir, '%s.csv' % s), lookback)
+        dates.append(date)
+        if len(tail):
+            values[lookback - len(tail):, i] = tail
+    return dates, pytalib.Panel.from_array(values, pd.RangeIndex(lookback), list(symbols), FIELDS)
+
+
+def _screen_shard(task):
+    """
+    在worker中计算一组symbol的指标值，返回DataFrame（index为symbol）
+    """
+    csv_dir, symbols, text, lookback = task
+    dates, panel = _load(csv_dir, symbols, lookback)
+    table = pd.DataFrame(Condition(text).compute(panel), index=list(symbols))
+    table['datetime'] = dates
+    return table
+
+
+class Screener(object):
+    """
+    在全部symbol的最新bar上按条件选股
+    """
+    def __init__(self, data, symbol_list=None, processes=1, shard_size=500):
+        """
+        参数：
+        data: CSV文件夹（每个symbol一个文件，格式同CSVDataHandler，按日期升序），或已加载数据的DataHandler
+        symbol_list: 参与选股的symbol，默认为文件夹中全部CSV文件或DataHandler的symbol_list
+        processes: 读取CSV时的进程数，1为在当前进程中计算，None为CPU核数；DataHandler时不使用
+        shard_size: 每个任务的symbol数
+        """
+        self.data = data
+        if symbol_list is None:
+            if hasattr(data, 'symbol_list'):
+                symbol_list = data.symbol_list
+            else:
+                symbol_list = sorted(os.path.splitext(f)[0] for f in os.listdir(data) if f.endswith('.csv'))
+        self.symbol_list = list(symbol_list)
+        self.processes = processes
+        self.shard_size = shard_size
+
+    def _from_handler(self, condition, lookback):
+        """
+        DataHandler游标处（尚未开始回测时为最后一个bar）的指标值
+        """
+        bars = self.data
+        row = bars.cursor if bars.cursor >= 0 else len(bars.datetime_index) - 1
+        columns = [bars.symbol_index[s] for s in self.symbol_list]
+        start = max(row + 1 - lookback, 0)
+        values = bars.data_array[start:row + 1][:, columns].astype(np.float64)
+        panel = pytalib.Panel.from_array(values, bars.datetime_index[start:row + 1], self.symbol_list,
+                                         bars.fields)
+        table = pd.DataFrame(condition.compute(panel), index=self.symbol_list)
+        # 向前填充的bar（如停牌）不是最新的bar
+        table['datetime'] = np.where(bars.valid_array[row, columns], bars.datetime_index[row], pd.NaT)
+        return table
+
+    def _from_csv(self, condition, lookback):
+        shards = [self.symbol_list[i:i + self.shard_size]
+                  for i in range(0, len(self.symbol_list), self.shard_size)]
+        tasks = [(self.data, shard, condition.text, lookback) for shard in shards]
+        backend = 'serial' if self.processes == 1 or len(tasks) < 2 else 'process'
+        with WorkerPool(self.processes, backend) as pool:
+            tables = list(pool.map(_screen_shard, tasks))
+        return pd.concat(tables) if tables else pd.DataFrame(columns=list(condition.terms) + ['datetime'])
+
+    def evaluate(self, condition, lookback=None, require_latest=True):
+        """
+        计算各symbol的指标值和条件
+        参数：
+        condition: 条件表达式的字符串
+        lookback: 读取的bar数，默认按条件中的指标确定
+        require_latest: True则最新bar不是全部symbol中最新时间的（如停牌）不入选
+        返回：
+        DataFrame，index为symbol，列为各指标的值、'datetime'（最新bar的时间）和'selected'
+        """
+        condition = Condition(condition)
+        lookback = lookback or condition.lookback
+        if hasattr(self.data, 'data_array'):
+            table = self._from_handler(condition, lookback)
+        else:
+            table = self._from_csv(condition, lookback)
+        table['datetime'] = pd.to_datetime(table['datetime'])
+
+        selected = np.asarray(condition.evaluate(OrderedDict((t, table[t].values) for t in condition.terms)),
+                              dtype=bool)
+        selected = np.broadcast_to(selected, (len(table),)).copy()
+        if require_latest:
+            selected &= (table['datetime'] == table['datetime'].max()).values
+        table['selected'] = selected
+        return table
+
+    def screen(self, condition, lookback=None, require_latest=True):
+        """
+        满足条件的symbol list，按symbol_list的顺序，参数见evaluate
+        """
+        table = self.evaluate(condition, lookback, require_latest)
+        return list(table.index[table['selected'].values])
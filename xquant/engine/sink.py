@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+"""
+ResultSink 回测记录（头寸、持仓市值、交易和信号）的存储
+MemorySink：全部保存在内存的list中（默认）
+NpySink：分批写入磁盘的npz文件，内存中只保留少量缓冲，适合长周期、多品种的分钟线回测
+
+回测结束后通过result()得到BacktestResult对象，各记录在第一次访问时才读取
+
+@author: Leon Zhang
+"""
+
+import glob
+import os
+from abc import ABCMeta, abstractmethod
+
+import numpy as np
+import pandas as pd
+
+from .cache import _frame_to_arrays, _arrays_to_frame
+from ..utils.precision import get_precision
+
+
+TABLES = ('positions', 'holdings', 'trades', 'signals')
+
+
+def to_frame(records, columns=None):
+    """
+    将记录（dict的list或NpyTable）转换成DataFrame，datetime为普通列
+    """
+    if isinstance(records, NpyTable):
+        df = records.load()
+    else:
+        df = pd.DataFrame(list(records))
+    if columns is not None:
+        df = df.reindex(columns=columns)
+    return df
+
+
+class ResultSink(object):
+    """
+    ResultSink抽象基类
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def table(self, name, records=()):
+        """
+        返回名为name的可append记录表，records为初始记录
+        """
+        raise NotImplementedError("Should implement table()!")
+
+    def close(self):
+        """
+        回测结束时调用，写出缓冲中的数据
+        """
+        pass
+
+    @abstractmethod
+    def result(self):
+        """
+        返回BacktestResult对象
+        """
+        raise NotImplementedError("Should implement result()!")
+
+
+class MemorySink(ResultSink):
+    """
+    记录保存在内存的list中
+    """
+    def __init__(self):
+        self.tables = {}
+
+    def table(self, name, records=()):
+        self.tables[name] = list(records)
+        return self.tables[name]
+
+    def result(self):
+        return BacktestResult(lambda name: to_frame(self.tables.get(name, [])))
+
+
+class NpyTable(object):
+    """
+    分块写入磁盘的记录表，每buffer_size条记录写出一个npz文件
+    """
+    def __init__(self, path, name, buffer_size=10000):
+        self.path = path
+        self.name = name
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.chunks = 0
+        self.length = 0
+
+    def append(self, record):
+        self.buffer.append(record)
+        self.length += 1
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def __len__(self):
+        return self.length
+
+    def flush(self):
+        """
+        将缓冲的记录按列写入一个新的npz文件
+        """
+        if not self.buffer:
+            return
+        df = pd.DataFrame(self.buffer).set_index('datetime')
+        # 成交价按价格精度、头寸数量等整数按整数精度保存，资金和市值保持float64
+        df = get_precision().frame(df, prices=('fill_price',),
+                                   integers=[c for c in df.columns if df[c].dtype.kind in 'iu'])
+        np.savez(os.path.join(self.path, '%s_%06d.npz' % (self.name, self.chunks)),
+                 **_frame_to_arrays(df, 'chunk'))
+        self.chunks += 1
+        self.buffer = []
+
+    def load(self):
+        """
+        读取已写出的全部记录和缓冲中的记录
+        """
+        frames = [load_table(self.path, self.name)]
+        if self.buffer:
+            frames.append(pd.DataFrame(self.buffer))
+        return pd.concat(frames, ignore_index=True)
+
+
+class NpySink(ResultSink):
+    """
+    分批写入磁盘的ResultSink
+    """
+    def __init__(self, path, buffer_size=10000):
+        """
+        参数：
+        path: 存放npz文件的目录，已有的记录文件会被清除
+        buffer_size: 每个记录表在内存中缓冲的记录数
+        """
+        self.path = path
+        self.buffer_size = buffer_size
+        self.tables = {}
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for name in TABLES:
+            for f in glob.glob(os.path.join(path, '%s_*.npz' % name)):
+                os.remove(f)
+
+    def table(self, name, records=()):
+        table = NpyTable(self.path, name, self.buffer_size)
+        for record in records:
+            table.append(record)
+        self.tables[name] = table
+        return table
+
+    def close(self):
+        for table in self.tables.values():
+            table.flush()
+
+    def result(self):
+        self.close()
+        return BacktestResult.from_dir(self.path)
+
+
+def load_table(path, name):
+    """
+    读取NpySink写出的记录表，datetime为普通列
+    """
+    files = sorted(glob.glob(os.path.join(path, '%s_*.npz' % name)))
+    frames = []
+    for f in files:
+        with np.load(f, allow_pickle=False) as data:
+            frames.append(_arrays_to_frame(dict(data.items()), 'chunk').reset_index())
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+class BacktestResult(object):
+    """
+    回测结果，positions/holdings/trades/signals在第一次访问时读取
+    """
+    def __init__(self, loader):
+        """
+        参数：
+        loader: 以记录表名称为参数、返回DataFrame的函数
+        """
+        self._loader = loader
+        self._frames = {}
+
+    @classmethod
+    def from_dir(cls, path):
+        """
+        从NpySink的目录中读取回测结果，可用于回测结束后的另一个进程
+        """
+        return cls(lambda name: load_table(path, name))
+
+    def _load(self, name):
+        if name not in self._frames:
+            self._frames[name] = self._loader(name)
+        return self._frames[name]
+
+    def _snapshots(self, name):
+        df = self._load(name)
+        if df.empty:
+            return df
+        return df.drop_duplicates(subset='datetime', keep='last').set_index('datetime')
+
+    @property
+    def positions(self):
+        return self._snapshots('positions')
+
+    @property
+    def holdings(self):
+        return self._snapshots('holdings')
+
+    @property
+    def trades(self):
+        df = self._load('trades')
+        if df.empty:
+            return df
+        return df.set_index('datetime')
+
+    @property
+    def signals(self):
+        return self._load('signals')
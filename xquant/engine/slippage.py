@@ -10,6 +10,8 @@ New in V0.3.4
 
 from abc import ABCMeta, abstractmethod
 
+import numpy as np
+
 
 class Slippage(object):
     """
@@ -47,7 +49,82 @@ class FixedPercentSlippage(Slippage):
 
         return price
 
+    def get_trade_prices(self, prices, directions):
+        """
+        一批订单的成交价，prices和directions为numpy数组
+        """
+        prices = np.asarray(prices, dtype=float)
+        return prices + prices * self.rate * np.where(np.asarray(directions) == 'BUY', 1, -1)
+
 
 class VolumeShareSlippage(Slippage):
-    def get_trade_price(self, price, direction):
-        pass
\ No newline at end of file
+    """
+    成交量占比的滑点模型
+    每根bar每个symbol最多成交该bar成交量的volume_limit，未成交部分留到下一根bar，
+    价格冲击为 price_impact * (成交量占比)^2，买入向上、卖出向下
+    """
+    def __init__(self, volume_limit=0.025, price_impact=0.1):
+        """
+        参数
+        volume_limit: 单根bar可成交的最大成交量占比，如0.025即2.5%
+        price_impact: 价格冲击系数
+        """
+        self.volume_limit = volume_limit
+        self.price_impact = price_impact
+
+    def get_trade_price(self, price, direction, quantity=0, volume=0):
+        """
+        单个订单的成交价，quantity和volume用于计算成交量占比
+        """
+        prices, filled = self.get_trade_prices(np.array([price]), np.array([quantity]),
+                                               np.array([volume]), np.array([direction]))
+        return prices[0]
+
+    def get_trade_prices(self, prices, quantities, volumes, directions, groups=None, lots=None):
+        """
+        同一时刻一批订单的成交价和成交数量，全部为numpy数组运算
+        参数：
+        prices: 每个订单的参考价（如bar收盘价）
+        quantities: 每个订单待成交的数量
+        volumes: 每个订单对应symbol在该bar的成交量
+        directions: 'BUY'或'SELL'的数组
+        groups: 每个订单对应symbol的整数编号，同一symbol的订单按顺序分享可成交量，默认各订单独立
+        lots: 每个订单的最小交易单位（如A股100股），部分成交的数量向下取整到其整数倍，
+              可以全部成交时按剩余数量成交（如零股卖出），默认为1
+        返回：
+        (成交价数组, 成交数量数组)
+        """
+        prices = np.asarray(prices, dtype=float)
+        quantities = np.asarray(quantities, dtype=float)
+        volumes = np.nan_to_num(np.asarray(volumes, dtype=float))
+        sign = np.where(np.asarray(directions) == 'BUY', 1.0, -1.0)
+        capacity = np.floor(volumes * self.volume_limit)
+
+        if groups is None:
+            filled = np.minimum(quantities, capacity)
+        else:
+            # 同组订单按顺序占用可成交量：本单之前已占用的数量 = 组内累计和 - 本单 - 组起点之前的累计和
+            groups = np.asarray(groups)
+            order = np.argsort(groups, kind='mergesort')
+            sorted_quantities = quantities[order]
+            cum = np.cumsum(sorted_quantities)
+            starts = np.r_[0, np.flatnonzero(np.diff(groups[order])) + 1]
+            offsets = np.repeat(cum[starts] - sorted_quantities[starts], np.diff(np.r_[starts, len(order)]))
+            before = cum - sorted_quantities - offsets
+            filled = np.empty_like(quantities)
+            filled[order] = np.clip(capacity[order] - before, 0, sorted_quantities)
+
+        if lots is not None:
+            partial = filled < quantities
+            filled = np.where(partial, np.floor(filled / np.asarray(lots, dtype=float)) * lots, quantities)
+
+        if groups is None:
+            group_filled = filled
+        else:
+            inverse = np.unique(groups, return_inverse=True)[1].ravel()
+            group_filled = np.bincount(inverse, weights=filled)[inverse]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            share = np.where(volumes > 0, group_filled / volumes, 0.0)
+        trade_prices = prices * (1.0 + sign * self.price_impact * share ** 2)
+        return trade_prices, filled
\ No newline at end of file
@@ -9,9 +9,10 @@ market data by DataHandler -> Strategy -> signal for Portfolio
 @version: 0.3
 """
 
-import pandas as pd
+import numpy as np
 from abc import ABCMeta, abstractmethod
 from .event import SignalEvent
+from .indicator import SMA, without_ties
 
 
 class Strategy(object):
@@ -21,6 +22,7 @@ class Strategy(object):
     Strategy类对历史数据和实时数据均有效，实际上它对数据来源不知晓，直接从queue对象获取bar元组
     """
     __metaclass__ = ABCMeta
+    scheduler = None  # Backtest设置的Scheduler对象，见scheduler模块
 
     @abstractmethod
     def calculate_signals(self, *args):
@@ -81,6 +83,7 @@ class BuyAndHoldStrategy(Strategy):
 class MovingAverageCrossStrategy(Strategy):
     """
     移动双均线策略
+    均线用indicator模块增量计算，每个时刻对全部股票更新一次
     """
 
     def __init__(self, bars, events, long_window=10, short_window=5):
@@ -96,40 +99,30 @@ class MovingAverageCrossStrategy(Strategy):
         self.long_window = long_window  # 长期均线
         self.short_window = short_window  # 短期均线
 
-        self.bought = self._calculate_initial_bought()
-
-    def _calculate_initial_bought(self):
-        """
-        添加key到bought字典，将所有股票的值设为False，意指尚未持有
-        TODO：是否可以用组合中虚拟账户来监控，strategy只管发信号呢？
-        """
-        bought = {}
-        for s in self.symbol_list:
-            bought[s] = False
-        return bought
+        self.long_ma = SMA(len(self.symbol_list), long_window)
+        self.short_ma = SMA(len(self.symbol_list), short_window)
+        self.prev_diff = np.full(len(self.symbol_list), np.nan)  # 上一个时刻的短期均线-长期均线
+        self.timeindex = None
+        self.bought = np.zeros(len(self.symbol_list), dtype=bool)  # 是否持有
 
     def calculate_signals(self, event):
         """
         当短期均线（如5日线）上穿长期均线（如10日线），买入
         反之，卖出；不做空
         """
-        if event.type == 'MARKET':
-            for s in self.symbol_list:
-                bars = self.bars.get_latest_bars(s, N=self.long_window)  # 元组的列表
-                if bars is not None and bars != [] and len(bars) >= self.long_window:
-                    # 转换成DataFrame计算，代码量少一些，暂不考虑速度
-                    cols = ['symbol', 'datetime', 'open', 'high', 'low', 'close', 'volume']
-                    df = pd.DataFrame(bars, columns=cols)
-                    df['MA_long'] = df['close'].rolling(center=False, window=self.long_window, min_periods=1).mean()
-                    df['MA_short'] = df['close'].rolling(center=False, window=self.short_window, min_periods=1).mean()
-                    if df['MA_long'].iloc[-1] < df['MA_short'].iloc[-1] and df['MA_long'].iloc[-2] \
-                            > df['MA_short'].iloc[-2] and not self.bought[s]:
-                        signal = SignalEvent(bars[-1][0], bars[-1][1], 'LONG')
-                        self.events.put(signal)
-                        self.bought[s] = True
-
-                    elif df['MA_long'].iloc[-1] > df['MA_short'].iloc[-1] and df['MA_long'].iloc[-2] \
-                            < df['MA_short'].iloc[-2] and self.bought[s]:
-                        signal = SignalEvent(bars[-1][0], bars[-1][1], 'EXIT')
-                        self.events.put(signal)
-                        self.bought[s] = False
+        if event.type == 'BAR' and event.bar[1] != self.timeindex:  # 同一时刻的各品种bar只计算一次
+            self.timeindex = event.bar[1]
+            close = self.bars.get_latest_bar_values('close')
+            # 均线恰好相等时增量计算的浮点误差不算作交叉
+            diff = without_ties(self.short_ma.update(close) - self.long_ma.update(close), close)
+
+            with np.errstate(invalid='ignore'):
+                buy = (diff > 0) & (self.prev_diff < 0) & ~self.bought
+                sell = (diff < 0) & (self.prev_diff > 0) & self.bought
+            for i in np.flatnonzero(buy):
+                self.events.put(SignalEvent(self.symbol_list[i], self.timeindex, 'LONG'))
+            for i in np.flatnonzero(sell):
+                self.events.put(SignalEvent(self.symbol_list[i], self.timeindex, 'EXIT'))
+            self.bought[buy] = True
+            self.bought[sell] = False
+            self.prev_diff = diff
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+"""
+ParameterSweep 多进程参数扫描
+对同一回测配置的多组策略参数并行回测，每个进程只读取一次市场数据
+
+注意：multiprocessing需要pickle策略等类，请将其定义在可导入的模块中，
+Windows下请在 if __name__ == '__main__': 中调用
+
+示例：
+sweep = ParameterSweep(csv_dir, symbol_list, 100000.0, 0.0, start_date, end_date,
+                       CSVDataHandler, SimulatedExecutionHandler, BasicPortfolio,
+                       MovingAverageCrossStrategy, commission_type='default')
+grid = {'long_window': [10, 20, 30], 'short_window': [3, 5]}
+for result in sweep.run(grid):
+    print(result['params'], result['sharpe'])
+
+@author: Leon Zhang
+"""
+
+import itertools
+import logging
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .backtest import Backtest, logger as backtest_logger
+from ..finance.perform import perform_metrics
+from ..utils.parallel import WorkerPool
+
+
+def expand_grid(grid):
+    """
+    将参数网格展开为参数字典的list
+    参数：
+    grid: {参数名: 取值list}的字典（做笛卡尔积），或参数字典的list（原样返回）
+    返回：
+    参数字典的list
+    """
+    if isinstance(grid, dict):
+        names = sorted(grid.keys())
+        return [dict(zip(names, values)) for values in itertools.product(*[grid[n] for n in names])]
+    return [dict(p) for p in grid]
+
+
+# 每个worker进程的状态：回测配置和已加载数据的DataHandler
+_worker_state = {}
+
+
+def _init_worker(config, log_level):
+    """
+    worker进程初始化，读取一次市场数据供该进程的所有任务复用
+    """
+    backtest_logger.setLevel(log_level)
+    _worker_state['config'] = config
+    _worker_state['data_handler'] = config['data_handler'](queue.Queue(), config['csv_dir'],
+                                                           config['symbol_list'], config['start_date'],
+                                                           config['end_date'])
+
+
+def _run_task(task):
+    """
+    在worker中执行单组参数的回测，返回精简的结果摘要
+    """
+    index, params, return_curve = task
+    config = _worker_state['config']
+    backtest = Backtest(config['csv_dir'], config['symbol_list'], config['initial_capital'],
+                        config['heartbeat'], config['start_date'], config['end_date'],
+                        _worker_state['data_handler'], config['execution_handler'],
+                        config['portfolio'], config['strategy'],
+                        commission_type=config['commission_type'],
+                        slippage_type=config['slippage_type'], **params)
+    positions, holdings = backtest.simulate_trading()
+    perform, ret, sharpe_ratio, max_dd = perform_metrics(holdings['total'], periods=config['periods'])
+
+    result = {'index': index,
+              'params': params,
+              'total': holdings['total'].iloc[-1],
+              'return': ret,
+              'sharpe': sharpe_ratio,
+              'max_dd': max_dd,
+              'fills': backtest.fills}
+    if return_curve:
+        result['equity_curve'] = perform['equity_curve']
+    return result
+
+
+class ParameterSweep(object):
+    """
+    参数扫描：给定Backtest的配置（除策略参数外），对多组策略参数在进程池中并行回测
+    任务分块提交，结果以摘要字典的形式流式返回
+    """
+    def __init__(self, csv_dir, symbol_list, initial_capital,
+                 heartbeat, start_date, end_date, data_handler,
+                 execution_handler, portfolio, strategy,
+                 commission_type='zero', slippage_type='zero',
+                 processes=None, chunksize=1, periods=252,
+                 log_level=logging.WARNING):
+        """
+        参数与Backtest相同，另外：
+        processes: 进程数，默认为CPU核数，为1时在当前进程中串行执行（便于调试）
+        chunksize: 每次提交给worker的任务数
+        periods: 计算年化夏普率的周期数，见finance.perform.perform_metrics
+        log_level: worker中回测日志的级别，默认只输出警告
+        """
+        self.config = {'csv_dir': csv_dir,
+                       'symbol_list': symbol_list,
+                       'initial_capital': initial_capital,
+                       'heartbeat': heartbeat,
+                       'start_date': start_date,
+                       'end_date': end_date,
+                       'data_handler': data_handler,
+                       'execution_handler': execution_handler,
+                       'portfolio': portfolio,
+                       'strategy': strategy,
+                       'commission_type': commission_type,
+                       'slippage_type': slippage_type,
+                       'periods': periods}
+        self.processes = processes
+        self.chunksize = chunksize
+        self.log_level = log_level
+
+    def run(self, grid, return_curve=False, ordered=False):
+        """
+        执行参数扫描，生成器，每完成一组参数即返回其结果
+        参数：
+        grid: 参数网格字典或参数字典的list，见expand_grid
+        return_curve: 是否返回资金曲线（'equity_curve'），默认只返回摘要
+        ordered: 是否按参数顺序返回结果，默认按完成顺序
+        返回：
+        字典，包含'index', 'params', 'total', 'return', 'sharpe', 'max_dd', 'fills'
+        """
+        tasks = [(i, params, return_curve) for i, params in enumerate(expand_grid(grid))]
+
+        backend = 'serial' if self.processes == 1 else 'process'
+        level = backtest_logger.level
+        pool = WorkerPool(self.processes, backend, initializer=_init_worker,
+                          initargs=(self.config, self.log_level))
+        try:
+            for result in pool.map(_run_task, tasks, chunksize=self.chunksize, ordered=ordered):
+                yield result
+        finally:
+            pool.terminate()
+            if backend == 'serial':
+                backtest_logger.setLevel(level)
+                _worker_state.clear()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tradability A股交易限制
+回测开始时对整个数据数组一次性计算布尔掩码，执行时按(bar, symbol)下标O(1)查询：
+停牌：当天没有原始数据（对齐时向前填充的行）或成交量为零，不能买卖
+涨停：收盘价达到涨停价，不能买入
+跌停：收盘价达到跌停价，不能卖出
+T+1：当天买入的股票当天不能卖出，由执行系统按成交记录跟踪
+
+涨跌停价 = 前收盘价 * (1 ± 涨跌幅)，按最小变动价位四舍五入；
+前收盘价为前一个交易日最后一个bar的收盘价（分钟线同样按日计算），
+涨跌幅按品种类别确定，科创板、创业板按板块（代码前缀）另行规定
+
+@author: Leon Zhang
+"""
+
+import numpy as np
+import pandas as pd
+
+from ..utils.symbol import registry
+
+
+# 品种类别 -> 涨跌幅限制，未列出的品种不检查涨跌停
+PRICE_LIMITS = {'STOCK': 0.1, 'FUND': 0.1}
+# 板块（代码前缀） -> ((生效日期, 涨跌幅), ...)，优先于PRICE_LIMITS；科创板为20%，创业板2020-08-24起为20%
+BOARD_PRICE_LIMITS = {'68': ((None, 0.2),), '30': ((None, 0.1), ('2020-08-24', 0.2))}
+# 实行T+1交易的品种类别
+T_PLUS_ONE_CLASSES = ('STOCK', 'FUND')
+
+
+class TradabilityMask(object):
+    """
+    预先计算的可交易掩码，数组形状均为(bar数, symbol数)，顺序同DataHandler.data_array
+    """
+    def __init__(self, bars, price_limits=None, t_plus_one=True, board_limits=None):
+        """
+        参数：
+        bars: DataHandler对象，需提供data_array、field_index、datetime_index和valid_array（原始数据是否存在）
+        price_limits: 品种类别到涨跌幅的字典，默认为PRICE_LIMITS，
+                      也可以是按symbol_list排列的数组或(bar数, symbol数)的数组（此时不使用board_limits）
+        t_plus_one: 是否对股票、基金实行T+1
+        board_limits: 板块的涨跌幅规则，默认为BOARD_PRICE_LIMITS
+        """
+        self.bars = bars
+        symbol_ids = registry.symbol_ids(bars.symbol_list)
+        asset_classes = registry.array('asset_class')[symbol_ids]
+        tick_sizes = registry.array('tick_size')[symbol_ids]
+        dates = pd.DatetimeIndex(bars.datetime_index).normalize()
+
+        if price_limits is None:
+            price_limits = PRICE_LIMITS
+        if isinstance(price_limits, dict):
+            rates = np.array([price_limits.get(c, np.nan) for c in asset_classes], dtype=float)
+            rates = self._board_rates(bars.symbol_list, dates, rates,
+                                      BOARD_PRICE_LIMITS if board_limits is None else board_limits)
+        else:
+            rates = np.asarray(price_limits, dtype=float)
+
+        data = bars.data_array
+        close = data[:, :, bars.field_index['close']]
+        volume = data[:, :, bars.field_index['volume']]
+        valid = getattr(bars, 'valid_array', np.ones(close.shape, dtype=bool))
+        self.suspended = ~valid | ~(volume > 0) | np.isnan(close)
+
+        # 前一个交易日最后一个bar的收盘价：每行所在交易日第一行的前一行
+        rows = np.arange(len(dates))
+        new_day = np.ones(len(dates), dtype=bool)
+        new_day[1:] = dates[1:] != dates[:-1]
+        prev_row = np.maximum.accumulate(np.where(new_day, rows, 0)) - 1
+        prev_close = np.where((prev_row >= 0)[:, np.newaxis], close[np.maximum(prev_row, 0)], np.nan)
+        with np.errstate(invalid='ignore'):
+            up_price = np.round(prev_close * (1 + rates) / tick_sizes) * tick_sizes
+            down_price = np.round(prev_close * (1 - rates) / tick_sizes) * tick_sizes
+            self.limit_up = close >= up_price - tick_sizes / 2
+            self.limit_down = close <= down_price + tick_sizes / 2
+
+        self.can_buy = ~self.suspended & ~self.limit_up
+        self.can_sell = ~self.suspended & ~self.limit_down
+        self.t_plus_one = np.isin(asset_classes, T_PLUS_ONE_CLASSES) if t_plus_one \
+            else np.zeros(len(asset_classes), dtype=bool)
+
+    @staticmethod
+    def _board_rates(symbols, dates, rates, board_limits):
+        """
+        按板块规则得到(bar数, symbol数)的涨跌幅，没有板块规则的symbol使用rates
+        """
+        result = np.tile(rates, (len(dates), 1))
+        prefixes = sorted(board_limits, key=len, reverse=True)
+        for j, symbol in enumerate(symbols):
+            prefix = next((p for p in prefixes if symbol.startswith(p)), None)
+            if prefix is None:
+                continue
+            for start, rate in board_limits[prefix]:
+                since = np.ones(len(dates), dtype=bool) if start is None else dates >= pd.Timestamp(start)
+                result[since, j] = rate
+        return result
+
+    def tradable(self, index, direction):
+        """
+        最新bar上symbol（下标index）能否按direction（'BUY'或'SELL'）交易
+        """
+        mask = self.can_buy if direction == 'BUY' else self.can_sell
+        return mask[self.bars.cursor, index]
+
+    def tradable_array(self, index, directions):
+        """
+        tradable()的数组版本，index和directions为等长的数组
+        """
+        cursor = self.bars.cursor
+        return np.where(np.asarray(directions) == 'BUY',
+                        self.can_buy[cursor, index], self.can_sell[cursor, index])
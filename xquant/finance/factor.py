@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+"""
+横截面因子分析
+因子和收益率均为(时间 × symbol)的宽表（DataFrame），每个时刻在全部symbol上做横截面的排序，
+排序用numpy按行argsort矢量化完成，并按时间分块计算以限制内存占用
+
+示例：
+from xquant.finance import factor as fa
+
+fwd = fa.forward_returns(close, periods=(1, 5, 10))   # close为收盘价的宽表
+ic = fa.rank_ic(mom, fwd[5])                            # 每个时刻的rank IC（Spearman相关系数）
+qret = fa.quantile_returns(mom, fwd[1], quantiles=5)    # 每个时刻各分位组的平均收益
+turnover = fa.quantile_turnover(mom, quantiles=5)       # 各分位组的换手率
+decay = fa.factor_decay(mom, fwd[1], lags=range(1, 21))  # 因子在之后第n期上的平均IC
+summary = fa.factor_summary(mom, close)                  # 各持有期的汇总指标
+
+分位组从1开始编号，1为因子值最小的一组；相同的因子值取平均排名，总在同一组中
+
+@author: Leon Zhang
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def _align(factor, returns):
+    """
+    两个宽表按时间和symbol取交集，返回(因子, 收益率)
+    """
+    factor, returns = factor.align(returns, join='inner')
+    return factor, returns
+
+
+def _chunks(n, chunk_size):
+    for start in range(0, n, chunk_size):
+        yield start, min(start + chunk_size, n)
+
+
+def rank_rows(values):
+    """
+    按行排名（从1开始），相同的值取平均排名，nan的排名为nan
+    参数：
+    values: 二维数组
+    返回：
+    与values形状相同的float64数组
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rows, n = values.shape
+    order = np.argsort(values, axis=1, kind='mergesort')  # nan排在最后
+    ordered = np.take_along_axis(values, order, axis=1)
+
+    # 有序的每行中，相同的值构成一组，组内的排名取首尾位置的平均
+    pos = np.arange(n)
+    start = np.ones(values.shape, dtype=bool)
+    start[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    end = np.ones(values.shape, dtype=bool)
+    end[:, :-1] = start[:, 1:]
+    first = np.maximum.accumulate(np.where(start, pos, 0), axis=1)
+    last = np.minimum.accumulate(np.where(end, pos, n - 1)[:, ::-1], axis=1)[:, ::-1]
+    ranked = (first + last) / 2.0 + 1.0
+    ranked[np.isnan(ordered)] = np.nan
+
+    result = np.empty(values.shape)
+    np.put_along_axis(result, order, ranked, axis=1)
+    return result
+
+
+def _buckets(ranks, quantiles):
+    """
+    由排名得到分位组（1到quantiles），排名为nan时为0
+    """
+    count = np.sum(~np.isnan(ranks), axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        bucket = np.floor((ranks - 1) * quantiles / count) + 1
+    return np.where(np.isnan(bucket), 0, bucket).astype(np.int16)
+
+
+def _row_corr(a, b):
+    """
+    按行的Pearson相关系数，a和b中nan的位置相同，有效值少于2个的行为nan
+    """
+    count = np.sum(~np.isnan(a), axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        da = a - np.nansum(a, axis=1, keepdims=True) / count[:, np.newaxis]
+        db = b - np.nansum(b, axis=1, keepdims=True) / count[:, np.newaxis]
+        corr = np.nansum(da * db, axis=1) / np.sqrt(np.nansum(da * da, axis=1) * np.nansum(db * db, axis=1))
+    corr[count < 2] = np.nan
+    return corr
+
+
+def forward_returns(close, periods=(1, 5, 10)):
+    """
+    未来n期的收益率，第t行为从t到t+n的收益
+    参数：
+    close: 收盘价（最好为复权价）的宽表
+    periods: 持有期的序列
+    返回：
+    {持有期: 宽表}的OrderedDict
+    """
+    return OrderedDict((n, close.shift(-n) / close - 1) for n in periods)
+
+
+def rank_ic(factor, returns, chunk_size=500):
+    """
+    每个时刻因子与收益率的rank IC（Spearman相关系数），只使用两者均有效的symbol
+    参数：
+    factor: 因子的宽表
+    returns: 未来收益率的宽表，见forward_returns
+    chunk_size: 每次计算的时刻数
+    返回：
+    以时间为index的Series
+    """
+    factor, returns = _align(factor, returns)
+    f, r = factor.values, returns.values
+    ic = np.empty(len(factor))
+    for start, stop in _chunks(len(factor), chunk_size):
+        fc = np.asarray(f[start:stop], dtype=np.float64)
+        rc = np.asarray(r[start:stop], dtype=np.float64)
+        invalid = np.isnan(fc) | np.isnan(rc)
+        fc = np.where(invalid, np.nan, fc)
+        rc = np.where(invalid, np.nan, rc)
+        ic[start:stop] = _row_corr(rank_rows(fc), rank_rows(rc))
+    return pd.Series(ic, index=factor.index, name='rank_ic')
+
+
+def quantile_buckets(factor, quantiles=5, chunk_size=500):
+    """
+    每个时刻按因子值的横截面分位分组
+    返回：
+    与factor形状相同的int16宽表，1到quantiles为分位组，0为因子无效
+    """
+    values = factor.values
+    result = np.empty(values.shape, dtype=np.int16)
+    for start, stop in _chunks(len(factor), chunk_size):
+        result[start:stop] = _buckets(rank_rows(values[start:stop]), quantiles)
+    return pd.DataFrame(result, index=factor.index, columns=factor.columns)
+
+
+def quantile_returns(factor, returns, quantiles=5, chunk_size=500):
+    """
+    每个时刻各分位组的等权平均收益，只使用因子和收益率均有效的symbol
+    返回：
+    index为时间、列为分位组（1到quantiles）的DataFrame
+    """
+    factor, returns = _align(factor, returns)
+    f, r = factor.values, returns.values
+    result = np.full((len(factor), quantiles), np.nan)
+    for start, stop in _chunks(len(factor), chunk_size):
+        fc = np.asarray(f[start:stop], dtype=np.float64)
+        rc = np.asarray(r[start:stop], dtype=np.float64)
+        invalid = np.isnan(fc) | np.isnan(rc)
+        bucket = _buckets(rank_rows(np.where(invalid, np.nan, fc)), quantiles)
+        rc = np.where(invalid, 0.0, rc)
+        for q in range(1, quantiles + 1):
+            mask = bucket == q
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result[start:stop, q - 1] = np.sum(np.where(mask, rc, 0.0), axis=1) / mask.sum(axis=1)
+    return pd.DataFrame(result, index=factor.index, columns=pd.Index(range(1, quantiles + 1), name='quantile'))
+
+
+def quantile_turnover(factor, quantiles=5, chunk_size=500):
+    """
+    各分位组的换手率：t时刻组内的symbol中，t-1时刻不在该组的比例
+    返回：
+    index为时间、列为分位组的DataFrame，第一行为nan
+    """
+    values = factor.values
+    result = np.full((len(factor), quantiles), np.nan)
+    prev = None
+    for start, stop in _chunks(len(factor), chunk_size):
+        bucket = _buckets(rank_rows(values[start:stop]), quantiles)
+        # 与上一块的最后一行衔接
+        before = np.vstack([prev, bucket[:-1]]) if prev is not None else bucket[:-1]
+        now = bucket if prev is not None else bucket[1:]
+        offset = start if prev is not None else start + 1
+        for q in range(1, quantiles + 1):
+            mask = now == q
+            with np.errstate(invalid='ignore', divide='ignore'):
+                stay = np.sum(mask & (before == q), axis=1) / mask.sum(axis=1)
+            result[offset:stop, q - 1] = 1.0 - stay
+        prev = bucket[-1:]
+    return pd.DataFrame(result, index=factor.index, columns=pd.Index(range(1, quantiles + 1), name='quantile'))
+
+
+def rank_autocorrelation(factor, lag=1, chunk_size=500):
+    """
+    因子排名的自相关：t时刻与t-lag时刻因子值的rank IC，越低换手越高
+    """
+    return rank_ic(factor, factor.shift(lag), chunk_size).rename('rank_autocorrelation')
+
+
+def factor_decay(factor, returns, lags=range(1, 21), chunk_size=500):
+    """
+    因子的衰减：t时刻的因子与之后第lag期收益率（从t+lag-1到t+lag）的平均rank IC
+    参数：
+    returns: 一期的未来收益率，即forward_returns(close, (1,))[1]
+    lags: 滞后期的序列
+    返回：
+    以滞后期为index的Series
+    """
+    return pd.Series([rank_ic(factor, returns.shift(-(lag - 1)), chunk_size).mean() for lag in lags],
+                     index=pd.Index(list(lags), name='lag'), name='ic_mean')
+
+
+def factor_summary(factor, close, periods=(1, 5, 10), quantiles=5, chunk_size=500):
+    """
+    各持有期的汇总：IC均值、IC标准差、IR、IC的t值、IC为正的比例，
+    最高与最低分位组的平均收益之差，以及分位组的平均换手率
+    参数：
+    close: 收盘价的宽表
+    返回：
+    index为持有期的DataFrame
+    """
+    turnover = quantile_turnover(factor, quantiles, chunk_size)
+    rows = OrderedDict()
+    for n, returns in forward_returns(close, periods).items():
+        ic = rank_ic(factor, returns, chunk_size).dropna()
+        qret = quantile_returns(factor, returns, quantiles, chunk_size)
+        rows[n] = OrderedDict([
+            ('ic_mean', ic.mean()),
+            ('ic_std', ic.std()),
+            ('ir', ic.mean() / ic.std()),
+            ('t_stat', ic.mean() / ic.std() * np.sqrt(len(ic))),
+            ('ic_positive', (ic > 0).mean()),
+            ('top_bottom', (qret[quantiles] - qret[1]).mean()),
+            ('turnover', turnover.mean().mean()),
+        ])
+    return pd.DataFrame.from_dict(rows, orient='index').rename_axis('period')
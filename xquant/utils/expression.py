@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+
+"""
+惰性的指标表达式
+表达式只记录计算步骤，构成一个DAG（有向无环图），由Evaluator在一份数据上计算；
+结构相同的节点（如同一列上相同窗口的滚动均值）只计算一次，结果在整个回测中缓存复用
+
+数据可以是单个symbol的DataFrame，也可以是pytalib.Panel（每个字段为时间 × symbol的宽表）
+
+示例：
+from xquant.utils import expression as ex
+
+ev = ex.Evaluator(panel)
+ma, (b1, b2), std = ev.compute([ex.MA(20), ex.BBANDS(20), ex.STDDEV(20)])
+# 20日滚动均值、标准差各只计算一次
+
+close = ex.col('close')
+bias = ev.evaluate((close - close.rolling_mean(20)) / close.rolling_mean(20))
+
+在回测中，bars.indicator(ex.MA(20))使用DataHandler上共享的Evaluator，多个策略的指标共享中间结果
+指数加权平均拆为不带min_periods的计算和按非nan个数的遮盖两步，
+因此EMA(12)与MACD(12, 26)的快线等min_periods不同的同一指数加权平均也只计算一次
+
+@author: Leon Zhang
+"""
+
+
+class Expr(object):
+    """
+    表达式DAG中的一个节点，key由运算、参数和输入节点的key构成，结构相同的节点key相同
+    """
+    def __init__(self, op, inputs=(), params=()):
+        self.op = op
+        self.inputs = tuple(inputs)
+        self.params = tuple(params)
+        self.key = (op, self.params, tuple(e.key for e in self.inputs))
+
+    def __repr__(self):
+        args = [repr(e) for e in self.inputs] + [repr(p) for p in self.params]
+        return '%s(%s)' % (self.op, ', '.join(args))
+
+    def __add__(self, other):
+        return Expr('add', (self, _wrap(other)))
+
+    def __radd__(self, other):
+        return Expr('add', (_wrap(other), self))
+
+    def __sub__(self, other):
+        return Expr('sub', (self, _wrap(other)))
+
+    def __rsub__(self, other):
+        return Expr('sub', (_wrap(other), self))
+
+    def __mul__(self, other):
+        return Expr('mul', (self, _wrap(other)))
+
+    def __rmul__(self, other):
+        return Expr('mul', (_wrap(other), self))
+
+    def __truediv__(self, other):
+        return Expr('div', (self, _wrap(other)))
+
+    def __rtruediv__(self, other):
+        return Expr('div', (_wrap(other), self))
+
+    __div__ = __truediv__
+    __rdiv__ = __rtruediv__
+
+    def __neg__(self):
+        return Expr('neg', (self,))
+
+    def __abs__(self):
+        return Expr('abs', (self,))
+
+    def rolling_mean(self, n):
+        return Expr('rolling_mean', (self,), (n,))
+
+    def rolling_std(self, n):
+        return Expr('rolling_std', (self,), (n,))
+
+    def rolling_sum(self, n):
+        return Expr('rolling_sum', (self,), (n,))
+
+    def rolling_max(self, n):
+        return Expr('rolling_max', (self,), (n,))
+
+    def rolling_min(self, n):
+        return Expr('rolling_min', (self,), (n,))
+
+    def ewm_mean(self, span, min_periods=0):
+        """
+        同pandas的ewm(span=span, min_periods=min_periods).mean()
+        """
+        result = Expr('ewm_mean', (self,), (span,))
+        if min_periods > 1:
+            result = Expr('min_periods', (result, Expr('count', (self,))), (min_periods,))
+        return result
+
+    def diff(self, n=1):
+        """
+        与shift(n)共享节点，结果同pandas的diff(n)
+        """
+        return self - self.shift(n)
+
+    def shift(self, n=1):
+        return Expr('shift', (self,), (n,))
+
+
+def col(field):
+    """
+    数据中的一个字段，如'close'
+    """
+    return Expr('col', params=(field,))
+
+
+def const(value):
+    return Expr('const', params=(value,))
+
+
+def _wrap(value):
+    return value if isinstance(value, Expr) else const(value)
+
+
+_OPS = {
+    'col': lambda data, field: data[field],
+    'const': lambda data, value: value,
+    'add': lambda data, a, b: a + b,
+    'sub': lambda data, a, b: a - b,
+    'mul': lambda data, a, b: a * b,
+    'div': lambda data, a, b: a / b,
+    'neg': lambda data, a: -a,
+    'abs': lambda data, a: abs(a),
+    'rolling_mean': lambda data, a, n: a.rolling(window=n).mean(),
+    'rolling_std': lambda data, a, n: a.rolling(window=n).std(),
+    'rolling_sum': lambda data, a, n: a.rolling(window=n).sum(),
+    'rolling_max': lambda data, a, n: a.rolling(window=n).max(),
+    'rolling_min': lambda data, a, n: a.rolling(window=n).min(),
+    'ewm_mean': lambda data, a, span: a.ewm(span=span).mean(),
+    'count': lambda data, a: a.notnull().cumsum(),
+    'min_periods': lambda data, a, count, n: a.where(count >= n),
+    'shift': lambda data, a, n: a.shift(n),
+}
+
+
+class Evaluator(object):
+    """
+    在一份数据上计算表达式，缓存每个节点的结果，同一Evaluator上的多次计算共享中间结果
+    """
+    def __init__(self, data):
+        """
+        参数：
+        data: 单个symbol的DataFrame或pytalib.Panel
+        """
+        self.data = data
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def evaluate(self, expr):
+        """
+        计算一个表达式，返回Series或宽表
+        """
+        value = self.cache.get(expr.key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        args = [self.evaluate(e) for e in expr.inputs]
+        value = self.cache[expr.key] = _OPS[expr.op](self.data, *(args + list(expr.params)))
+        return value
+
+    def compute(self, exprs):
+        """
+        计算一组表达式，exprs可以是表达式、tuple/list或dict，返回相同结构的结果
+        """
+        if isinstance(exprs, Expr):
+            return self.evaluate(exprs)
+        if isinstance(exprs, dict):
+            return type(exprs)((k, self.compute(v)) for k, v in exprs.items())
+        return type(exprs)(self.compute(e) for e in exprs)
+
+    def clear(self):
+        self.cache.clear()
+
+
+def evaluate(exprs, data):
+    """
+    在data上计算一组表达式，共享的中间结果只计算一次
+    """
+    return Evaluator(data).compute(exprs)
+
+
+#####################################
+# 常用指标，计算方式与pytalib中的同名函数相同 #
+#####################################
+
+def MA(n, price='close'):
+    return col(price).rolling_mean(n)
+
+
+def EMA(n, price='close'):
+    return col(price).ewm_mean(n, n - 1)
+
+
+def MOM(n, price='close'):
+    return col(price).diff(n)
+
+
+def _roc(price, n):
+    return price.diff(n - 1) / price.shift(n - 1)
+
+
+def ROC(n, price='close'):
+    return _roc(col(price), n)
+
+
+def STDDEV(n):
+    return col('close').rolling_std(n)
+
+
+def BBANDS(n, price='close'):
+    """
+    返回(BollingerB, Bollinger%b)
+    """
+    price = col(price)
+    ma = price.rolling_mean(n)
+    msd = price.rolling_std(n)
+    return 4 * msd / ma, (price - ma + 2 * msd) / (4 * msd)
+
+
+def MACD(n_fast, n_slow, price='close'):
+    """
+    返回(MACD, MACDsign, MACDdiff)
+    """
+    price = col(price)
+    macd = price.ewm_mean(n_fast, n_slow - 1) - price.ewm_mean(n_slow, n_slow - 1)
+    sign = macd.ewm_mean(9, 8)
+    return macd, sign, macd - sign
+
+
+def TRIX(n):
+    """
+    第一个bar为nan（pytalib.TRIX为0）
+    """
+    ex3 = col('close').ewm_mean(n, n - 1).ewm_mean(n, n - 1).ewm_mean(n, n - 1)
+    return ex3.diff(1) / ex3.shift(1)
+
+
+def KELCH(n):
+    """
+    返回(KelChM, KelChU, KelChD)
+    """
+    high, low, close = col('high'), col('low'), col('close')
+    return ((high + low + close).rolling_mean(n) / 3,
+            (4 * high - 2 * low + close).rolling_mean(n) / 3,
+            (-2 * high + 4 * low + close).rolling_mean(n) / 3)
+
+
+def KST(r1, r2, r3, r4, n1, n2, n3, n4):
+    close = col('close')
+    return (_roc(close, r1).rolling_sum(n1) + _roc(close, r2).rolling_sum(n2) * 2 +
+            _roc(close, r3).rolling_sum(n3) * 3 + _roc(close, r4).rolling_sum(n4) * 4)
+
+
+def COPP(n):
+    close = col('close')
+    return (_roc(close, int(n * 11 / 10)) + _roc(close, int(n * 14 / 10))).ewm_mean(n, n)
+
+
+def STOK():
+    return (col('close') - col('low')) / (col('high') - col('low'))
+
+
+def STO(n):
+    return STOK().ewm_mean(n, n - 1)
+
+
+def MassI():
+    rng = col('high') - col('low')
+    ex1 = rng.ewm_mean(9, 8)
+    return (ex1 / ex1.ewm_mean(9, 8)).rolling_sum(25)
+
+
+def TSI(r, s):
+    m = col('close').diff(1)
+    return m.ewm_mean(r, r - 1).ewm_mean(s, s - 1) / abs(m).ewm_mean(r, r - 1).ewm_mean(s, s - 1)
+
+
+def _ad():
+    high, low, close = col('high'), col('low'), col('close')
+    return (2 * close - high - low) / (high - low) * col('volume')
+
+
+def ACCDIST(n):
+    return _roc(_ad(), n)
+
+
+def Chaikin():
+    ad = _ad()
+    return ad.ewm_mean(3, 2) - ad.ewm_mean(10, 9)
+
+
+def FORCE(n):
+    return col('close').diff(n) * col('volume').diff(n)
+
+
+def EOM(n):
+    high, low = col('high'), col('low')
+    return ((high.diff(1) + low.diff(1)) * (high - low) / (2 * col('volume'))).rolling_mean(n)
+
+
+def CCI(n):
+    pp = (col('high') + col('low') + col('close')) / 3
+    return pp - pp.rolling_mean(n) / pp.rolling_std(n)
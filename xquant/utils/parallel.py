@@ -2,13 +2,34 @@
 
 """
 通过multiprocessing模块将串行计算变成并行计算的框架
-使用concurrent和synchronized两个装饰器实现并行计算
+1. WorkerPool/parallel_map：显式的并行map接口，worker池可复用，支持进程/线程、分块和worker初始化
+2. concurrent和synchronized两个装饰器：通过改写AST实现并行计算，
+   不可用于类方法，每次调用都会新建进程池并pickle参数，仅适合简单脚本
 
 Credit: Alex Sherman
 Ref: https://github.com/alex-sherman/deco
 
 缺陷：代码不符合PEP8
 
+#################################
+# 示例0：WorkerPool
+#################################
+from xquant.utils.parallel import WorkerPool
+
+_data = {}
+
+def load(path):
+    _data['bars'] = read_bars(path)  # 每个worker只读取一次
+
+def work(n):
+    return compute(_data['bars'], n)
+
+if __name__ == "__main__":
+    with WorkerPool(processes=4, initializer=load, initargs=('D:/data',)) as pool:
+        for result in pool.map(work, range(100), chunksize=10, ordered=False):
+            print(result)
+        results = list(pool.map(work, range(100, 200)))  # 复用同一个worker池
+
 #################################
 # 示例1
 #################################
@@ -77,6 +98,81 @@ from multiprocessing import Pool
 from multiprocessing.pool import ThreadPool
 
 
+class WorkerPool(object):
+    """
+    持久化的worker池，多次map复用同一组worker，避免每次调用都启动进程池
+    """
+    def __init__(self, processes=None, backend='process', initializer=None, initargs=()):
+        """
+        参数：
+        processes: worker数量，默认为CPU核数
+        backend: 'process'（多进程，适合CPU密集）、'thread'（多线程，适合IO或释放GIL的numpy计算）、
+                 'serial'（当前进程中串行执行，便于调试）
+        initializer: 每个worker启动时调用一次，用于加载市场数据等较重的共享状态
+        initargs: initializer的参数tuple
+        """
+        self.processes = processes
+        self.backend = backend
+        if backend == 'process':
+            self._pool = Pool(processes, initializer, initargs)
+        elif backend == 'thread':
+            self._pool = ThreadPool(processes, initializer, initargs)
+        elif backend == 'serial':
+            self._pool = None
+            if initializer is not None:
+                initializer(*initargs)
+        else:
+            raise ValueError('Unknown backend: %s' % backend)
+
+    def map(self, func, iterable, chunksize=1, ordered=True):
+        """
+        对iterable中每个元素调用func，生成器，结果流式返回
+        参数：
+        func: 可pickle的函数（进程模式下需定义在模块顶层）
+        iterable: 任务参数的序列
+        chunksize: 每次提交给worker的任务数，任务很多且单个很快时应调大
+        ordered: True按输入顺序返回结果，False按完成顺序返回
+        """
+        if self._pool is None:
+            return (func(item) for item in iterable)
+        if ordered:
+            return self._pool.imap(func, iterable, chunksize)
+        return self._pool.imap_unordered(func, iterable, chunksize)
+
+    def close(self):
+        """
+        等待已提交的任务完成后关闭worker池
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+
+    def terminate(self):
+        """
+        立即终止worker池
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, value, traceback):
+        self.terminate()
+
+
+def parallel_map(func, iterable, processes=None, backend='process', chunksize=1,
+                 initializer=None, initargs=()):
+    """
+    一次性的并行map，返回按输入顺序排列的结果list
+    需要多次调用时请使用WorkerPool复用worker池
+    参数含义见WorkerPool
+    """
+    with WorkerPool(processes, backend, initializer, initargs) as pool:
+        return list(pool.map(func, iterable, chunksize))
+
+
 def unindent(source_lines):
     for i, line in enumerate(source_lines):
         source_lines[i] = line.lstrip()
@@ -321,4 +417,4 @@ class ConcurrentResult(object):
         return result
 
 
-__all__ = ['concurrent', 'synchronized']
\ No newline at end of file
+__all__ = ['WorkerPool', 'parallel_map', 'concurrent', 'synchronized']
\ No newline at end of file
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+全局的数值精度策略
+'double'（默认）：全部为float64
+'compact'：价格和指标以float32保存，成交量在不损失精度时保存为int32/int64，内存约为一半；
+           资金、市值、手续费等账户计算始终为float64
+
+在创建DataHandler/Backtest之前设置，已加载的数据不受影响：
+from xquant.utils.precision import set_precision
+set_precision('compact')
+
+遵循该策略的有：DataHandler对齐后的数据和data_array（整数成交量超过float32的精确范围时data_array保留float64），pytalib函数和预先计算指标的结果，
+NpySink写出的头寸和交易记录；DataHandler.get_latest_bar_values()总是返回float64，供账户计算使用
+注意：多进程（如ParameterSweep）中子进程需要各自设置
+
+@author: Leon Zhang
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class Precision(object):
+    """
+    各类数据的存储精度
+    """
+    accounting = np.dtype(np.float64)
+
+    def __init__(self, price=np.float64, indicator=np.float64, compact_integers=False):
+        """
+        参数：
+        price: 价格（open, high, low, close）的dtype
+        indicator: 指标的dtype
+        compact_integers: True则成交量、头寸等整数值在安全时使用更小的整数类型
+        """
+        self.price = np.dtype(price)
+        self.indicator = np.dtype(indicator)
+        self.compact_integers = compact_integers
+
+    def prices(self, values):
+        return np.asarray(values).astype(self.price, copy=False)
+
+    def indicators(self, values):
+        return np.asarray(values).astype(self.indicator, copy=False)
+
+    def bars(self, values, exact=()):
+        """
+        (时间, symbol, 字段)的行情数组，按价格精度保存；
+        exact中的字段（如成交量）的整数值在价格精度下不能精确表示（float32超过2 ** 24）时，整个数组保留float64
+        参数：
+        exact: 需精确表示的字段在最后一维的位置
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if self.price == np.float64:
+            return values
+        for i in exact:
+            column = values[..., i]
+            whole = column[column == np.trunc(column)]
+            if not np.array_equal(whole.astype(self.price).astype(np.float64), whole):
+                return values
+        return values.astype(self.price)
+
+    def integers(self, values):
+        """
+        成交量等整数值：全部为整数时用能容纳的最小类型（int32或int64），
+        含nan（如上市前）时在2 ** 24以内用float32，否则不变
+        """
+        values = np.asarray(values)
+        if not self.compact_integers or values.dtype.kind not in 'iuf' or values.size == 0:
+            return values
+        if values.dtype.kind == 'f':
+            nan = np.isnan(values)
+            finite = values[~nan]
+            if len(finite) == 0 or (finite != np.trunc(finite)).any():
+                return values
+            if nan.any():
+                return values.astype(np.float32) if np.abs(finite).max() < 2 ** 24 else values
+        lo, hi = values.min(), values.max()
+        int32 = np.iinfo(np.int32)
+        return values.astype(np.int32 if int32.min <= lo and hi <= int32.max else np.int64)
+
+    def frame(self, df, prices=('open', 'high', 'low', 'close'), integers=('volume',)):
+        """
+        按策略转换DataFrame中的价格列和整数列，其余列不变
+        """
+        if self is DOUBLE:
+            return df
+        df = df.copy()
+        for c in df.columns:
+            if c in prices:
+                df[c] = self.prices(df[c].values)
+            elif c in integers:
+                df[c] = self.integers(df[c].values)
+        return df
+
+    def result(self, result):
+        """
+        指标函数的结果（Series、DataFrame或其dict）转换为指标精度
+        """
+        if self.indicator == np.float64:
+            return result
+        if isinstance(result, dict):
+            return type(result)((k, self.result(v)) for k, v in result.items())
+        if isinstance(result, (pd.Series, pd.DataFrame)):
+            return result.astype(self.indicator)
+        return self.indicators(result)
+
+
+DOUBLE = Precision()
+COMPACT = Precision(np.float32, np.float32, compact_integers=True)
+
+_POLICIES = {'double': DOUBLE, 'compact': COMPACT}
+_current = DOUBLE
+
+
+def set_precision(policy):
+    """
+    设置全局精度策略
+    参数：
+    policy: 'double'、'compact'或Precision对象
+    """
+    global _current
+    if not isinstance(policy, Precision):
+        try:
+            policy = _POLICIES[policy]
+        except KeyError:
+            raise ValueError('Unknown precision: %s' % policy)
+    _current = policy
+
+
+def get_precision():
+    """
+    当前的精度策略
+    """
+    return _current
@@ -3,6 +3,13 @@
 """
 pandas实现的TA-lib（technique analysis）
 矢量化计算各种技术指标，用于选股或后续分析
+每个函数既可以传入单个symbol的DataFrame（列为open, high, low, close, volume），
+也可以传入多个symbol的Panel（每个字段为时间 × symbol的宽表），一次调用计算全部symbol：
+
+panel = Panel.from_frames({'600008': df1, '600018': df2})
+ma = MA(panel, 10)                               # 宽表，列为symbol
+macd = MACD(panel, 12, 26)                       # 多列输出为{列名: 宽表}的dict
+rsi = batch(RSI, panel, args=(14,), threads=4)   # 按symbol分块在线程池中计算
 
 # 有些指标未经检验！(Experimental)
 
@@ -10,8 +17,14 @@ pandas实现的TA-lib（technique analysis）
 Reference: pandas_talib
 """
 
+from collections import OrderedDict
+
+import numpy as np
 import pandas as pd
 
+from .parallel import WorkerPool
+from .precision import get_precision
+
 
 indicators = ["MA", "EMA", "MOM", "ROC", "ATR", "BBANDS", "PPSR", "STOK", "STO", "TRIX", "ADX",
               "MACD", "MassI", "Vortex", "KST", "RSI", "TSI", "ACCDIST", "Chaikin", "MFI", "OBV",
@@ -33,20 +46,155 @@ class Settings(object):
 SETTINGS = Settings()
 
 
+class Panel(object):
+    """
+    多个symbol的行情面板，每个字段为(时间 × symbol)的宽表DataFrame，各字段的索引和列相同
+    """
+    def __init__(self, fields):
+        """
+        参数：
+        fields: {字段名: 宽表DataFrame}的dict
+        """
+        self.fields = OrderedDict(fields)
+        first = next(iter(self.fields.values()))
+        for name, frame in self.fields.items():
+            if not (frame.index.equals(first.index) and frame.columns.equals(first.columns)):
+                raise ValueError('Field %s is not aligned with the others' % name)
+        self.index = first.index
+        self.columns = first.columns
+
+    @classmethod
+    def from_frames(cls, frames, fields=('open', 'high', 'low', 'close', 'volume')):
+        """
+        由单个symbol的DataFrame构建，时间取并集，缺失处为nan
+        参数：
+        frames: {symbol: DataFrame}的dict
+        """
+        return cls((f, pd.concat([frames[s][f] for s in frames], axis=1, keys=list(frames)))
+                   for f in fields)
+
+    @classmethod
+    def from_array(cls, values, index, symbols, fields=('open', 'high', 'low', 'close', 'volume')):
+        """
+        由(时间, symbol, 字段)的数组构建，如DataHandler的data_array
+        """
+        return cls((f, pd.DataFrame(values[:, :, i], index=index, columns=symbols))
+                   for i, f in enumerate(fields))
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    def __len__(self):
+        return len(self.index)
+
+    def take(self, columns):
+        """
+        部分symbol组成的Panel，columns为列的位置
+        """
+        return Panel((f, frame.iloc[:, columns]) for f, frame in self.fields.items())
+
+
 def out(settings, df, result):
-    if not settings.join:
+    result = get_precision().result(result)
+    if not settings.join or isinstance(df, Panel):
         return result
     else:
         df = df.join(result)
         return df
 
 
+def _wrap(df, values, name=None):
+    """
+    数组转为与df按行对齐的结果：一维为Series，二维为列与Panel相同的宽表
+    """
+    if values.ndim == 1:
+        return pd.Series(values, index=df.index, name=name)
+    return pd.DataFrame(values, index=df.index, columns=df.columns)
+
+
+def _positional(values):
+    """
+    数组转为默认索引的Series或DataFrame，用于按位置对齐的计算
+    """
+    if values.ndim == 1:
+        return pd.Series(values)
+    return pd.DataFrame(values)
+
+
+def _named(result, name):
+    """
+    单个symbol的结果命名为Series，Panel的宽表列为symbol，原样返回
+    """
+    if isinstance(result, pd.DataFrame):
+        return result
+    return pd.Series(result, name=name)
+
+
+def _combine(df, parts):
+    """
+    多列输出：单个symbol为各列组成的DataFrame，Panel为{列名: 宽表}的dict
+    参数：
+    parts: (列名, 结果)的list
+    """
+    if isinstance(df, Panel):
+        return OrderedDict(parts)
+    return pd.DataFrame([pd.Series(part, name=name) for name, part in parts]).transpose()
+
+
+def batch(func, panel, args=(), kwargs=None, threads=None):
+    """
+    对Panel中的全部symbol计算指标，可按symbol分块在线程池中并行（pandas的滚动、指数加权计算会释放GIL）
+    参数：
+    func: 本模块中的指标函数或函数名
+    panel: Panel
+    args, kwargs: 指标函数的其他参数
+    threads: 线程数，None或1时直接在整个Panel上计算
+    返回：
+    宽表，多列输出的指标为{列名: 宽表}的dict
+    """
+    if not callable(func):
+        func = globals()[func]
+    kwargs = kwargs or {}
+    n = len(panel.columns)
+    if not threads or threads <= 1 or n < 2:
+        return func(panel, *args, **kwargs)
+
+    chunks = [c for c in np.array_split(np.arange(n), threads) if len(c)]
+    with WorkerPool(len(chunks), backend='thread') as pool:
+        results = list(pool.map(lambda c: func(panel.take(c), *args, **kwargs), chunks))
+    if isinstance(results[0], dict):
+        return OrderedDict((k, pd.concat([r[k] for r in results], axis=1)) for k in results[0])
+    return pd.concat(results, axis=1)
+
+
+def _true_range(df):
+    """
+    真实波幅：max(high, 前收盘) - min(low, 前收盘)，第一个bar为0
+    """
+    high, low, close = df['high'].values, df['low'].values, df['close'].values
+    tr = np.zeros(close.shape)
+    tr[1:] = np.maximum(high[1:], close[:-1]) - np.minimum(low[1:], close[:-1])
+    return tr
+
+
+def _directional_movement(df):
+    """
+    上升、下降动向，第i个元素对应第i到第i+1个bar，比df少一行
+    """
+    high, low = df['high'].values, df['low'].values
+    up_move = high[1:] - high[:-1]
+    do_move = low[:-1] - low[1:]
+    up_d = np.where((up_move > do_move) & (up_move > 0), up_move, 0)
+    do_d = np.where((do_move > up_move) & (do_move > 0), do_move, 0)
+    return up_d, do_d
+
+
 def MA(df, n, price='close'):
     """
     Moving Average
     """
     name = 'MA_{n}'.format(n=n)
-    result = pd.Series(df[price].rolling(window=n).mean(), name=name)
+    result = _named(df[price].rolling(window=n).mean(), name)
     return out(SETTINGS, df, result)
 
 
@@ -54,7 +202,7 @@ def EMA(df, n, price='close'):
     """
     Exponential Moving Average
     """
-    result = pd.Series(df[price].ewm(span=n, min_periods=n - 1), name='EMA_' + str(n))
+    result = _named(df[price].ewm(span=n, min_periods=n - 1).mean(), 'EMA_' + str(n))
     return out(SETTINGS, df, result)
 
 
@@ -62,7 +210,7 @@ def MOM(df, n, price='close'):
     """
     Momentum
     """
-    result = pd.Series(df[price].diff(n), name='Momentum_' + str(n))
+    result = _named(df[price].diff(n), 'Momentum_' + str(n))
     return out(SETTINGS, df, result)
 
 
@@ -72,7 +220,7 @@ def ROC(df, n, price='close'):
     """
     M = df[price].diff(n - 1)
     N = df[price].shift(n - 1)
-    result = pd.Series(M / N, name='ROC_' + str(n))
+    result = _named(M / N, 'ROC_' + str(n))
     return out(SETTINGS, df, result)
 
 
@@ -80,14 +228,8 @@ def ATR(df, n):
     """
     Average True Range
     """
-    i = 0
-    TR_l = [0]
-    while i < len(df) - 1:
-        TR = max(df['high'].iloc[i + 1], df['close'].iloc[i] - min(df['low'].iloc[i + 1], df['close'].iloc[i]))
-        TR_l.append(TR)
-        i = i + 1
-    TR_s = pd.Series(TR_l)
-    result = pd.Series(TR_s.ewm(span=n, min_periods=n).mean(), name='ATR_' + str(n))
+    TR_s = _wrap(df, _true_range(df))
+    result = _named(TR_s.ewm(span=n, min_periods=n).mean(), 'ATR_' + str(n))
     return out(SETTINGS, df, result)
 
 
@@ -96,12 +238,10 @@ def BBANDS(df, n, price='close'):
     Bollinger Bands
     """
     MA = df[price].rolling(window=n).mean()
-    MSD = df[price].rolling(windows=n).std()
+    MSD = df[price].rolling(window=n).std()
     b1 = 4 * MSD / MA
-    B1 = pd.Series(b1, name='BollingerB_' + str(n))
     b2 = (df[price] - MA + 2 * MSD) / (4 * MSD)
-    B2 = pd.Series(b2, name='Bollinger%b_' + str(n))
-    result = pd.DataFrame([B1, B2]).transpose()
+    result = _combine(df, [('BollingerB_' + str(n), b1), ('Bollinger%b_' + str(n), b2)])
     return out(SETTINGS, df, result)
 
 
@@ -110,13 +250,14 @@ def PPSR(df):
     Pivot Points, Supports and Resistances
     """
     PP = (df['high'] + df['low'] + df['close']) / 3
-    R1 = pd.Series(2 * PP - df['low'])
-    S1 = pd.Series(2 * PP - df['high'])
-    R2 = pd.Series(PP + df['high'] - df['low'])
-    S2 = pd.Series(PP - df['high'] + df['low'])
-    R3 = pd.Series(df['high'] + 2 * (PP - df['low']))
-    S3 = pd.Series(df['low'] - 2 * (df['high'] - PP))
-    result = pd.DataFrame([PP, R1, S1, R2, S2, R3, S3]).transpose()
+    R1 = 2 * PP - df['low']
+    S1 = 2 * PP - df['high']
+    R2 = PP + df['high'] - df['low']
+    S2 = PP - df['high'] + df['low']
+    R3 = df['high'] + 2 * (PP - df['low'])
+    S3 = df['low'] - 2 * (df['high'] - PP)
+    result = _combine(df, [('PP', PP), ('R1', R1), ('S1', S1), ('R2', R2),
+                           ('S2', S2), ('R3', R3), ('S3', S3)])
     return out(SETTINGS, df, result)
 
 
@@ -124,7 +265,7 @@ def STOK(df):
     """
     Stochastic oscillator %K
     """
-    result = pd.Series((df['close'] - df['low']) / (df['high'] - df['low']), name='SO%k')
+    result = _named((df['close'] - df['low']) / (df['high'] - df['low']), 'SO%k')
     return out(SETTINGS, df, result)
 
 
@@ -132,8 +273,8 @@ def STO(df, n):
     """
     Stochastic oscillator %D
     """
-    SOk = pd.Series((df['close'] - df['low']) / (df['high'] - df['low']), name='SO%k')
-    result = pd.Series(SOk.ewm(span=n, min_periods=n - 1).mean(), name='SO%d_' + str(n))
+    SOk = (df['close'] - df['low']) / (df['high'] - df['low'])
+    result = _named(SOk.ewm(span=n, min_periods=n - 1).mean(), 'SO%d_' + str(n))
     return out(SETTINGS, df, result)
 
 
@@ -148,14 +289,10 @@ def TRIX(df, n):
     """
     EX1 = df['close'].ewm(span=n, min_periods=n - 1).mean()
     EX2 = EX1.ewm(span=n, min_periods=n - 1).mean()
-    EX3 = EX2.ewm(span=n, min_periods=n - 1).mean()
-    i = 0
-    ROC_l = [0]
-    while i + 1 <= len(df) - 1:  # df.index[-1]:
-        ROC = (EX3[i + 1] - EX3[i]) / EX3[i]
-        ROC_l.append(ROC)
-        i = i + 1
-    result = pd.Series(ROC_l, name='Trix_' + str(n))
+    EX3 = EX2.ewm(span=n, min_periods=n - 1).mean().values
+    ROC_l = np.zeros(EX3.shape)
+    ROC_l[1:] = (EX3[1:] - EX3[:-1]) / EX3[:-1]
+    result = _wrap(df, ROC_l, 'Trix_' + str(n))
     return out(SETTINGS, df, result)
 
 
@@ -163,37 +300,17 @@ def ADX(df, n, n_ADX):
     """
     Average Directional Movement Index
     """
-    i = 0
-    UpI = []
-    DoI = []
-    while i + 1 <= len(df) - 1:  # df.index[-1]:
-        UpMove = df['high'].iloc[i + 1] - df['high'].iloc[i]
-        DoMove = df['low'].iloc[i] - df['low'].iloc[i + 1]
-        if UpMove > DoMove and UpMove > 0:
-            UpD = UpMove
-        else:
-            UpD = 0
-        UpI.append(UpD)
-        if DoMove > UpMove and DoMove > 0:
-            DoD = DoMove
-        else:
-            DoD = 0
-        DoI.append(DoD)
-        i = i + 1
-    i = 0
-    TR_l = [0]
-    while i < len(df) - 1:  # df.index[-1]:
-        TR = max(df['high'].iloc[i + 1], df['close'].iloc[i]) - min(df['low'].iloc[i + 1], df['close'].iloc[i])
-        TR_l.append(TR)
-        i = i + 1
-    TR_s = pd.Series(TR_l)
+    up_d, do_d = _directional_movement(df)
+    TR_s = _positional(_true_range(df))
     ATR = TR_s.ewm(span=n, min_periods=n).mean()
-    UpI = pd.Series(UpI)
-    DoI = pd.Series(DoI)
+    # 第i个bar的动向为第i-1到第i个bar的变化，第一个bar为0（同真实波幅），不使用之后的bar
+    first = np.zeros((1,) + up_d.shape[1:])
+    UpI = _positional(np.concatenate([first, up_d]))
+    DoI = _positional(np.concatenate([first, do_d]))
     PosDI = UpI.ewm(span=n, min_periods=n - 1).mean() / ATR
     NegDI = DoI.ewm(span=n, min_periods=n - 1).mean() / ATR
-    result = pd.Series((abs(PosDI - NegDI) / (PosDI + NegDI)).ewm(span=n_ADX, min_periods=n_ADX - 1).mean(),
-                       name='ADX_' + str(n) + '_' + str(n_ADX))
+    result = _wrap(df, (abs(PosDI - NegDI) / (PosDI + NegDI)).ewm(span=n_ADX, min_periods=n_ADX - 1).mean().values,
+                   'ADX_' + str(n) + '_' + str(n_ADX))
     return out(SETTINGS, df, result)
 
 
@@ -201,12 +318,14 @@ def MACD(df, n_fast, n_slow, price='close'):
     """
     MACD, MACD Signal and MACD difference
     """
-    EMAfast = pd.Series(df[price].ewm(span=n_fast, min_periods=n_slow - 1).mean())
-    EMAslow = pd.Series(df[price].ewm(span=n_slow, min_periods=n_slow - 1).mean())
-    MACD = pd.Series(EMAfast - EMAslow, name='MACD_%d_%d' % (n_fast, n_slow))
-    MACDsign = pd.Series(MACD.ewm(span=9, min_periods=8).mean(), name='MACDsign_%d_%d' % (n_fast, n_slow))
-    MACDdiff = pd.Series(MACD - MACDsign, name='MACDdiff_%d_%d' % (n_fast, n_slow))
-    result = pd.DataFrame([MACD, MACDsign, MACDdiff]).transpose()
+    EMAfast = df[price].ewm(span=n_fast, min_periods=n_slow - 1).mean()
+    EMAslow = df[price].ewm(span=n_slow, min_periods=n_slow - 1).mean()
+    MACD = EMAfast - EMAslow
+    MACDsign = MACD.ewm(span=9, min_periods=8).mean()
+    MACDdiff = MACD - MACDsign
+    result = _combine(df, [('MACD_%d_%d' % (n_fast, n_slow), MACD),
+                           ('MACDsign_%d_%d' % (n_fast, n_slow), MACDsign),
+                           ('MACDdiff_%d_%d' % (n_fast, n_slow), MACDdiff)])
     return out(SETTINGS, df, result)
 
 
@@ -218,7 +337,7 @@ def MassI(df):
     EX1 = Range.ewm(span=9, min_periods=8).mean()
     EX2 = EX1.ewm(span=9, min_periods=8).mean()
     Mass = EX1 / EX2
-    result = pd.Series(Mass.rolling(window=25).sum(), name='Mass Index')
+    result = _named(Mass.rolling(window=25).sum(), 'Mass Index')
     return out(SETTINGS, df, result)
 
 
@@ -226,20 +345,12 @@ def Vortex(df, n):
     """
     Vortex Indicator
     """
-    i = 0
-    TR = [0]
-    while i < len(df) - 1:  # df.index[-1]:
-        Range = max(df['high'].iloc[i + 1], df['close'].iloc[i]) - min(df['low'].ilic[i + 1], df['close'].iloc[i])
-        TR.append(Range)
-        i = i + 1
-    i = 0
-    VM = [0]
-    while i < len(df) - 1:  # df.index[-1]:
-        Range = abs(df['high'].iloc[i + 1] - df['low'].iloc[i]) - abs(df['low'].iloc[i + 1] - df['high'].iloc[i])
-        VM.append(Range)
-        i = i + 1
-    result = pd.Series(pd.Series(VM).rolling(window=n).sum() / pd.Series(TR).rolling(window=n).sum(),
-                       name='Vortex_' + str(n))
+    high, low = df['high'].values, df['low'].values
+    TR = _wrap(df, _true_range(df))
+    VM = np.zeros(high.shape)
+    VM[1:] = abs(high[1:] - low[:-1]) - abs(low[1:] - high[:-1])
+    VM = _wrap(df, VM)
+    result = _named(VM.rolling(window=n).sum() / TR.rolling(window=n).sum(), 'Vortex_' + str(n))
     return out(SETTINGS, df, result)
 
 
@@ -259,10 +370,10 @@ def KST(df, r1, r2, r3, r4, n1, n2, n3, n4):
     M = df['close'].diff(r4 - 1)
     N = df['close'].shift(r4 - 1)
     ROC4 = M / N
-    result = pd.Series(ROC1.rolling(window=n1).sum() + ROC2.rolling(window=n2).sum() * 2 + \
-                       ROC3.rolling(window=n3).sum() * 3 + ROC4.rolling(window=n4).sum() * 4,
-                       name='KST_' + str(r1) + '_' + str(r2) + '_' + str(r3) + '_' + str(r4) \
-                            + '_' + str(n1) + '_' + str(n2) + '_' + str(n3) + '_' + str(n4))
+    result = _named(ROC1.rolling(window=n1).sum() + ROC2.rolling(window=n2).sum() * 2 + \
+                    ROC3.rolling(window=n3).sum() * 3 + ROC4.rolling(window=n4).sum() * 4,
+                    'KST_' + str(r1) + '_' + str(r2) + '_' + str(r3) + '_' + str(r4) \
+                    + '_' + str(n1) + '_' + str(n2) + '_' + str(n3) + '_' + str(n4))
     return out(SETTINGS, df, result)
 
 
@@ -270,28 +381,13 @@ def RSI(df, n):
     """
     Relative Strength Index
     """
-    i = 0
-    UpI = [0]
-    DoI = [0]
-    while i + 1 <= len(df) - 1:  # df.index[-1]
-        UpMove = df['high'].iloc[i+1] - df['high'].iloc[i]
-        DoMove = df['low'].iloc[i] - df['low'].iloc[i + 1]
-        if UpMove > DoMove and UpMove > 0:
-            UpD = UpMove
-        else:
-            UpD = 0
-        UpI.append(UpD)
-        if DoMove > UpMove and DoMove > 0:
-            DoD = DoMove
-        else:
-            DoD = 0
-        DoI.append(DoD)
-        i = i + 1
-    UpI = pd.Series(UpI)
-    DoI = pd.Series(DoI)
+    up_d, do_d = _directional_movement(df)
+    first = np.zeros((1,) + up_d.shape[1:])
+    UpI = _wrap(df, np.concatenate([first, up_d]))
+    DoI = _wrap(df, np.concatenate([first, do_d]))
     PosDI = UpI.ewm(span=n, min_periods=n - 1).mean()
     NegDI = DoI.ewm(span=n, min_periods=n - 1).mean()
-    result = pd.Series(PosDI / (PosDI + NegDI), name='RSI_' + str(n))
+    result = _named(PosDI / (PosDI + NegDI), 'RSI_' + str(n))
     return out(SETTINGS, df, result)
 
 
@@ -299,13 +395,13 @@ def TSI(df, r, s):
     """
     True Strength Index
     """
-    M = pd.Series(df['close'].diff(1))
+    M = df['close'].diff(1)
     aM = abs(M)
     EMA1 = M.ewm(span=r, min_periods=r - 1).mean()
     aEMA1 = aM.ewm(span=r, min_periods=r - 1).mean()
     EMA2 = EMA1.ewm(span=s, min_periods=s - 1).mean()
     aEMA2 = aEMA1.ewm(span=s, min_periods=s - 1).mean()
-    result = pd.Series(EMA2 / aEMA2, name='TSI_' + str(r) + '_' + str(s))
+    result = _named(EMA2 / aEMA2, 'TSI_' + str(r) + '_' + str(s))
     return out(SETTINGS, df, result)
 
 
@@ -317,7 +413,7 @@ def ACCDIST(df, n):
     M = ad.diff(n - 1)
     N = ad.shift(n - 1)
     ROC = M / N
-    result = pd.Series(ROC, name='Acc/Dist_ROC_' + str(n))
+    result = _named(ROC, 'Acc/Dist_ROC_' + str(n))
     return out(SETTINGS, df, result)
 
 
@@ -326,7 +422,7 @@ def Chaikin(df):
     Chaikin Oscillator
     """
     ad = (2 * df['close'] - df['high'] - df['low']) / (df['high'] - df['low']) * df['volume']
-    result = pd.Series(ad.ewm(span=3, min_periods=2).mean() - ad.ewm(span=10, min_periods=9).mean(), name='Chaikin')
+    result = _named(ad.ewm(span=3, min_periods=2).mean() - ad.ewm(span=10, min_periods=9).mean(), 'Chaikin')
     return out(SETTINGS, df, result)
 
 
@@ -334,19 +430,12 @@ def MFI(df, n):
     """
     Money Flow Index and Ratio
     """
-    PP = (df['high'] + df['low'] + df['close']) / 3
-    i = 0
-    PosMF = [0]
-    while i < len(df) - 1:  # df.index[-1]:
-        if PP[i + 1] > PP[i]:
-            PosMF.append(PP[i + 1] * df['volume'].iloc[i + 1])
-        else:
-            PosMF.append(0)
-        i=i + 1
-    PosMF = pd.Series(PosMF)
-    TotMF = PP * df['volume']
-    MFR = pd.Series(PosMF / TotMF)
-    result = pd.Series(MFR.rolling(window=n).mean(), name='MFI_' + str(n))
+    PP = ((df['high'] + df['low'] + df['close']) / 3).values
+    volume = df['volume'].values
+    PosMF = np.zeros(PP.shape)
+    PosMF[1:] = np.where(PP[1:] > PP[:-1], PP[1:] * volume[1:], 0)
+    MFR = _wrap(df, PosMF / (PP * volume))
+    result = _named(MFR.rolling(window=n).mean(), 'MFI_' + str(n))
     return out(SETTINGS, df, result)
 
 
@@ -354,18 +443,11 @@ def OBV(df, n):
     """
     On-balance Volume
     """
-    i = 0
-    OBV = [0]
-    while i < len(df) - 1:  # df.index[-1]:
-        if df['close'].ilco[i + 1] - df['close'].iloc[i] > 0:
-            OBV.append(df.get_value(i + 1, 'volume'))
-        if df['close'].ilco[i + 1] - df['close'].iloc[i] == 0:
-            OBV.append(0)
-        if df['close'].ilco[i + 1] - df['close'].iloc[i] < 0:
-            OBV.append(-df['volume'].iloc[i + 1])
-        i = i + 1
-    OBV = pd.Series(OBV)
-    result = pd.Series(OBV.rolling(window=n).mean(), name='OBV_' + str(n))
+    close, volume = df['close'].values, df['volume'].values
+    OBV = np.zeros(close.shape)
+    OBV[1:] = np.sign(close[1:] - close[:-1]) * volume[1:]
+    OBV = _wrap(df, OBV)
+    result = _named(OBV.rolling(window=n).mean(), 'OBV_' + str(n))
     return out(SETTINGS, df, result)
 
 
@@ -373,7 +455,7 @@ def FORCE(df, n):
     """
     Force Index
     """
-    result = pd.Series(df['close'].diff(n) * df['volume'].diff(n), name='Force_' + str(n))
+    result = _named(df['close'].diff(n) * df['volume'].diff(n), 'Force_' + str(n))
     return out(SETTINGS, df, result)
 
 
@@ -382,7 +464,7 @@ def EOM(df, n):
     Ease of Movement
     """
     EoM = (df['high'].diff(1) + df['low'].diff(1)) * (df['high'] - df['low']) / (2 * df['volume'])
-    result = pd.Series(EoM.rolling(window=n).mean(), name='EoM_' + str(n))
+    result = _named(EoM.rolling(window=n).mean(), 'EoM_' + str(n))
     return out(SETTINGS, df, result)
 
 
@@ -391,7 +473,7 @@ def CCI(df, n):
     Commodity Channel Index
     """
     PP = (df['high'] + df['low'] + df['close']) / 3
-    result = pd.Series(PP - PP.rolling(window=n).mean() / PP.rolling(window=n).std(), name='CCI_' + str(n))
+    result = _named(PP - PP.rolling(window=n).mean() / PP.rolling(window=n).std(), 'CCI_' + str(n))
     return out(SETTINGS, df, result)
 
 
@@ -405,7 +487,7 @@ def COPP(df, n):
     M = df['close'].diff(int(n * 14 / 10) - 1)
     N = df['close'].shift(int(n * 14 / 10) - 1)
     ROC2 = M / N
-    result = pd.Series((ROC1 + ROC2).ewm(span=n, min_periods=n).mean(), name='Copp_' + str(n))
+    result = _named((ROC1 + ROC2).ewm(span=n, min_periods=n).mean(), 'Copp_' + str(n))
     return out(SETTINGS, df, result)
 
 
@@ -413,12 +495,11 @@ def KELCH(df, n):
     """
     Keltner Channel
     """
-    KelChM = pd.Series((df['high'] + df['low'] + df['close']).rolling(window=n).mean() / 3, name='KelChM_' + str(n))
-    KelChU = pd.Series((4 * df['high'] - 2 * df['low'] + df['close']).rolling(window=n).mean() / 3,
-                       name='KelChU_' + str(n))
-    KelChD = pd.Series((-2 * df['high'] + 4 * df['low'] + df['close']).rolling(window=n).mean() / 3,
-                       name='KelChD_' + str(n))
-    result = pd.DataFrame([KelChM, KelChU, KelChD]).transpose()
+    KelChM = (df['high'] + df['low'] + df['close']).rolling(window=n).mean() / 3
+    KelChU = (4 * df['high'] - 2 * df['low'] + df['close']).rolling(window=n).mean() / 3
+    KelChD = (-2 * df['high'] + 4 * df['low'] + df['close']).rolling(window=n).mean() / 3
+    result = _combine(df, [('KelChM_' + str(n), KelChM), ('KelChU_' + str(n), KelChU),
+                           ('KelChD_' + str(n), KelChD)])
     return out(SETTINGS, df, result)
 
 
@@ -426,19 +507,15 @@ def ULTOSC(df):
     """
     Ultimate Oscillator
     """
-    i = 0
-    TR_l = [0]
-    BP_l = [0]
-    while i < len(df) - 1:  # df.index[-1]:
-        TR = max(df['high'].iloc[i + 1], df['close'].iloc[i]) - min(df['low'].iloc[i + 1], df['close'].iloc[i])
-        TR_l.append(TR)
-        BP = df['close'].iloc[i + 1] - min(df['low'].iloc[i + 1], df['close'].iloc[i])
-        BP_l.append(BP)
-        i = i + 1
-    result = pd.Series((4 * pd.Series(BP_l).rolling(window=7).sum() / pd.Series(TR_l).rolling(window=7).sum()) + \
-                       (2 * (pd.Series(BP_l).rolling(window=14).sum()) / pd.Series(TR_l).rolling(window=14).sum()) + \
-                       (pd.Series(BP_l).rolling(window=28).sum() / pd.Series(TR_l).rolling(window=28).sum()),
-                       name='Ultimate_Osc')
+    low, close = df['low'].values, df['close'].values
+    TR_l = _wrap(df, _true_range(df))
+    BP_l = np.zeros(close.shape)
+    BP_l[1:] = close[1:] - np.minimum(low[1:], close[:-1])
+    BP_l = _wrap(df, BP_l)
+    result = _named((4 * BP_l.rolling(window=7).sum() / TR_l.rolling(window=7).sum()) + \
+                    (2 * (BP_l.rolling(window=14).sum()) / TR_l.rolling(window=14).sum()) + \
+                    (BP_l.rolling(window=28).sum() / TR_l.rolling(window=28).sum()),
+                    'Ultimate_Osc')
     return out(SETTINGS, df, result)
 
 
@@ -446,17 +523,11 @@ def DONCH(df, n):
     """
     Donchian Channel
     """
-    i = 0
-    DC_l = []
-    while i < n - 1:
-        DC_l.append(0)
-        i = i + 1
-    i = 0
-    while i + n - 1 < len(df) - 1:  # df.index[-1]:
-        DC = max(df['high'].ix[i:i + n - 1]) - min(df['low'].ix[i:i + n - 1])
-        DC_l.append(DC)
-        i = i + 1
-    DonCh = pd.Series(DC_l, name='Donchian_' + str(n))
+    # 原循环：第n-1+i个值为第i到第i+n-2个bar（共n-1个）的最高价与最低价之差，之前为0，再整体后移n-1个bar
+    R = df['high'].rolling(window=n - 1).max().values - df['low'].rolling(window=n - 1).min().values
+    DC_l = np.zeros(R.shape)
+    DC_l[n - 1:] = R[n - 2:-1]
+    DonCh = _wrap(df, DC_l, 'Donchian_' + str(n))
     result = DonCh.shift(n - 1)
     return out(SETTINGS, df, result)
 
@@ -465,5 +536,5 @@ def STDDEV(df, n):
     """
     Standard Deviation
     """
-    result = pd.Series(df['close'].rolling(window=n).std(), name='STD_' + str(n))
-    return out(SETTINGS, df, result)
\ No newline at end of file
+    result = _named(df['close'].rolling(window=n).std(), 'STD_' + str(n))
+    return out(SETTINGS, df, result)
@@ -6,16 +6,145 @@
                      金融衍生品：中国金融期货交易所
 New in V0.3.5
 
+SymbolRegistry按最长前缀匹配，对每个symbol只解析一次交易所、品种类别、最小交易单位、最小变动价位和费率类别，
+并分配连续的整数id，供以numpy数组为基础的模块使用
+
 @author: Leon Zhang
 @version: 0.3.5
 """
 
+from collections import namedtuple
+
+import numpy as np
+
+
+# 前缀规则：前缀 -> (交易所, 品种类别, 费率类别)，匹配时取最长的前缀
+SYMBOL_RULES = {
+    # 上海交易所，'68'为科创板
+    '60': ('SH.EX', 'STOCK', 'SH_STOCK'), '68': ('SH.EX', 'STOCK', 'SH_STOCK'), '90': ('SH.EX', 'STOCK', 'NONE'),
+    '50': ('SH.EX', 'FUND', 'NONE'), '51': ('SH.EX', 'FUND', 'NONE'),
+    '110': ('SH.EX', 'BOND', 'NONE'), '113': ('SH.EX', 'BOND', 'NONE'), '132': ('SH.EX', 'BOND', 'NONE'),
+    '204': ('SH.EX', 'REPO', 'NONE'),
+    # 深圳交易所
+    '00': ('SZ.EX', 'STOCK', 'SZ_STOCK'), '30': ('SZ.EX', 'STOCK', 'SZ_STOCK'), '20': ('SZ.EX', 'STOCK', 'NONE'),
+    '15': ('SZ.EX', 'FUND', 'NONE'), '16': ('SZ.EX', 'FUND', 'NONE'), '18': ('SZ.EX', 'FUND', 'NONE'),
+    '13': ('SZ.EX', 'BOND', 'NONE'), '115': ('SZ.EX', 'BOND', 'NONE'), '1318': ('SZ.EX', 'REPO', 'NONE'),
+    '39': ('SZ.EX', 'INDEX', 'NONE'),
+    # 其余以6、0、3开头的代码按股票处理（同旧版的费率和整手规则）
+    '6': ('SH.EX', 'STOCK', 'SH_STOCK'), '0': ('SZ.EX', 'STOCK', 'SZ_STOCK'), '3': ('SZ.EX', 'STOCK', 'SZ_STOCK'),
+    # 中金所
+    'IF': ('ZJ.EX', 'INDEX_FUTURE', 'INDEX_FUTURE'), 'IC': ('ZJ.EX', 'INDEX_FUTURE', 'INDEX_FUTURE'),
+    'IH': ('ZJ.EX', 'INDEX_FUTURE', 'INDEX_FUTURE'), 'TF': ('ZJ.EX', 'BOND_FUTURE', 'NONE'),
+}
+SYMBOL_RULES.update({p: ('SQ.EX', 'COMMODITY_FUTURE', 'COMMODITY_FUTURE') for p in
+                     ('AG', 'AL', 'AU', 'BU', 'CU', 'FU', 'HC', 'PB', 'RB', 'RU', 'WR', 'ZN')})
+SYMBOL_RULES.update({p: ('DS.EX', 'COMMODITY_FUTURE', 'COMMODITY_FUTURE') for p in
+                     ('A', 'B', 'BB', 'C', 'FB', 'I', 'J', 'JD', 'JM', 'L', 'M', 'P', 'PP', 'V', 'Y')})
+SYMBOL_RULES.update({p: ('ZS.EX', 'COMMODITY_FUTURE', 'COMMODITY_FUTURE') for p in
+                     ('CF', 'FG', 'JR', 'LR', 'MA', 'OI', 'PM', 'RI', 'RM', 'SF', 'SM', 'SR', 'TA', 'WH', 'ZC')})
+
+UNKNOWN_RULE = ('Unknown Exchange', 'UNKNOWN', 'NONE')
+
+# 品种类别 -> (最小交易单位, 最小变动价位)
+ASSET_CLASS_UNITS = {
+    'STOCK': (100, 0.01),
+    'FUND': (100, 0.001),
+    'BOND': (10, 0.001),
+    'REPO': (10, 0.005),
+    'INDEX': (1, 0.01),
+    'INDEX_FUTURE': (1, 0.2),
+    'BOND_FUTURE': (1, 0.005),
+    'COMMODITY_FUTURE': (1, 1.0),
+    'UNKNOWN': (1, 0.01),
+}
+
+SymbolInfo = namedtuple('SymbolInfo', ('symbol', 'symbol_id', 'exchange', 'asset_class',
+                                       'lot_size', 'tick_size', 'fee_class'))
+
+
+class SymbolRegistry(object):
+    """
+    symbol元数据的注册表
+    每个symbol第一次出现时按最长前缀匹配解析一次，此后直接查表；
+    同时分配从0开始的连续整数id，array(field)返回以id为下标的numpy数组
+    """
+    def __init__(self, rules=None, units=None):
+        """
+        参数：
+        rules: 前缀规则字典，默认为SYMBOL_RULES
+        units: 品种类别到(最小交易单位, 最小变动价位)的字典，默认为ASSET_CLASS_UNITS
+        """
+        self.rules = SYMBOL_RULES if rules is None else rules
+        self.units = ASSET_CLASS_UNITS if units is None else units
+        self.max_prefix = max(len(p) for p in self.rules)
+        self.infos = []   # symbol_id -> SymbolInfo
+        self.ids = {}     # symbol -> symbol_id
+        self._arrays = {}
+
+    def _match(self, symbol):
+        """
+        最长前缀匹配
+        """
+        for n in range(min(self.max_prefix, len(symbol)), 0, -1):
+            rule = self.rules.get(symbol[:n])
+            if rule is not None:
+                return rule
+        return UNKNOWN_RULE
+
+    def register(self, symbol, **fields):
+        """
+        注册（或覆盖）symbol的元数据，fields可指定SymbolInfo中除symbol_id外的任意字段
+        """
+        exchange, asset_class, fee_class = self._match(symbol)
+        lot_size, tick_size = self.units.get(asset_class, self.units['UNKNOWN'])
+        symbol_id = self.ids.get(symbol, len(self.infos))
+        info = SymbolInfo(symbol, symbol_id, exchange, asset_class, lot_size, tick_size, fee_class)
+        info = info._replace(**fields)
+        if symbol_id == len(self.infos):
+            self.infos.append(info)
+            self.ids[symbol] = symbol_id
+        else:
+            self.infos[symbol_id] = info
+        self._arrays = {}
+        return info
+
+    def get(self, symbol):
+        """
+        返回symbol的SymbolInfo，未注册时自动注册
+        """
+        try:
+            return self.infos[self.ids[symbol]]
+        except KeyError:
+            return self.register(symbol)
+
+    def symbol_id(self, symbol):
+        return self.get(symbol).symbol_id
+
+    def symbol_ids(self, symbols):
+        """
+        一组symbol的id数组
+        """
+        return np.array([self.get(s).symbol_id for s in symbols], dtype=np.intp)
+
+    def array(self, field):
+        """
+        以symbol_id为下标的字段数组，如array('lot_size')[ids]，注册新symbol后重新生成
+        """
+        try:
+            return self._arrays[field]
+        except KeyError:
+            values = self._arrays[field] = np.array([getattr(info, field) for info in self.infos])
+            return values
+
+
+registry = SymbolRegistry()
+
+
 def get_exchange(symbol):
     """判断ID对应的证券市场
-    匹配规则
-    ['50', '51', '60', '90', '110'] 为SH
-    ['00', '13', '18', '15', '16', '18', '20', '30', '39', '115'] 为SZ
-    ['5', '6', '9'] 开头的为SH， 其余为SZ
+    匹配规则（按最长前缀，见SYMBOL_RULES）
+    ['50', '51', '60', '68', '90', '110', '113', '132', '204'] 及其余以'6'开头的为SH
+    ['00', '13', '15', '16', '18', '20', '30', '39', '115', '1318'] 及其余以'0'、'3'开头的为SZ
 
     上期(SQ)：铜（CU）、铝（AL）、锌（ZN）、天胶（RU） 燃油（FU）、黄金（AU）、螺纹钢（RB）、线材（WR）、白银（AG）、沥青（BU）、
             燃料油（FU）、沪铅（PB）、热轧卷板（HC）
@@ -23,21 +152,6 @@ def get_exchange(symbol):
             纤板（FB）、铁矿石（I）、鸡蛋（JD）、丙烯（PP）
     郑商(ZS)：棉花（CF）、玻璃（FG）、粳稻（JR)、晚稻（LR）、甲醇（MA）、菜油（OI）、普麦（PM）、早稻（RI）、菜粕（RM）、硅铁（SF）、
             硅锰（SM）、白糖（SR）、PTA（TA）、强麦（WH）、动力煤（ZC）
-    中金(ZJ)：股指期货（IF）、国债（TF）
+    中金(ZJ)：股指期货（IF、IC、IH）、国债（TF）
     """
-    # assert type(stock_code) is str, 'symbol code need str type'
-    if symbol.startswith(('50', '51', '60', '90', '110', '113', '132', '204')):
-        return 'SH.EX'
-    elif symbol.startswith(('00', '13', '18', '15', '16', '18', '20', '30', '39', '115', '1318')):
-        return 'SZ.EX'
-
-    elif symbol.startswith(('AG', 'AL', 'AU', 'BU', 'CU', 'FU', 'HC', 'PB', 'RB', 'RU', 'WR', 'ZN')):
-        return 'SQ.EX'
-    elif symbol.startswith(('A', 'B', 'BB', 'C', 'FB', 'I', 'J', 'JD', 'JM', 'L', 'M', 'P', 'PP', 'V', 'Y')):
-        return 'DS.EX'
-    elif symbol.startswith(('CF', 'FG', 'JR', 'LR', 'MA', 'OI', 'PM', 'RI', 'RM', 'SF', 'SM', 'SR', 'TA', 'WH', 'ZC')):
-        return 'ZS.EX'
-    elif symbol.startswith(('IF', 'TF')):
-        return 'ZJ.EX'
-    else:
-        return 'Unknown Exchange'
\ No newline at end of file
+    return registry.get(symbol).exchange